@@ -0,0 +1,22 @@
+"""add history_id to gmail accounts
+
+Revision ID: 64ed9115ec57
+Revises: d3e5f6789abc
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '64ed9115ec57'
+down_revision = 'd3e5f6789abc'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Gmail History API cursor used for incremental sync
+    op.add_column('gmail_accounts', sa.Column('history_id', sa.String(), nullable=True))
+
+def downgrade():
+    op.drop_column('gmail_accounts', 'history_id')
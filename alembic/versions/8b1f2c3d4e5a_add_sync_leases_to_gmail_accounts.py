@@ -0,0 +1,34 @@
+"""add sync leases to gmail accounts
+
+Revision ID: 8b1f2c3d4e5a
+Revises: 64ed9115ec57
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8b1f2c3d4e5a'
+down_revision = '64ed9115ec57'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Per-account schedule, shared by every worker replica
+    op.add_column('gmail_accounts', sa.Column('next_sync_at', sa.DateTime(), nullable=True))
+    op.add_column('gmail_accounts', sa.Column('sync_interval_seconds', sa.Float(), nullable=True))
+    op.add_column('gmail_accounts', sa.Column('sync_failures', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index(op.f('ix_gmail_accounts_next_sync_at'), 'gmail_accounts', ['next_sync_at'], unique=False)
+
+    # Lease held by the worker currently syncing the account
+    op.add_column('gmail_accounts', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('gmail_accounts', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    op.drop_column('gmail_accounts', 'lease_expires_at')
+    op.drop_column('gmail_accounts', 'lease_owner')
+    op.drop_index(op.f('ix_gmail_accounts_next_sync_at'), table_name='gmail_accounts')
+    op.drop_column('gmail_accounts', 'sync_failures')
+    op.drop_column('gmail_accounts', 'sync_interval_seconds')
+    op.drop_column('gmail_accounts', 'next_sync_at')
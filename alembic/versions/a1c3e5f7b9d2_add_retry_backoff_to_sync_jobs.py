@@ -0,0 +1,24 @@
+"""add retry backoff to sync jobs
+
+Revision ID: a1c3e5f7b9d2
+Revises: f8b0d2e4a6c7
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b9d2'
+down_revision = 'f8b0d2e4a6c7'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Deferred jobs wait for run_after, with a backoff growing with retries
+    op.add_column('sync_jobs', sa.Column('retries', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('sync_jobs', sa.Column('run_after', sa.DateTime(), nullable=True))
+
+def downgrade():
+    op.drop_column('sync_jobs', 'run_after')
+    op.drop_column('sync_jobs', 'retries')
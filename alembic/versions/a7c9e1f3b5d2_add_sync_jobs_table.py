@@ -0,0 +1,47 @@
+"""add sync jobs table
+
+Revision ID: a7c9e1f3b5d2
+Revises: 8b1f2c3d4e5a
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1f3b5d2'
+down_revision = '8b1f2c3d4e5a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Sync requests queued by the API and run by the workers
+    op.create_table('sync_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False, server_default='sync'),
+    sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('gmail_account_id', sa.Integer(), nullable=True),
+    sa.Column('listed', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('fetched', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('enriched', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('synced', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('archived', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['gmail_account_id'], ['gmail_accounts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_jobs_id'), 'sync_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_sync_jobs_status'), 'sync_jobs', ['status'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_sync_jobs_status'), table_name='sync_jobs')
+    op.drop_index(op.f('ix_sync_jobs_id'), table_name='sync_jobs')
+    op.drop_table('sync_jobs')
@@ -0,0 +1,24 @@
+"""add backfill cursor to sync jobs
+
+Revision ID: b2d4f6a8c0e1
+Revises: a7c9e1f3b5d2
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c0e1'
+down_revision = 'a7c9e1f3b5d2'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Resumable date cursor of backfill jobs
+    op.add_column('sync_jobs', sa.Column('cursor', sa.DateTime(), nullable=True))
+    op.add_column('sync_jobs', sa.Column('backfill_until', sa.DateTime(), nullable=True))
+
+def downgrade():
+    op.drop_column('sync_jobs', 'backfill_until')
+    op.drop_column('sync_jobs', 'cursor')
@@ -0,0 +1,22 @@
+"""add page token to sync jobs
+
+Revision ID: b3d5f7a9c1e4
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b3d5f7a9c1e4'
+down_revision = 'a1c3e5f7b9d2'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Backfills resume a partly imported window from its search page token
+    op.add_column('sync_jobs', sa.Column('page_token', sa.String(), nullable=True))
+
+def downgrade():
+    op.drop_column('sync_jobs', 'page_token')
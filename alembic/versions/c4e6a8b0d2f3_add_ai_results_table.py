@@ -0,0 +1,39 @@
+"""add ai results table
+
+Revision ID: c4e6a8b0d2f3
+Revises: b2d4f6a8c0e1
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4e6a8b0d2f3'
+down_revision = 'b2d4f6a8c0e1'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # AI enrichment results cached by content hash and category set version
+    op.create_table('ai_results',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('category_version', sa.String(length=64), nullable=False, server_default=''),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('unsubscribe_link', sa.Text(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash', 'category_version', name='uix_ai_result_content_version')
+    )
+    op.create_index(op.f('ix_ai_results_id'), 'ai_results', ['id'], unique=False)
+    op.create_index(op.f('ix_ai_results_content_hash'), 'ai_results', ['content_hash'], unique=False)
+    op.create_index(op.f('ix_ai_results_expires_at'), 'ai_results', ['expires_at'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_ai_results_expires_at'), table_name='ai_results')
+    op.drop_index(op.f('ix_ai_results_content_hash'), table_name='ai_results')
+    op.drop_index(op.f('ix_ai_results_id'), table_name='ai_results')
+    op.drop_table('ai_results')
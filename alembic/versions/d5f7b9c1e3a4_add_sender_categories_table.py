@@ -0,0 +1,35 @@
+"""add sender categories table
+
+Revision ID: d5f7b9c1e3a4
+Revises: c4e6a8b0d2f3
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd5f7b9c1e3a4'
+down_revision = 'c4e6a8b0d2f3'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Per-user sender/domain -> category observations
+    op.create_table('sender_categories',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('sender_key', sa.String(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'sender_key', 'category_id', name='uix_sender_category')
+    )
+    op.create_index(op.f('ix_sender_categories_id'), 'sender_categories', ['id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_sender_categories_id'), table_name='sender_categories')
+    op.drop_table('sender_categories')
@@ -0,0 +1,22 @@
+"""add normalized content to emails
+
+Revision ID: e7a9c1d3f5b6
+Revises: d5f7b9c1e3a4
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e7a9c1d3f5b6'
+down_revision = 'd5f7b9c1e3a4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Email content as sent to the LLM, computed once at ingestion
+    op.add_column('emails', sa.Column('normalized_content', sa.Text(), nullable=True))
+
+def downgrade():
+    op.drop_column('emails', 'normalized_content')
@@ -0,0 +1,35 @@
+"""add message failures table
+
+Revision ID: f8b0d2e4a6c7
+Revises: e7a9c1d3f5b6
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f8b0d2e4a6c7'
+down_revision = 'e7a9c1d3f5b6'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Failed sync attempts per Gmail message, parked ones are skipped by syncs
+    op.create_table('message_failures',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('gmail_account_id', sa.Integer(), nullable=False),
+    sa.Column('gmail_id', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('parked_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['gmail_account_id'], ['gmail_accounts.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('gmail_account_id', 'gmail_id', name='uix_message_failure')
+    )
+    op.create_index(op.f('ix_message_failures_id'), 'message_failures', ['id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_message_failures_id'), table_name='message_failures')
+    op.drop_table('message_failures')
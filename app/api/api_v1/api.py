@@ -1,9 +1,10 @@
 from fastapi import APIRouter
-from app.api.api_v1.endpoints import auth, categories, emails, gmail_accounts, agent_logs
+from app.api.api_v1.endpoints import auth, categories, emails, gmail_accounts, agent_logs, sync_jobs
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(categories.router, prefix="/categories", tags=["categories"])
 api_router.include_router(emails.router, prefix="/emails", tags=["emails"])
 api_router.include_router(gmail_accounts.router, prefix="/gmail-accounts", tags=["gmail-accounts"])
-api_router.include_router(agent_logs.router, prefix="/agent-logs", tags=["agent-logs"])
\ No newline at end of file
+api_router.include_router(agent_logs.router, prefix="/agent-logs", tags=["agent-logs"])
+api_router.include_router(sync_jobs.router, prefix="/sync-jobs", tags=["sync-jobs"])
\ No newline at end of file
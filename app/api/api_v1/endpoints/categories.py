@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from app.api import deps
 from app.models import User, Category
 from app.schemas.category import CategoryCreate, CategoryUpdate, Category as CategorySchema
+from app.services import sender_memo
 
 router = APIRouter()
 
@@ -29,6 +30,8 @@ def create_category(
         user_id=current_user.id
     )
     db.add(db_category)
+    # Senders may belong to the new category now
+    sender_memo.invalidate(db, current_user.id)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -71,6 +74,8 @@ def update_category(
     
     for field, value in category_update.dict().items():
         setattr(category, field, value)
+    # The edit moves the boundaries between the user's categories
+    sender_memo.invalidate(db, current_user.id)
     
     db.commit()
     db.refresh(category)
@@ -93,6 +98,7 @@ def delete_category(
             detail="Category not found"
         )
     
+    sender_memo.invalidate(db, current_user.id, category.id)
     db.delete(category)
     db.commit()
     return None
\ No newline at end of file
@@ -5,10 +5,12 @@ from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from app.api import deps
+from app.core.config import settings
 from app.models import User, Email, Category, GmailAccount
 from app.schemas.email import Email as EmailSchema, EmailCreate, EmailUpdate
-from app.services.gmail import GmailService
+from app.services import sender_memo
 from app.services.unsubscribe import UnsubscribeService
+from app.services.sync_jobs import enqueue_sync_job
 
 router = APIRouter()
 
@@ -71,74 +73,12 @@ async def bulk_unsubscribe(
     }
 
 # Keep all existing endpoints below
-async def sync_account(db: Session, account: GmailAccount):
-    """Background task to sync a single Gmail account"""
-    try:
-        # Check if we've synced recently (rate limiting)
-        if account.last_sync_time and datetime.utcnow() - account.last_sync_time < timedelta(minutes=5):
-            return f"Skipped sync for {account.email} - too soon since last sync"
-
-        gmail_service = GmailService(account, db)
-        synced_count = 0
-        
-        # Fetch emails since last sync time or last 24 hours if no sync
-        since_time = account.last_sync_time or (datetime.utcnow() - timedelta(days=1))
-        new_emails_data = gmail_service.list_unarchived_emails(since=since_time)
-        
-        for email_data in new_emails_data:
-            # Check if email already exists
-            existing_email = db.query(Email).filter(
-                Email.gmail_id == email_data["gmail_id"],
-                Email.gmail_account_id == account.id
-            ).first()
-
-            if not existing_email:
-                # Create new email record
-                db_email = Email(
-                    gmail_id=email_data["gmail_id"],
-                    subject=email_data["subject"],
-                    sender=email_data["sender"],
-                    content=email_data["content"],
-                    received_at=email_data["received_at"],
-                    user_id=account.user_id,
-                    gmail_account_id=account.id,
-                    is_archived=True  # Mark as archived in our DB since we archive in Gmail
-                )
-                db.add(db_email)
-                synced_count += 1
-                
-                # Archive email in Gmail
-                gmail_service.archive_email(email_data["gmail_id"])
-        
-        # Update last sync time
-        account.last_sync_time = datetime.utcnow()
-        db.add(account)
-        db.commit()
-        
-        return f"Successfully synced {synced_count} new emails for {account.email}"
-    
-    except Exception as e:
-        db.rollback()
-        return f"Error syncing {account.email}: {str(e)}"
-
-async def sync_all_accounts(db: Session, user: User):
-    """Background task to sync all Gmail accounts for a user"""
-    results = []
-    accounts = db.query(GmailAccount).filter(GmailAccount.user_id == user.id).all()
-    
-    for account in accounts:
-        result = await sync_account(db, account)
-        results.append(result)
-    
-    return results
-
-@router.post("/sync")
-async def sync_emails(
-    background_tasks: BackgroundTasks,
+@router.post("/sync", status_code=status.HTTP_202_ACCEPTED)
+def sync_emails(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user)
 ):
-    """Start a background task to sync emails from all connected Gmail accounts"""
+    """Queue sync jobs for all connected Gmail accounts, poll /sync-jobs/{id} for progress"""
     # Get all Gmail accounts for the user
     accounts = db.query(GmailAccount).filter(GmailAccount.user_id == current_user.id).all()
     
@@ -148,22 +88,22 @@ async def sync_emails(
             detail="No Gmail accounts connected"
         )
     
-    # Add the sync task to background tasks
-    background_tasks.add_task(sync_all_accounts, db, current_user)
+    # Workers run the syncs, so the response does not depend on mailbox size
+    jobs = [enqueue_sync_job(db, account) for account in accounts]
     
     return {
         "message": f"Started syncing emails for {len(accounts)} account(s)",
-        "accounts": [account.email for account in accounts]
+        "accounts": [account.email for account in accounts],
+        "job_ids": [job.id for job in jobs]
     }
 
-@router.post("/{account_id}/sync")
-async def sync_specific_account(
+@router.post("/{account_id}/sync", status_code=status.HTTP_202_ACCEPTED)
+def sync_specific_account(
     account_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user)
 ):
-    """Start a background task to sync emails from a specific Gmail account"""
+    """Queue a sync job for a specific Gmail account, poll /sync-jobs/{id} for progress"""
     account = db.query(GmailAccount).filter(
         GmailAccount.id == account_id,
         GmailAccount.user_id == current_user.id
@@ -183,11 +123,11 @@ async def sync_specific_account(
             headers={"Retry-After": "300"}
         )
     
-    # Add the sync task to background tasks
-    background_tasks.add_task(sync_account, db, account)
+    job = enqueue_sync_job(db, account)
     
     return {
-        "message": f"Started syncing emails for {account.email}"
+        "message": f"Started syncing emails for {account.email}",
+        "job_id": job.id
     }
 
 @router.get("/", response_model=List[EmailSchema])
@@ -279,7 +219,24 @@ def update_email(
         )
     
     # Update only provided fields
-    for field, value in email_update.dict(exclude_unset=True).items():
+    updates = email_update.dict(exclude_unset=True)
+    category_id = updates.get("category_id")
+    if category_id is not None and category_id != email.category_id:
+        category = db.query(Category).filter(
+            Category.id == category_id,
+            Category.user_id == current_user.id
+        ).first()
+        if not category:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Category not found"
+            )
+        # A manual correction teaches the sender memo more than one LLM answer
+        sender_memo.record_category(
+            db, current_user.id, email.sender, category_id, weight=settings.SENDER_MEMO_CORRECTION_WEIGHT
+        )
+
+    for field, value in updates.items():
         setattr(email, field, value)
     
     db.commit()
@@ -1,13 +1,15 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.api import deps
 from app.models import User, GmailAccount
 from app.schemas.gmail_account import GmailAccount as GmailAccountSchema
-from app.services.gmail import GmailService
-from app.worker import sync_all_accounts
+from app.schemas.sync_job import SyncJob as SyncJobSchema
+from app.services.credentials import credential_manager
+from app.core.config import settings
+from app.services.sync_jobs import BACKFILL, enqueue_sync_job
 
 router = APIRouter()
 
@@ -85,15 +87,16 @@ def disconnect_gmail_account(
     
     db.delete(account)
     db.commit()
+    credential_manager.invalidate(account_id)
     return None
 
-@router.post("/{account_id}/sync", status_code=status.HTTP_200_OK)
-async def sync_gmail_account(
+@router.post("/{account_id}/sync", response_model=SyncJobSchema, status_code=status.HTTP_202_ACCEPTED)
+def sync_gmail_account(
     account_id: int,
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user)
 ):
-    """Sync emails for a specific Gmail account"""
+    """Queue a sync of a specific Gmail account, poll /sync-jobs/{id} for progress"""
     account = db.query(GmailAccount).filter(
         GmailAccount.id == account_id,
         GmailAccount.user_id == current_user.id
@@ -105,56 +108,44 @@ async def sync_gmail_account(
             detail="Gmail account not found"
         )
     
-    try:
-        # Initialize Gmail service with account's credentials
-        gmail_service = GmailService(
-            access_token=account.access_token,
-            refresh_token=account.refresh_token
-        )
-        
-        # Get new emails since last sync
-        new_emails = gmail_service.list_unarchived_emails(
-            since=account.last_sync_time
-        )
-        
-        processed_count = 0
-        for email_data in new_emails:
-            # Store email in database
-            email = Email(
-                gmail_id=email_data["gmail_id"],
-                subject=email_data["subject"],
-                sender=email_data["sender"],
-                content=email_data["content"],
-                received_at=email_data["received_at"],
-                user_id=current_user.id,
-                gmail_account_id=account.id
-            )
-            db.add(email)
-            
-            # Archive the email in Gmail
-            gmail_service.archive_email(email_data["gmail_id"])
-            processed_count += 1
-        
-        # Update last sync time
-        account.last_sync_time = datetime.utcnow()
-        db.commit()
-        
-        return {"message": f"Successfully synced {processed_count} new emails"}
-        
-    except Exception as e:
+    # A worker runs the sync; an already queued or running job is returned instead of a new one
+    return enqueue_sync_job(db, account)
+
+@router.post("/{account_id}/backfill", response_model=SyncJobSchema, status_code=status.HTTP_202_ACCEPTED)
+def backfill_gmail_account(
+    account_id: int,
+    days: int = Query(settings.BACKFILL_DEFAULT_DAYS, ge=1, le=3650),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+):
+    """Queue an import of older inbox mail, newest first, going back the given number of days"""
+    account = db.query(GmailAccount).filter(
+        GmailAccount.id == account_id,
+        GmailAccount.user_id == current_user.id
+    ).first()
+    
+    if not account:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to sync emails: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Gmail account not found"
         )
+    
+    # Workers run backfills in throttled chunks between live syncs
+    now = datetime.utcnow()
+    return enqueue_sync_job(db, account, kind=BACKFILL, cursor=now, backfill_until=now - timedelta(days=days))
 
-@router.post("/sync-all", status_code=status.HTTP_200_OK)
-async def sync_all_gmail_accounts(
+@router.post("/sync-all", status_code=status.HTTP_202_ACCEPTED)
+def sync_all_gmail_accounts(
+    db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user)
 ):
-    """Trigger a sync of all Gmail accounts"""
+    """Queue a sync of all Gmail accounts"""
     try:
-        await sync_all_accounts()
-        return {"message": "Successfully triggered sync for all accounts"}
+        jobs = [enqueue_sync_job(db, account) for account in db.query(GmailAccount).all()]
+        return {
+            "message": f"Queued sync for {len(jobs)} account(s)",
+            "job_ids": [job.id for job in jobs]
+        }
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.api import deps
+from app.models import User, SyncJob
+from app.schemas.sync_job import SyncJob as SyncJobSchema
+
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=SyncJobSchema)
+def get_sync_job(
+    job_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_user)
+):
+    """Get the status, progress and timings of a sync job"""
+    job = db.query(SyncJob).filter(
+        SyncJob.id == job_id,
+        SyncJob.user_id == current_user.id
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sync job not found"
+        )
+    
+    return job
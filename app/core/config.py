@@ -18,6 +18,83 @@ class Settings(BaseSettings):
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_REQUESTS_PER_MINUTE: int = 3500  # Request budget of the OpenAI organization, split across QUOTA_SHARING_PROCESSES
+    OPENAI_TOKENS_PER_MINUTE: int = 90000  # Token budget, prompt plus completion, split the same way
+    OPENAI_INITIAL_CONCURRENCY: int = 8  # Concurrent requests allowed before the adaptive limit kicks in
+    OPENAI_MIN_CONCURRENCY: int = 1  # The adaptive limit never drops below this
+    OPENAI_MAX_CONCURRENCY: int = 32  # or grows above this
+    OPENAI_RETRY_MAX_ATTEMPTS: int = 4  # Attempts per request on rate limits and transient errors
+    OPENAI_RETRY_BASE_DELAY_SECONDS: float = 1  # First backoff step, doubled on every retry
+    OPENAI_RETRY_MAX_DELAY_SECONDS: float = 30  # Backoff cap, unless Retry-After asks for longer
+    AI_SINGLE_CALL_ANALYSIS: bool = True  # One JSON-mode request per email instead of three separate ones
+    AI_CLASSIFY_BATCH_SIZE: int = 20  # Emails packed into one batch classification request
+    AI_CLASSIFY_BATCH_MIN_EMAILS: int = 5  # Pages with fewer new emails are classified one by one
+    AI_CLASSIFY_EMAIL_TOKENS: int = 300  # Per-email content budget inside a batch classification request
+    EMAIL_PROMPT_MAX_TOKENS: int = 1500  # Normalized email content sent to the LLM is cut to this many tokens
+    EMAIL_MAX_URL_CHARS: int = 80  # Longer URLs (mostly tracking links) are left out of prompts
+    AI_CACHE_ENABLED: bool = True  # Reuse AI results for identical email content
+    AI_CACHE_TTL_DAYS: int = 30  # How long cached AI results stay in the database
+    AI_CACHE_MEMORY_ENTRIES: int = 10000  # Email bodies kept in the in-process cache tier
+    AI_CACHE_EVICT_INTERVAL_SECONDS: int = 3600  # How often workers delete expired cached results
+    SENDER_MEMO_ENABLED: bool = True  # Classify mail from consistent senders without the LLM
+    SENDER_MEMO_MIN_COUNT: int = 3  # Observations of a sender's category before it is trusted
+    SENDER_MEMO_MIN_SHARE: float = 0.9  # Share of a sender's observations its top category needs
+    SENDER_MEMO_MIN_CONFIDENCE: float = 0.8  # LLM confidence needed for a result to be remembered
+    SENDER_MEMO_CORRECTION_WEIGHT: int = 3  # Observations a manual category correction counts as
+    LOCAL_CLASSIFIER_ENABLED: bool = True  # Classify with an in-process model before asking the LLM
+    LOCAL_CLASSIFIER_FEATURES: int = 4096  # Hashed bag-of-words dimensions
+    LOCAL_CLASSIFIER_MIN_MARGIN: float = 0.1  # Lead over the runner-up category needed to skip the LLM
+    LOCAL_CLASSIFIER_MIN_EXAMPLES: int = 5  # Labelled emails a category needs before it is predicted
+    LOCAL_CLASSIFIER_TRAINING_EMAILS: int = 2000  # Most recent categorized emails a model is built from
+    LOCAL_CLASSIFIER_MAX_USERS: int = 500  # Per-user models kept in memory
+    LOCAL_CLASSIFIER_RETRAIN_SECONDS: int = 3600  # Rebuild models this often to pick up corrections
+
+    # Gmail credentials
+    GMAIL_TOKEN_REFRESH_MARGIN_SECONDS: float = 600  # Refresh access tokens this long before they expire
+    GMAIL_TOKEN_REFRESH_INTERVAL_SECONDS: float = 60  # How often the worker checks for expiring tokens
+
+    # Gmail quota (Gmail allows 250 units/s per user and 1,200,000 units/min per project)
+    GMAIL_USER_QUOTA_UNITS_PER_SECOND: float = 225  # Per-account rate, kept just under the per-user limit
+    GMAIL_PROJECT_QUOTA_UNITS_PER_SECOND: float = 18000  # Project-wide rate, each process gets 1/QUOTA_SHARING_PROCESSES of it
+    QUOTA_SHARING_PROCESSES: int = 1  # Worker replicas plus API processes calling Gmail and OpenAI with the same project
+    GMAIL_IO_THREADS: int = 16  # Threads running blocking Gmail calls, shared by every sync in a process
+    GMAIL_RETRY_MAX_ATTEMPTS: int = 5  # Attempts per Gmail call on rate limits, 5xx and network errors
+    GMAIL_RETRY_BASE_DELAY_SECONDS: float = 1  # First backoff, doubled on every further retry
+    GMAIL_RETRY_MAX_DELAY_SECONDS: float = 60  # Cap on the backoff (a longer Retry-After is still honored)
+
+    # Sync worker
+    SYNC_MAX_CONCURRENT_ACCOUNTS: int = 10  # Accounts synced at the same time
+    SYNC_INITIAL_INTERVAL_SECONDS: float = 60  # Poll interval of newly seen accounts
+    SYNC_MIN_INTERVAL_SECONDS: float = 30  # Busiest accounts are polled this often
+    SYNC_MAX_INTERVAL_SECONDS: float = 900  # Idle accounts back off to this interval
+    SYNC_ERROR_BACKOFF_MAX_SECONDS: float = 3600  # Longest wait after repeated sync failures
+    SYNC_POLL_SECONDS: float = 5  # How often a worker looks for due accounts to claim
+    SYNC_LEASE_SECONDS: float = 300  # Lease length; a crashed worker's accounts are picked up after this
+    SYNC_LEASE_RENEW_SECONDS: float = 60  # How often a worker renews the leases of running syncs
+    SYNC_JOB_PROGRESS_SECONDS: float = 5  # How often running sync jobs save their progress
+    SYNC_JOB_RETRY_BASE_SECONDS: float = 60  # First delay of a job that could not make progress, doubled per retry
+    SYNC_JOB_RETRY_MAX_SECONDS: float = 3600  # Cap on that delay
+    SYNC_JOB_MAX_RETRIES: int = 10  # Retries in a row without progress before the job fails
+    GMAIL_HISTORY_SYNC: bool = True  # Use the History API instead of inbox searches when possible
+    GMAIL_LIST_PAGE_SIZE: int = 100  # Message IDs per messages.list page (Gmail allows up to 500)
+    GMAIL_SYNC_MAX_MESSAGES: int = 500  # Messages listed per account sync, the rest waits for the next run
+    SYNC_KNOWN_ID_CACHE_SIZE: int = 5000  # Stored Gmail IDs remembered per account, 0 disables the cache
+    SYNC_PIPELINE_QUEUE_SIZE: int = 2  # Pages buffered between pipeline stages
+    SYNC_ENRICH_CONCURRENCY: int = 5  # Emails enriched at the same time per account
+    SYNC_GLOBAL_ENRICH_CONCURRENCY: int = 20  # Emails enriched at the same time across all accounts
+    SYNC_MESSAGE_MAX_ATTEMPTS: int = 3  # Failed syncs of a message before it is parked and skipped
+
+    # Historical backfill, throttled separately so live syncs keep their share
+    BACKFILL_DEFAULT_DAYS: int = 180  # How far back a backfill goes unless the request says otherwise
+    BACKFILL_WINDOW_DAYS: int = 7  # Date range searched at a time, newest first
+    BACKFILL_MESSAGES_PER_RUN: int = 500  # Messages per run before the job yields to live syncs and requeues
+    BACKFILL_MAX_RUN_SECONDS: float = 60  # Runs stop listing after this; pages already listed still finish
+    BACKFILL_LIST_PAGE_SIZE: int = 10  # Small pages, so little is left in flight when a run stops
+    BACKFILL_MAX_CONCURRENT_JOBS: int = 2  # Backfill jobs a worker runs at once
+    BACKFILL_GMAIL_USER_QUOTA_UNITS_PER_SECOND: float = 50  # Per-account Gmail budget of a backfill
+    BACKFILL_GMAIL_PROJECT_QUOTA_UNITS_PER_SECOND: float = 2000  # Gmail budget of all backfills in a worker
+    BACKFILL_ENRICH_CONCURRENCY: int = 2  # Emails enriched at the same time per backfill
+    BACKFILL_AI_EMAILS_PER_MINUTE: float = 60  # AI enrichments per minute across all backfills in a worker
 
     class Config:
         env_file = ".env"
@@ -3,5 +3,9 @@ from .user import User
 from .category import Category
 from .email import Email
 from .gmail_account import GmailAccount
+from .sync_job import SyncJob
+from .ai_result import AIResult
+from .sender_category import SenderCategory
+from .message_failure import MessageFailure
 
 # This will make the models available when importing from app.models
\ No newline at end of file
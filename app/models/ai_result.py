@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, UniqueConstraint
+from datetime import datetime
+
+from app.core.database import Base
+
+class AIResult(Base):
+    """
+    Cached AI enrichment of one email body. Summaries and unsubscribe links
+    depend only on the content and are shared across users; category_id is only
+    valid for the category set identified by category_version ("" when the
+    content was not classified)
+    """
+    __tablename__ = "ai_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False, index=True)
+    category_version = Column(String(64), nullable=False, default="")
+    summary = Column(Text, nullable=False)
+    unsubscribe_link = Column(Text, nullable=True)
+    # No foreign key: a deleted category changes the version, so its rows just stop matching
+    category_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('content_hash', 'category_version', name='uix_ai_result_content_version'),
+    )
@@ -12,6 +12,7 @@ class Email(Base):
     subject = Column(String)
     sender = Column(String)
     content = Column(Text)
+    normalized_content = Column(Text, nullable=True)  # Content as sent to the LLM, see services/normalize.py
     summary = Column(Text, nullable=True)
     unsubscribe_link = Column(Text, nullable=True)  # Added this field
     unsubscribe_status = Column(String, nullable=True)  # pending, success, failed
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -14,6 +14,12 @@ class GmailAccount(Base):
     refresh_token = Column(Text, nullable=True)
     token_expiry = Column(DateTime, nullable=True)
     last_sync_time = Column(DateTime, nullable=True)
+    history_id = Column(String, nullable=True)  # Gmail History API cursor for incremental sync
+    next_sync_at = Column(DateTime, nullable=True, index=True)  # When a worker should sync next, null means now
+    sync_interval_seconds = Column(Float, nullable=True)  # Adaptive poll interval
+    sync_failures = Column(Integer, default=0, nullable=False)  # Consecutive failed syncs
+    lease_owner = Column(String, nullable=True)  # "hostname:pid" of the worker syncing the account
+    lease_expires_at = Column(DateTime, nullable=True)  # Other workers may take over after this
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -21,6 +27,8 @@ class GmailAccount(Base):
     # Relationships
     user = relationship("User", back_populates="gmail_accounts")
     emails = relationship("Email", back_populates="gmail_account", cascade="all, delete-orphan")
+    sync_jobs = relationship("SyncJob", back_populates="gmail_account", cascade="all, delete-orphan")
+    message_failures = relationship("MessageFailure", back_populates="gmail_account", cascade="all, delete-orphan")
 
     # Ensure only one primary account per user
     __table_args__ = (
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+class MessageFailure(Base):
+    """
+    A Gmail message that failed to sync, with how often it did. Once it has
+    failed too many times it is parked: syncs skip it and stop holding their
+    cursor back for it
+    """
+    __tablename__ = "message_failures"
+
+    id = Column(Integer, primary_key=True, index=True)
+    gmail_account_id = Column(Integer, ForeignKey("gmail_accounts.id"), nullable=False)
+    gmail_id = Column(String, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(String, nullable=True)  # Error of the latest attempt
+    parked_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    gmail_account = relationship("GmailAccount", back_populates="message_failures")
+
+    __table_args__ = (
+        UniqueConstraint('gmail_account_id', 'gmail_id', name='uix_message_failure'),
+    )
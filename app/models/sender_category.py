@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from datetime import datetime
+
+from app.core.database import Base
+
+class SenderCategory(Base):
+    """
+    How often mail from a sender (or a whole domain) landed in a category,
+    per user. Used to classify mail from consistent senders without the LLM
+    """
+    __tablename__ = "sender_categories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sender_key = Column(String, nullable=False)  # "name@example.com" or "@example.com"
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'sender_key', 'category_id', name='uix_sender_category'),
+    )
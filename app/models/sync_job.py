@@ -0,0 +1,55 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, default="sync", nullable=False)  # sync, backfill
+    status = Column(String, default="queued", nullable=False, index=True)  # queued, running, succeeded, failed
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)  # "hostname:pid" of the worker running the job
+    user_id = Column(Integer, ForeignKey("users.id"))
+    gmail_account_id = Column(Integer, ForeignKey("gmail_accounts.id"))
+
+    # Backfill range: the job walks back from cursor to backfill_until, one window at a time
+    cursor = Column(DateTime, nullable=True)  # Mail older than this is still to be imported
+    backfill_until = Column(DateTime, nullable=True)
+    page_token = Column(String, nullable=True)  # Where the search of the cursor's window left off
+
+    # Progress, copied from the sync pipeline while the job runs
+    listed = Column(Integer, default=0, nullable=False)
+    fetched = Column(Integer, default=0, nullable=False)
+    enriched = Column(Integer, default=0, nullable=False)
+    synced = Column(Integer, default=0, nullable=False)
+    archived = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+
+    # Jobs that could not make progress are retried with a growing backoff
+    retries = Column(Integer, default=0, nullable=False)  # Consecutive deferrals, reset by any progress
+    run_after = Column(DateTime, nullable=True)  # Not claimed before this
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Doubles as the heartbeat
+
+    # Relationships
+    gmail_account = relationship("GmailAccount", back_populates="sync_jobs")
+
+    @property
+    def queued_seconds(self):
+        """Time spent waiting for a worker"""
+        if self.created_at is None or self.started_at is None:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+    @property
+    def run_seconds(self):
+        """Time spent syncing so far, or in total once finished"""
+        if self.started_at is None:
+            return None
+        return ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
@@ -1,5 +1,6 @@
 from .user import User, UserCreate
 from .category import Category, CategoryCreate, CategoryUpdate
 from .email import Email, EmailCreate, EmailUpdate
+from .sync_job import SyncJob
 
 # This will make the schemas available when importing from app.schemas
\ No newline at end of file
@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class SyncJob(BaseModel):
+    id: int
+    kind: str
+    status: str
+    error: Optional[str] = None
+    gmail_account_id: int
+    listed: int
+    fetched: int
+    enriched: int
+    synced: int
+    archived: int
+    failed: int
+    cursor: Optional[datetime] = None
+    backfill_until: Optional[datetime] = None
+    retries: int = 0
+    run_after: Optional[datetime] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queued_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
-from typing import List, Optional
-from openai import AsyncOpenAI
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
 from datetime import datetime
 import logging
 import re
@@ -7,13 +7,53 @@ from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.models import Category, Email
+from app.services import sender_memo
+from app.services.ai_cache import AIResultCache, ai_result_cache, category_set_version, content_hash
+from app.services.llm import LLMGateway, LLMUnavailable, get_llm_gateway
+from app.services.local_classifier import LocalClassifier, local_classifier
+from app.services.normalize import normalize_email_content, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
+# Stored as the summary when OpenAI rejected the request for good (transient failures raise instead)
+SUMMARY_ERROR = "Error generating summary"
+
+class EmailAnalysis(BaseModel):
+    """Structured result of analyze_email, as returned by the model"""
+    summary: str
+    category_id: Optional[int] = None
+    confidence: float = Field(default=0, ge=0, le=1)
+    unsubscribe_link: Optional[str] = None
+
+class BatchClassificationItem(BaseModel):
+    index: int
+    category_id: Optional[int] = None
+
+class BatchClassification(BaseModel):
+    """Structured result of one classify_emails request"""
+    results: List[BatchClassificationItem]
+
+def prompt_content(email: Email) -> str:
+    """The email's content as sent to the LLM, normalized once and stored on the email"""
+    if email.normalized_content is None:
+        email.normalized_content = normalize_email_content(email.content)
+    return email.normalized_content
+
 class AIService:
-    def __init__(self):
-        """Initialize OpenAI client with API key"""
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(
+        self,
+        cache: Optional[AIResultCache] = None,
+        classifier: Optional[LocalClassifier] = None,
+        llm: Optional[LLMGateway] = None
+    ):
+        """
+        Use the shared LLM gateway, the result cache and the local classifier unless disabled
+        OpenAI calls raise LLMUnavailable when rate limits or outages outlast their
+        retries, so callers can retry the email later instead of storing it half done
+        """
+        self.llm = llm or get_llm_gateway()
+        self.cache = cache or (ai_result_cache if settings.AI_CACHE_ENABLED else None)
+        self.local_classifier = classifier or (local_classifier if settings.LOCAL_CLASSIFIER_ENABLED else None)
 
     async def classify_email(self, email_content: str, categories: List[Category]) -> Optional[int]:
         """
@@ -44,7 +84,8 @@ IMPORTANT: Only respond with the numeric ID (e.g., "3") or "None". Do not includ
 
         try:
             logger.debug("Sending classification request to OpenAI")
-            response = await self.client.chat.completions.create(
+            response = await self.llm.create(
+                "classify_email",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a precise email classifier that only responds with numeric IDs or None."},
@@ -82,10 +123,95 @@ IMPORTANT: Only respond with the numeric ID (e.g., "3") or "None". Do not includ
 
             return None
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error in classify_email: {str(e)}")
             return None
 
+    async def classify_emails(self, emails: List[Email], categories: List[Category]) -> List[Optional[int]]:
+        """
+        Classify several emails, packing up to AI_CLASSIFY_BATCH_SIZE of them into
+        each request under one shared category list
+        Returns a category ID or None per email, in the order given. Emails the
+        batch response has no valid answer for are classified one by one
+        """
+        if not categories:
+            logger.info("No categories available for classification")
+            return [None] * len(emails)
+
+        results: List[Optional[int]] = [None] * len(emails)
+        retry: List[int] = []
+        batch_size = settings.AI_CLASSIFY_BATCH_SIZE
+        for start in range(0, len(emails), batch_size):
+            chunk = emails[start:start + batch_size]
+            answers = await self._classify_batch(chunk, categories)
+            for offset in range(len(chunk)):
+                if offset in answers:
+                    results[start + offset] = answers[offset]
+                else:
+                    retry.append(start + offset)
+
+        if retry:
+            logger.info(f"Classifying {len(retry)} emails individually after batch classification")
+        for index in retry:
+            results[index] = await self.classify_email(prompt_content(emails[index]), categories)
+        return results
+
+    async def _classify_batch(self, emails: List[Email], categories: List[Category]) -> Dict[int, Optional[int]]:
+        """
+        Run one batch classification request
+        Returns the valid answers by position in emails; missing positions failed
+        """
+        categories_context = "\n".join([
+            f"Category {cat.id}: {cat.name} - {cat.description}"
+            for cat in categories
+        ])
+        emails_context = "\n\n".join([
+            f"Email {index}:\nSubject: {email.subject}\n{truncate_to_tokens(prompt_content(email), settings.AI_CLASSIFY_EMAIL_TOKENS)}"
+            for index, email in enumerate(emails)
+        ])
+
+        prompt = f"""You are an email classifier. Classify each of the following emails into one of these categories:
+
+{categories_context}
+
+{emails_context}
+
+Respond with a JSON object of the form {{"results": [{{"index": 0, "category_id": 3}}, ...]}} with one entry per email.
+Use null as the category_id of an email none of the categories fit well."""
+
+        try:
+            logger.debug(f"Sending batch classification request for {len(emails)} emails to OpenAI")
+            response = await self.llm.create(
+                "classify_emails",
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a precise email classifier that only responds with JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0,
+                max_tokens=20 * len(emails) + 20  # About one short entry per email
+            )
+            batch = BatchClassification.model_validate_json(response.choices[0].message.content)
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error in classify_emails: {str(e)}")
+            return {}
+
+        category_ids = {cat.id for cat in categories}
+        answers: Dict[int, Optional[int]] = {}
+        for item in batch.results:
+            if not 0 <= item.index < len(emails):
+                logger.warning(f"AI returned an out of range email index: {item.index}")
+            elif item.category_id is not None and item.category_id not in category_ids:
+                logger.warning(f"AI returned invalid category ID: {item.category_id}")
+            else:
+                answers[item.index] = item.category_id
+        return answers
+
     async def summarize_email(self, email_content: str, subject: str) -> str:
         """
         Generate a concise summary of an email
@@ -103,7 +229,8 @@ Provide only the summary, no additional text."""
 
         try:
             logger.debug("Sending summarization request to OpenAI")
-            response = await self.client.chat.completions.create(
+            response = await self.llm.create(
+                "summarize_email",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are a precise email summarizer that creates concise, informative summaries."},
@@ -117,9 +244,11 @@ Provide only the summary, no additional text."""
             logger.info(f"Generated summary ({len(summary)} chars): {summary[:100]}...")
             return summary
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error in summarize_email: {str(e)}")
-            return "Error generating summary"
+            return SUMMARY_ERROR
 
     async def find_unsubscribe_link(self, email_content: str) -> Optional[str]:
         """
@@ -135,7 +264,8 @@ Email content:
 Return only the unsubscribe URL or instructions, or "None". No other text."""
 
         try:
-            response = await self.client.chat.completions.create(
+            response = await self.llm.create(
+                "find_unsubscribe_link",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "You are an unsubscribe link finder that only returns URLs or None."},
@@ -153,46 +283,213 @@ Return only the unsubscribe URL or instructions, or "None". No other text."""
                 logger.info(f"Found unsubscribe link: {result}")
                 return result
 
+        except LLMUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Error in find_unsubscribe_link: {str(e)}")
             return None
 
-    async def process_new_email(self, db: Session, email: Email) -> None:
+    async def analyze_email(self, email_content: str, subject: str, categories: Optional[List[Category]]) -> Optional[EmailAnalysis]:
         """
-        Process a new email:
-        1. Generate a summary
-        2. Classify it into a category
-        Updates the email record in the database
+        Summarize, classify and find the unsubscribe link of an email in one JSON-mode request
+        Pass categories=None to skip classification. Returns None when the request
+        fails or the response does not match EmailAnalysis
         """
+        if categories is None:
+            classification = ""
+        else:
+            categories_context = "\n".join([
+                f"Category {cat.id}: {cat.name} - {cat.description}"
+                for cat in categories
+            ]) or "(no categories)"
+            classification = f"""- "category_id": the numeric ID of the most appropriate category below, or null if none fits well
+- "confidence": how confident you are in the category, from 0 to 1
+"""
+
+        prompt = f"""Analyze this email and respond with a JSON object with these keys:
+- "summary": a concise 2-3 sentence summary focusing on the main points and any action items
+{classification}- "unsubscribe_link": the complete unsubscribe URL or instructions, or null if there are none
+"""
+        if categories is not None:
+            prompt += f"""
+Categories:
+{categories_context}
+"""
+        prompt += f"""
+Subject: {subject}
+
+Content:
+{email_content}"""
+
         try:
-            logger.info(f"Processing new email: {email.subject} (ID: {email.id})")
-            
+            logger.debug("Sending analysis request to OpenAI")
+            response = await self.llm.create(
+                "analyze_email",
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a precise email assistant that only responds with JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0,
+                max_tokens=300
+            )
+            result = response.choices[0].message.content
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"Error in analyze_email: {str(e)}")
+            return None
+
+        try:
+            analysis = EmailAnalysis.model_validate_json(result)
+        except ValidationError as e:
+            logger.warning(f"AI returned an invalid analysis: {str(e)}")
+            return None
+
+        if categories is None:
+            analysis.category_id = None
+        elif analysis.category_id is not None and not any(cat.id == analysis.category_id for cat in categories):
+            logger.warning(f"AI returned invalid category ID: {analysis.category_id}")
+            analysis.category_id = None
+        if analysis.unsubscribe_link is not None and analysis.unsubscribe_link.strip().lower() in ("", "none"):
+            analysis.unsubscribe_link = None
+        return analysis
+
+    async def enrich_email(
+        self,
+        db: Session,
+        email: Email,
+        categories: Optional[List[Category]] = None,
+        classify: bool = True
+    ) -> None:
+        """
+        Fill in an email's summary, category and unsubscribe link without committing
+        Pass the user's categories to avoid loading them again for every email, and
+        classify=False when the email was already classified, e.g. by classify_emails
+        """
+        if categories is None:
             # Get all categories for the user
             categories = db.query(Category).filter(Category.user_id == email.user_id).all()
             logger.info(f"Found {len(categories)} categories for user {email.user_id}")
 
-            # Generate summary
-            logger.info("Generating email summary...")
-            summary = await self.summarize_email(email.content, email.subject)
-            email.summary = summary
-            logger.info("Summary generated successfully")
-
-            # Classify email
-            logger.info("Classifying email...")
-            category_id = await self.classify_email(email.content, categories)
-            if category_id:
-                category = next(cat for cat in categories if cat.id == category_id)
-                email.category_id = category_id
-                logger.info(f"Email classified into category: {category.name}")
+        if classify and settings.SENDER_MEMO_ENABLED:
+            category_id = sender_memo.lookup_category(db, email.user_id, email.sender, categories)
+            if category_id is not None:
+                self._apply_category(email, category_id, categories)
+                classify = False
+
+        if classify and self.local_classifier is not None:
+            category_id = self.local_classifier.classify(db, email, categories)
+            if category_id is not None:
+                self._apply_category(email, category_id, categories)
+                classify = False
+
+        key, version = None, None
+        if self.cache is not None:
+            key = content_hash(email.subject, prompt_content(email))
+            version = category_set_version(categories) if classify else None
+            cached = self.cache.get(db, key, version)
+            if cached is not None:
+                logger.info("Reusing cached AI result for identical content")
+                email.summary = cached.summary
+                if cached.unsubscribe_link:
+                    email.unsubscribe_link = cached.unsubscribe_link
+                if not classify:
+                    return
+                if cached.category_version == version:
+                    self._apply_category(email, cached.category_id, categories)
+                    return
+                # Same content, but classified for another category set (or not at all)
+                category_id = await self.classify_email(prompt_content(email), categories)
+                self._apply_category(email, category_id, categories)
+                if category_id is not None:
+                    self.cache.put(db, key, cached.summary, cached.unsubscribe_link, category_id, version)
+                return
+
+        analysis, classified = await self._generate(email, categories, classify)
+        email.summary = analysis.summary
+        if classify:
+            self._apply_category(email, analysis.category_id, categories)
+        if classify and self.local_classifier is not None:
+            if classified:
+                self.local_classifier.learn(email.user_id, [email])
+            elif analysis.summary == SUMMARY_ERROR:
+                # OpenAI rejected the email for good, the local model's best guess beats no category
+                category_id, _ = self.local_classifier.predict(db, email.user_id, [email], categories)[0]
+                if category_id is not None:
+                    self._apply_category(email, category_id, categories)
+        if analysis.unsubscribe_link:
+            email.unsubscribe_link = analysis.unsubscribe_link
+
+        if self.cache is not None and analysis.summary != SUMMARY_ERROR:
+            if classified:
+                self.cache.put(db, key, analysis.summary, analysis.unsubscribe_link, analysis.category_id, version)
             else:
-                logger.info("Email could not be classified into any category")
+                self.cache.put(db, key, analysis.summary, analysis.unsubscribe_link)
+
+        if (
+            classified and settings.SENDER_MEMO_ENABLED and analysis.category_id is not None
+            and analysis.confidence >= settings.SENDER_MEMO_MIN_CONFIDENCE
+        ):
+            sender_memo.record_category(db, email.user_id, email.sender, analysis.category_id)
+
+    async def _generate(
+        self,
+        email: Email,
+        categories: List[Category],
+        classify: bool
+    ) -> Tuple[EmailAnalysis, bool]:
+        """
+        Ask the model for an email's summary, category and unsubscribe link
+        Returns (analysis, classified) where classified tells whether the category
+        is a trustworthy answer worth remembering
+        """
+        if settings.AI_SINGLE_CALL_ANALYSIS:
+            analysis = await self.analyze_email(prompt_content(email), email.subject, categories if classify else None)
+            if analysis is not None:
+                return analysis, classify
+            logger.info("Falling back to separate summary, classification and unsubscribe requests")
+
+        # Generate summary
+        logger.info("Generating email summary...")
+        summary = await self.summarize_email(prompt_content(email), email.subject)
+        logger.info("Summary generated successfully")
+
+        # Classify email; classify_email cannot tell failures from "no category", so
+        # only a found category is trusted
+        category_id = None
+        if classify:
+            logger.info("Classifying email...")
+            category_id = await self.classify_email(prompt_content(email), categories)
+
+        # Find unsubscribe link (store it for later use)
+        logger.info("Searching for unsubscribe link...")
+        unsubscribe_link = await self.find_unsubscribe_link(prompt_content(email))
+        if unsubscribe_link:
+            logger.info(f"Unsubscribe link found")
+        # The separate requests report no confidence
+        analysis = EmailAnalysis(summary=summary, category_id=category_id, unsubscribe_link=unsubscribe_link)
+        return analysis, category_id is not None
+
+    def _apply_category(self, email: Email, category_id: Optional[int], categories: List[Category]) -> None:
+        if category_id:
+            category = next(cat for cat in categories if cat.id == category_id)
+            email.category_id = category_id
+            logger.info(f"Email classified into category: {category.name}")
+        else:
+            logger.info("Email could not be classified into any category")
 
-            # Find unsubscribe link (store it for later use)
-            logger.info("Searching for unsubscribe link...")
-            unsubscribe_link = await self.find_unsubscribe_link(email.content)
-            if unsubscribe_link:
-                email.unsubscribe_link = unsubscribe_link
-                logger.info(f"Unsubscribe link found and stored")
+    async def process_new_email(self, db: Session, email: Email) -> None:
+        """
+        Process a new email:
+        1. Generate a summary
+        2. Classify it into a category
+        Updates the email record in the database
+        """
+        try:
+            logger.info(f"Processing new email: {email.subject} (ID: {email.id})")
+            await self.enrich_email(db, email)
 
             # Update the email record
             db.add(email)
@@ -202,4 +499,4 @@ Return only the unsubscribe URL or instructions, or "None". No other text."""
 
         except Exception as e:
             logger.error(f"Error processing email {email.id}: {str(e)}")
-            db.rollback()
\ No newline at end of file
+            db.rollback()
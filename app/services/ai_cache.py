@@ -0,0 +1,167 @@
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
+import logging
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.config import settings
+from app.models import AIResult, Category
+
+logger = logging.getLogger(__name__)
+
+# category_version of results that carry no classification
+UNCLASSIFIED = ""
+
+def content_hash(subject: Optional[str], content: Optional[str]) -> str:
+    """Hash of an email's subject and body with whitespace normalized"""
+    normalized = " ".join((subject or "").split()) + "\n" + " ".join((content or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def category_set_version(categories: List[Category]) -> str:
+    """Hash identifying a user's category set; any rename, edit or deletion changes it"""
+    data = sorted((cat.id, cat.name, cat.description or "") for cat in categories)
+    return hashlib.sha256(json.dumps(data).encode("utf-8")).hexdigest()
+
+@dataclass
+class CachedAIResult:
+    summary: str
+    unsubscribe_link: Optional[str]
+    category_id: Optional[int]
+    category_version: str
+    expires_at: datetime
+
+class AIResultCache:
+    """
+    Two-tier cache of AI enrichment results keyed by content hash
+    An in-process LRU sits in front of the ai_results table. Any entry for a
+    content hash answers its summary and unsubscribe link; the category only
+    counts when the entry was made for the same category set version
+    """
+
+    def __init__(self, max_entries: int, ttl: timedelta):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # content hash -> category version -> result, least recently used first
+        self._memory: "OrderedDict[str, Dict[str, CachedAIResult]]" = OrderedDict()
+
+    def get(self, db: Session, key: str, category_version: Optional[str]) -> Optional[CachedAIResult]:
+        """
+        Return the cached result for the content, preferring one classified for
+        category_version. The database is only asked when memory has no such entry
+        """
+        now = datetime.utcnow()
+        entries = self._memory_entries(key, now)
+        if entries and (category_version is None or category_version in entries):
+            return self._pick(entries, category_version)
+
+        rows = db.query(AIResult).filter(AIResult.content_hash == key, AIResult.expires_at > now).all()
+        for row in rows:
+            self._remember(key, CachedAIResult(
+                summary=row.summary,
+                unsubscribe_link=row.unsubscribe_link,
+                category_id=row.category_id,
+                category_version=row.category_version,
+                expires_at=row.expires_at
+            ))
+        entries = self._memory_entries(key, now)
+        return self._pick(entries, category_version) if entries else None
+
+    def put(
+        self,
+        db: Session,
+        key: str,
+        summary: str,
+        unsubscribe_link: Optional[str],
+        category_id: Optional[int] = None,
+        category_version: str = UNCLASSIFIED
+    ) -> None:
+        """Store a result in both tiers; the database write is left to the caller's transaction"""
+        result = CachedAIResult(
+            summary=summary,
+            unsubscribe_link=unsubscribe_link,
+            category_id=category_id,
+            category_version=category_version,
+            expires_at=datetime.utcnow() + self.ttl
+        )
+        self._remember(key, result)
+
+        values = {
+            "summary": result.summary,
+            "unsubscribe_link": result.unsubscribe_link,
+            "category_id": result.category_id,
+            "expires_at": result.expires_at
+        }
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(AIResult).values(
+            content_hash=key,
+            category_version=category_version,
+            created_at=datetime.utcnow(),
+            **values
+        )
+        # Concurrent enrichments of the same content just refresh the entry
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["content_hash", "category_version"],
+            set_=values
+        ))
+
+    def evict_expired(self, db: Session) -> int:
+        """Delete expired results from the database, returns how many"""
+        result = db.execute(delete(AIResult).where(AIResult.expires_at <= datetime.utcnow()))
+        db.commit()
+        return result.rowcount
+
+    async def run(self, session_factory: Callable[[], Session], interval: float):
+        """Background loop deleting expired results"""
+        while True:
+            try:
+                def evict():
+                    db = session_factory()
+                    try:
+                        return self.evict_expired(db)
+                    finally:
+                        db.close()
+
+                evicted = await asyncio.to_thread(evict)
+                if evicted:
+                    logger.info(f"Evicted {evicted} expired cached AI results")
+            except Exception as e:
+                logger.error(f"Error evicting cached AI results: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def _memory_entries(self, key: str, now: datetime) -> Optional[Dict[str, CachedAIResult]]:
+        entries = self._memory.get(key)
+        if entries is None:
+            return None
+        for version in [version for version, entry in entries.items() if entry.expires_at <= now]:
+            del entries[version]
+        if not entries:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entries
+
+    def _remember(self, key: str, result: CachedAIResult) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory.setdefault(key, {})[result.category_version] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def _pick(entries: Dict[str, CachedAIResult], category_version: Optional[str]) -> CachedAIResult:
+        if category_version is not None and category_version in entries:
+            return entries[category_version]
+        return max(entries.values(), key=lambda entry: entry.expires_at)
+
+ai_result_cache = AIResultCache(
+    max_entries=settings.AI_CACHE_MEMORY_ENTRIES,
+    ttl=timedelta(days=settings.AI_CACHE_TTL_DAYS)
+)
@@ -0,0 +1,161 @@
+from typing import Callable, Dict, Optional, Tuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import threading
+
+from google.oauth2.credentials import Credentials
+from google.auth.transport import requests as google_requests
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import GmailAccount
+
+logger = logging.getLogger(__name__)
+
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+
+@dataclass(frozen=True)
+class AccountTokens:
+    """
+    Snapshot of a GmailAccount's OAuth fields. Gmail calls run on worker
+    threads, where the ORM object (and the Session it belongs to) must not be touched
+    """
+    id: int
+    access_token: Optional[str]
+    refresh_token: Optional[str]
+    token_expiry: Optional[datetime]
+
+    @classmethod
+    def from_account(cls, account: GmailAccount) -> "AccountTokens":
+        return cls(
+            id=account.id,
+            access_token=account.access_token,
+            refresh_token=account.refresh_token,
+            token_expiry=account.token_expiry
+        )
+
+class CredentialManager:
+    """
+    Process-wide cache of Gmail OAuth credentials, one entry per account
+    A background task refreshes cached credentials before they expire and
+    writes new tokens back to GmailAccount in batches, so syncs only block
+    on Google's token endpoint when a token is already unusable
+    """
+
+    def __init__(self, refresh_margin: timedelta):
+        self.refresh_margin = refresh_margin
+        self.running = False  # True while the background refresher is active
+        self._credentials: Dict[int, Credentials] = {}
+        self._pending: Dict[int, Tuple[str, Optional[str], datetime]] = {}  # Tokens not written back yet
+        self._lock = threading.Lock()
+        self._account_locks: Dict[int, threading.Lock] = {}
+
+    def get_credentials(self, account: AccountTokens, force_refresh: bool = False) -> Credentials:
+        """Return usable credentials for the account, refreshing inline only if needed"""
+        with self._account_lock(account.id):
+            creds = None if force_refresh else self._credentials.get(account.id)
+            if creds is None:
+                creds = self._build_credentials(account)
+            if force_refresh or not creds.valid:
+                self._refresh(account.id, creds)
+            with self._lock:
+                self._credentials[account.id] = creds
+            return creds
+
+    def invalidate(self, account_id: int) -> None:
+        """Drop cached credentials, e.g. after the account was disconnected"""
+        with self._lock:
+            self._credentials.pop(account_id, None)
+
+    def refresh_expiring(self) -> int:
+        """Refresh every cached credential expiring within the margin, returns how many"""
+        deadline = datetime.utcnow() + self.refresh_margin
+        with self._lock:
+            expiring = [
+                (account_id, creds) for account_id, creds in self._credentials.items()
+                if creds.refresh_token and (creds.expiry is None or creds.expiry <= deadline)
+            ]
+
+        refreshed = 0
+        for account_id, creds in expiring:
+            with self._account_lock(account_id):
+                # Another thread may have refreshed it in the meantime
+                if self._credentials.get(account_id) is not creds:
+                    continue
+                try:
+                    self._refresh(account_id, creds)
+                    refreshed += 1
+                except Exception as e:
+                    logger.error(f"Error refreshing credentials for account {account_id}: {str(e)}")
+                    self.invalidate(account_id)
+        return refreshed
+
+    def flush(self, db: Session) -> int:
+        """Write refreshed tokens back to their GmailAccount rows in one batch"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            db.execute(update(GmailAccount), [
+                {"id": account_id, "access_token": token, "refresh_token": refresh_token, "token_expiry": expiry}
+                for account_id, (token, refresh_token, expiry) in pending.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # Keep anything refreshed since, it is newer than what failed to save
+                self._pending = {**pending, **self._pending}
+            raise
+        return len(pending)
+
+    async def run(self, session_factory: Callable[[], Session], interval: float):
+        """Background loop refreshing expiring credentials and saving new tokens"""
+        self.running = True
+        try:
+            while True:
+                try:
+                    refreshed = await asyncio.to_thread(self.refresh_expiring)
+                    if refreshed:
+                        logger.info(f"Refreshed credentials for {refreshed} Gmail accounts ahead of expiry")
+                    db = session_factory()
+                    try:
+                        self.flush(db)
+                    finally:
+                        db.close()
+                except Exception as e:
+                    logger.error(f"Error in credential refresh loop: {str(e)}")
+                await asyncio.sleep(interval)
+        finally:
+            self.running = False
+
+    def _account_lock(self, account_id: int) -> threading.Lock:
+        with self._lock:
+            return self._account_locks.setdefault(account_id, threading.Lock())
+
+    def _build_credentials(self, account: AccountTokens) -> Credentials:
+        return Credentials(
+            token=account.access_token,
+            refresh_token=account.refresh_token,
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET,
+            scopes=GMAIL_SCOPES,
+            expiry=account.token_expiry
+        )
+
+    def _refresh(self, account_id: int, creds: Credentials) -> None:
+        """Refresh credentials and queue the new token for the database"""
+        creds.refresh(google_requests.Request())
+        # creds.expiry is already an absolute (naive UTC) expiry time
+        with self._lock:
+            self._pending[account_id] = (creds.token, creds.refresh_token, creds.expiry)
+
+credential_manager = CredentialManager(
+    refresh_margin=timedelta(seconds=settings.GMAIL_TOKEN_REFRESH_MARGIN_SECONDS)
+)
@@ -1,108 +1,273 @@
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from google.oauth2.credentials import Credentials
-from google.auth.transport import requests as google_requests
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
 from email.mime.text import MIMEText
+from functools import lru_cache, partial
+import asyncio
 import base64
+import httplib2
+import logging
 
 from app.core.config import settings
 from app.models import GmailAccount
+from app.services.credentials import AccountTokens, credential_manager
+from app.services.rate_limit import QuotaLimiter, gmail_quota
+from app.services.retry import RetryPolicy, classify_google_error, google_retry_after
 from sqlalchemy.orm import Session
 
+logger = logging.getLogger(__name__)
+
+# Gmail accepts at most 100 calls in a single batch request
+BATCH_GET_SIZE = 100
+# users.messages.batchModify accepts at most 1000 message IDs per call
+BATCH_MODIFY_SIZE = 1000
+
+T = TypeVar("T")
+
+class HistoryExpiredError(Exception):
+    """Raised when a stored history ID is too old for users.history.list"""
+    pass
+
+# One backoff policy for every Gmail call in the process, so its metrics cover them all
+gmail_retry_policy = RetryPolicy(
+    classify=classify_google_error,
+    get_retry_after=google_retry_after,
+    max_attempts=settings.GMAIL_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.GMAIL_RETRY_BASE_DELAY_SECONDS,
+    max_delay=settings.GMAIL_RETRY_MAX_DELAY_SECONDS
+)
+
+@lru_cache(maxsize=None)
+def get_gmail_resource():
+    """
+    Gmail API resource shared by the whole process, built once from the
+    discovery document bundled with google-api-python-client. It carries no
+    credentials: requests built from it are executed with an account's own
+    authorized HTTP transport
+    """
+    return build_from_document(get_static_doc('gmail', 'v1'), http=httplib2.Http())
+
+@lru_cache(maxsize=None)
+def get_gmail_executor() -> ThreadPoolExecutor:
+    """
+    Thread pool for blocking Gmail calls, kept apart from the event loop's
+    default executor so Gmail round trips never queue up DB work (and the
+    other way around)
+    """
+    return ThreadPoolExecutor(max_workers=settings.GMAIL_IO_THREADS, thread_name_prefix="gmail-io")
+
+async def run_gmail_call(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking GmailService call on the Gmail thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_gmail_executor(), partial(func, *args, **kwargs))
+
 class GmailService:
-    def __init__(self, gmail_account: GmailAccount, db: Session):
-        """Initialize Gmail service with a GmailAccount model"""
-        self.gmail_account = gmail_account
-        self.db = db
-        self.credentials = self._get_credentials()
-        self.service = build('gmail', 'v1', credentials=self.credentials)
-
-    def _get_credentials(self) -> Credentials:
-        """Get credentials, refreshing if necessary"""
-        creds = Credentials(
-            token=self.gmail_account.access_token,
-            refresh_token=self.gmail_account.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=settings.GOOGLE_CLIENT_ID,
-            client_secret=settings.GOOGLE_CLIENT_SECRET,
-            scopes=["https://www.googleapis.com/auth/gmail.modify"]
-        )
-
-        # Check if token needs refresh
-        if self.gmail_account.token_expiry and datetime.utcnow() >= self.gmail_account.token_expiry:
-            request = google_requests.Request()
-            creds.refresh(request)
-            
-            # Update tokens in database
-            self.gmail_account.access_token = creds.token
-            self.gmail_account.token_expiry = datetime.utcnow() + timedelta(seconds=creds.expiry.second)
-            self.db.add(self.gmail_account)
-            self.db.commit()
-
-        return creds
-
-    def list_unarchived_emails(self, since: Optional[datetime] = None) -> List[dict]:
+    def __init__(self, gmail_account: GmailAccount, db: Session, quota: Optional[QuotaLimiter] = None):
+        """
+        Initialize Gmail service with a GmailAccount model, optionally under a stricter quota
+        Only plain copies of the account's fields are kept: calls run on the Gmail
+        thread pool while the caller keeps using the account's Session
+        """
+        self.account_id = gmail_account.id
+        self.account_tokens = AccountTokens.from_account(gmail_account)
+        self.service = get_gmail_resource()
+        self.quota = quota or gmail_quota
+        self.retry = gmail_retry_policy
+        self._authorize()
+
+        # Without the background refresher running nothing else saves new tokens
+        if not credential_manager.running and db is not None:
+            credential_manager.flush(db)
+
+    def _authorize(self, force_refresh: bool = False) -> None:
+        """Load the account's credentials and wrap them in a fresh HTTP transport"""
+        self.credentials = self._get_credentials(force_refresh)
+        self.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+
+    def _execute(self, request, method: str):
+        """
+        Execute a request built from the shared resource as this account
+        Each attempt waits for quota first. Transient failures are retried with
+        backoff and auth failures once with freshly refreshed credentials
+        """
+        def attempt():
+            self.quota.acquire(self.account_id, method)
+            return request.execute(http=self.http)
+
+        return self.retry.call(attempt, operation=method, on_auth_error=lambda: self._authorize(force_refresh=True))
+
+    def _get_credentials(self, force_refresh: bool = False) -> Credentials:
+        """Get cached credentials for the account, refreshing only when they are unusable"""
+        return credential_manager.get_credentials(self.account_tokens, force_refresh=force_refresh)
+
+    def list_unarchived_emails(self, since: Optional[datetime] = None, max_messages: Optional[int] = None) -> List[dict]:
         """
         List unarchived emails from Gmail, optionally since a specific time
         Returns list of email data including ID, subject, sender, etc.
         """
+        return [
+            message
+            for messages, _ in self.iter_unarchived_email_pages(since=since, max_messages=max_messages)
+            for message in messages
+        ]
+
+    def iter_unarchived_email_pages(
+        self,
+        since: Optional[datetime] = None,
+        page_size: Optional[int] = None,
+        max_messages: Optional[int] = None,
+        page_token: Optional[str] = None,
+        before: Optional[datetime] = None
+    ) -> Iterator[Tuple[List[dict], Optional[str]]]:
+        """
+        Lazily list unarchived emails page by page, following nextPageToken
+        Yields (messages, next_page_token); the next page is only requested once
+        the caller asks for it. Stops after max_messages, in which case the last
+        next_page_token can be passed back as page_token to resume
+        """
         query = "in:inbox"  # Only unarchived emails
         if since:
             query += f" after:{int(since.timestamp())}"
+        if before:
+            query += f" before:{int(before.timestamp())}"
 
-        try:
-            results = self.service.users().messages().list(
-                userId='me',
-                q=query,
-                maxResults=50  # Limit to 50 emails per sync
-            ).execute()
-
-            messages = []
-            if 'messages' in results:
-                for message in results['messages']:
-                    messages.append({
-                        'id': message['id']
-                    })
-
-            return messages
-
-        except Exception as e:
-            # If we get a token error, try refreshing and retry once
-            if "invalid_grant" in str(e):
-                self.credentials = self._get_credentials()
-                self.service = build('gmail', 'v1', credentials=self.credentials)
-                return self.list_unarchived_emails(since)
-            raise
+        page_size = page_size or settings.GMAIL_LIST_PAGE_SIZE
+        remaining = max_messages
+        while True:
+            results = self._list_messages(
+                query,
+                min(page_size, remaining) if remaining is not None else page_size,
+                page_token
+            )
+            messages = [{'id': message['id']} for message in results.get('messages', [])]
+            page_token = results.get('nextPageToken')
+            if remaining is not None:
+                remaining -= len(messages)
+
+            yield messages, page_token
+
+            if not page_token or (remaining is not None and remaining <= 0):
+                return
+
+    def _list_messages(self, query: str, max_results: int, page_token: Optional[str]) -> dict:
+        """Run a single messages.list call"""
+        return self._execute(self.service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=max_results,
+            pageToken=page_token
+        ), "messages.list")
+
+    def get_history_id(self) -> str:
+        """Get the mailbox's current history ID"""
+        return self._execute(self.service.users().getProfile(userId='me'), "getProfile")['historyId']
+
+    def list_history_messages(self, start_history_id: str) -> tuple[List[dict], str]:
+        """
+        List inbox messages added since start_history_id using the History API
+        Returns (messages, latest history ID). An idle mailbox costs a single call.
+        Raises HistoryExpiredError when Gmail no longer has history that old
+        """
+        messages: Dict[str, dict] = {}
+        page_token = None
+        while True:
+            try:
+                results = self._execute(self.service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    labelId='INBOX',
+                    pageToken=page_token
+                ), "history.list")
+            except HttpError as e:
+                if e.resp.status == 404:
+                    raise HistoryExpiredError(f"History ID {start_history_id} has expired") from e
+                raise
+
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added['message']
+                    if 'INBOX' in message.get('labelIds', []):
+                        messages[message['id']] = {'id': message['id']}
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return list(messages.values()), results.get('historyId', start_history_id)
 
     def get_message(self, message_id: str) -> dict:
         """Get a specific message by ID"""
-        try:
-            return self.service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
-        except Exception as e:
-            # If we get a token error, try refreshing and retry once
-            if "invalid_grant" in str(e):
-                self.credentials = self._get_credentials()
-                self.service = build('gmail', 'v1', credentials=self.credentials)
-                return self.get_message(message_id)
-            raise
+        return self._execute(self.service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='full'
+        ), "messages.get")
+
+    def get_messages(self, message_ids: List[str]) -> Dict[str, dict]:
+        """
+        Get several messages by ID using batch requests (up to 100 per HTTP call)
+        Sub-requests that fail inside a batch are retried individually.
+        Returns a dict of message ID -> message; IDs that still fail are left out
+        """
+        messages: Dict[str, dict] = {}
+        failed: List[str] = []
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                failed.append(request_id)
+            else:
+                messages[request_id] = response
+
+        unique_ids = list(dict.fromkeys(message_ids))
+        for start in range(0, len(unique_ids), BATCH_GET_SIZE):
+            chunk = unique_ids[start:start + BATCH_GET_SIZE]
+            batch = self.service.new_batch_http_request(callback=collect)
+            for message_id in chunk:
+                batch.add(
+                    self.service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        format='full'
+                    ),
+                    request_id=message_id
+                )
+            try:
+                # Every call inside a batch is charged as its own request
+                self.quota.acquire(self.account_id, "messages.get", len(chunk))
+                batch.execute(http=self.http)
+            except Exception as e:
+                # The whole batch failed, fall back to fetching its messages one by one.
+                # Callbacks that ran before it broke may have queued some already
+                logger.warning(f"Batch fetch of {len(chunk)} messages failed: {str(e)}")
+                queued = set(failed)
+                failed.extend(message_id for message_id in chunk if message_id not in messages and message_id not in queued)
+
+        for message_id in failed:
+            try:
+                messages[message_id] = self.get_message(message_id)
+            except Exception as e:
+                logger.error(f"Error fetching message {message_id}: {str(e)}")
+
+        return messages
 
     def archive_email(self, message_id: str) -> None:
         """Archive an email by removing INBOX label"""
-        try:
-            self.service.users().messages().modify(
+        self._execute(self.service.users().messages().modify(
+            userId='me',
+            id=message_id,
+            body={'removeLabelIds': ['INBOX']}
+        ), "messages.modify")
+
+    def archive_emails(self, message_ids: List[str]) -> None:
+        """Archive several emails with batchModify (up to 1000 IDs per call)"""
+        unique_ids = list(dict.fromkeys(message_ids))
+        for start in range(0, len(unique_ids), BATCH_MODIFY_SIZE):
+            chunk = unique_ids[start:start + BATCH_MODIFY_SIZE]
+            self._execute(self.service.users().messages().batchModify(
                 userId='me',
-                id=message_id,
-                body={'removeLabelIds': ['INBOX']}
-            ).execute()
-        except Exception as e:
-            # If we get a token error, try refreshing and retry once
-            if "invalid_grant" in str(e):
-                self.credentials = self._get_credentials()
-                self.service = build('gmail', 'v1', credentials=self.credentials)
-                self.archive_email(message_id)
-            raise
\ No newline at end of file
+                body={'ids': chunk, 'removeLabelIds': ['INBOX']}
+            ), "messages.batchModify")
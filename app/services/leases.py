@@ -0,0 +1,127 @@
+from typing import Callable, Iterable, List, Optional, Set
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.models import GmailAccount
+
+logger = logging.getLogger(__name__)
+
+def worker_id() -> str:
+    """Lease owner name of this process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class AccountLeases:
+    """
+    Time-limited claims on Gmail accounts so several worker replicas can split them
+    Due accounts are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    workers never pick the same row. A lease that is not renewed expires and the
+    account becomes claimable again, which is how a crashed worker's accounts
+    are picked up by the others
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], owner: str, lease_seconds: float):
+        self.session_factory = session_factory
+        self.owner = owner
+        self.lease_duration = timedelta(seconds=lease_seconds)
+
+    def claim_due(self, limit: int, now: Optional[datetime] = None) -> List[int]:
+        """Lease up to limit accounts that are due and not leased, earliest due first"""
+        if limit <= 0:
+            return []
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            account_ids = [
+                account_id for (account_id,) in db.query(GmailAccount.id)
+                .filter(or_(GmailAccount.next_sync_at.is_(None), GmailAccount.next_sync_at <= now))
+                .filter(or_(GmailAccount.lease_expires_at.is_(None), GmailAccount.lease_expires_at <= now))
+                .order_by(GmailAccount.next_sync_at.asc().nullsfirst(), GmailAccount.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            ]
+            if account_ids:
+                db.execute(
+                    update(GmailAccount)
+                    .where(GmailAccount.id.in_(account_ids))
+                    .values(lease_owner=self.owner, lease_expires_at=now + self.lease_duration)
+                )
+            db.commit()
+            return account_ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def renew(self, account_ids: Iterable[int], now: Optional[datetime] = None) -> Set[int]:
+        """Extend leases this worker still holds, returns the IDs that were renewed"""
+        account_ids = list(account_ids)
+        if not account_ids:
+            return set()
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            renewed = {
+                account_id for (account_id,) in db.execute(
+                    update(GmailAccount)
+                    .where(GmailAccount.id.in_(account_ids), GmailAccount.lease_owner == self.owner)
+                    .values(lease_expires_at=now + self.lease_duration)
+                    .returning(GmailAccount.id)
+                )
+            }
+            db.commit()
+            return renewed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def claim(self, account_id: int, now: Optional[datetime] = None) -> bool:
+        """Lease one account whether or not it is due, False if someone else holds it"""
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            claimable = db.query(GmailAccount.id).filter(
+                GmailAccount.id == account_id,
+                or_(GmailAccount.lease_expires_at.is_(None), GmailAccount.lease_expires_at <= now)
+            ).with_for_update(skip_locked=True).first()
+            if claimable:
+                db.execute(
+                    update(GmailAccount)
+                    .where(GmailAccount.id == account_id)
+                    .values(lease_owner=self.owner, lease_expires_at=now + self.lease_duration)
+                )
+            db.commit()
+            return claimable is not None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def release(self, account_id: int) -> bool:
+        """Give up the lease on an account, False if it was no longer ours"""
+        db = self.session_factory()
+        try:
+            released = db.execute(
+                update(GmailAccount)
+                .where(GmailAccount.id == account_id, GmailAccount.lease_owner == self.owner)
+                .values(lease_owner=None, lease_expires_at=None)
+            ).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if not released:
+            logger.warning(f"Lease on account {account_id} was lost before it could be released")
+        return bool(released)
@@ -0,0 +1,205 @@
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Deque, Optional
+import asyncio
+import logging
+import time
+
+import openai
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.services.normalize import count_tokens
+from app.services.rate_limit import TokenBucket, per_process
+from app.services.retry import AUTH, NETWORK, RATE_LIMIT, SERVER, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Completion size assumed for requests that set no max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+
+class LLMUnavailable(Exception):
+    """
+    Raised when an LLM request still fails after retries on rate limits or
+    transient errors. The work should be retried later, not stored half done
+    """
+    pass
+
+def classify_openai_error(e: Exception) -> Optional[str]:
+    """Error kind of an OpenAI client exception, None for permanent failures"""
+    if isinstance(e, openai.RateLimitError):
+        # An exhausted quota is not going to come back by retrying
+        return None if getattr(e, "code", None) == "insufficient_quota" else RATE_LIMIT
+    if isinstance(e, openai.AuthenticationError):
+        return AUTH
+    if isinstance(e, openai.InternalServerError):
+        return SERVER
+    if isinstance(e, (openai.APIConnectionError, ConnectionError, TimeoutError)):
+        return NETWORK  # APITimeoutError is an APIConnectionError
+    return None
+
+def openai_retry_after(e: Exception) -> Optional[float]:
+    """Seconds from the retry-after-ms or Retry-After response header, if the server sent one"""
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) / scale)
+        except ValueError:
+            continue  # HTTP-date form, fall back to our own backoff
+    return None
+
+class AdaptiveConcurrency:
+    """
+    Limit on concurrent requests that adapts the AIMD way: every success raises
+    it by about one per limit's worth of requests, a rate limit halves it.
+    Requests that were already running when the limit was last lowered hit the
+    same overload, so their rate limits do not lower it again.
+    Meant for a single event loop, which is how the worker and the API run
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(maximum, max(minimum, initial)))
+        self.in_flight = 0
+        self.epoch = 0  # Bumped on every decrease
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> int:
+        """Wait for a slot, returns the epoch the request started in"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    self._wake()  # Pass on the slot we were woken for
+                raise
+        self.in_flight += 1
+        return self.epoch
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_rate_limited(self, started_epoch: Optional[int] = None) -> None:
+        """Halve the limit, unless the request started before the last decrease"""
+        if started_epoch is not None and started_epoch < self.epoch:
+            return
+        limit = max(self.minimum, self.limit / 2)
+        if int(limit) < int(self.limit):
+            logger.info(f"OpenAI rate limited, lowering concurrency to {int(limit)}")
+        self.limit = limit
+        self.epoch += 1
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+class LLMGateway:
+    """
+    Process-wide entry point for OpenAI chat completions
+    Requests wait for the request and token per-minute budgets and for a slot
+    under the adaptive concurrency limit. Rate limits and transient errors are
+    retried with backoff; a Retry-After from a rate limit pauses every request,
+    not just the one that hit it. Requests that still fail raise LLMUnavailable
+    """
+
+    def __init__(
+        self,
+        client,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        concurrency: AdaptiveConcurrency,
+        retry: RetryPolicy,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute / 60, capacity=requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute, clock=clock)
+        self.concurrency = concurrency
+        self.retry = retry
+        self._clock = clock
+        self._paused_until = 0.0
+
+    async def create(self, operation: str, **kwargs):
+        """Run client.chat.completions.create(**kwargs) under the gateway's limits"""
+        prompt = "".join(str(message.get("content", "")) for message in kwargs.get("messages", []))
+        estimated = count_tokens(prompt) + (kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+        async def attempt():
+            wait = max(
+                self.requests.reserve(1),
+                self.tokens.reserve(estimated),
+                self._paused_until - self._clock()
+            )
+            if wait > 0:
+                logger.debug(f"Waiting {wait:.2f}s for OpenAI budget ({operation})")
+                await asyncio.sleep(wait)
+
+            epoch = await self.concurrency.acquire()
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                # A failed attempt used none of its tokens, the retry reserves them again
+                self.tokens.reserve(-estimated)
+                if self.retry.classify(e) == RATE_LIMIT:
+                    self.concurrency.on_rate_limited(epoch)
+                    retry_after = openai_retry_after(e)
+                    if retry_after:
+                        self._paused_until = max(self._paused_until, self._clock() + retry_after)
+                raise
+            finally:
+                self.concurrency.release()
+
+            self.concurrency.on_success()
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.total_tokens:
+                # Give back (or charge) the difference to the estimate
+                self.tokens.reserve(usage.total_tokens - estimated)
+            return response
+
+        try:
+            return await self.retry.call_async(attempt, operation)
+        except Exception as e:
+            if self.retry.classify(e) in (RATE_LIMIT, SERVER, NETWORK):
+                raise LLMUnavailable(f"{operation} failed: {str(e)}") from e
+            raise
+
+@lru_cache(maxsize=None)
+def get_llm_gateway() -> LLMGateway:
+    """The gateway shared by every OpenAI caller in the process"""
+    return LLMGateway(
+        # Retries are the gateway's job, so the client does not add its own
+        client=AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0),
+        requests_per_minute=per_process(settings.OPENAI_REQUESTS_PER_MINUTE),
+        tokens_per_minute=per_process(settings.OPENAI_TOKENS_PER_MINUTE),
+        concurrency=AdaptiveConcurrency(
+            initial=settings.OPENAI_INITIAL_CONCURRENCY,
+            minimum=settings.OPENAI_MIN_CONCURRENCY,
+            maximum=settings.OPENAI_MAX_CONCURRENCY
+        ),
+        retry=RetryPolicy(
+            classify=classify_openai_error,
+            get_retry_after=openai_retry_after,
+            max_attempts=settings.OPENAI_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.OPENAI_RETRY_BASE_DELAY_SECONDS,
+            max_delay=settings.OPENAI_RETRY_MAX_DELAY_SECONDS
+        )
+    )
@@ -0,0 +1,222 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Category, Email
+from app.services.ai_cache import category_set_version
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9'._-]*[a-z0-9]|[a-z0-9]")
+# Only the start of a body is used, it carries most of what tells categories apart
+MAX_CONTENT_CHARS = 4000
+
+def email_features(subject: Optional[str], sender: Optional[str], content: Optional[str], dim: int) -> np.ndarray:
+    """
+    Hashed bag of words of an email as a unit-length vector
+    Subject and sender tokens are prefixed so they count separately from the body
+    """
+    tokens = [f"s:{token}" for token in TOKEN_PATTERN.findall((subject or "").lower())]
+    tokens += [f"f:{token}" for token in TOKEN_PATTERN.findall((sender or "").lower())]
+    tokens += TOKEN_PATTERN.findall((content or "")[:MAX_CONTENT_CHARS].lower())
+    if not tokens:
+        return np.zeros(dim, dtype=np.float32)
+
+    indices = np.fromiter((zlib.crc32(token.encode("utf-8")) % dim for token in tokens), dtype=np.int64, count=len(tokens))
+    vector = np.log1p(np.bincount(indices, minlength=dim).astype(np.float32))
+    return vector / np.linalg.norm(vector)
+
+class CentroidModel:
+    """
+    Nearest-centroid classifier over one user's categories
+    Each category keeps the sum of its examples' feature vectors, so learning
+    one more email is a single row update
+    """
+
+    def __init__(self, category_ids: List[int], dim: int, version: str):
+        self.category_ids = category_ids
+        self.version = version
+        self.trained_at = datetime.utcnow()
+        self._rows = {category_id: row for row, category_id in enumerate(category_ids)}
+        self.sums = np.zeros((len(category_ids), dim), dtype=np.float32)
+        self.counts = np.zeros(len(category_ids), dtype=np.int64)
+
+    def learn(self, features: np.ndarray, category_ids: List[int]) -> None:
+        """Add examples, one feature row per category ID; unknown categories are skipped"""
+        rows = [self._rows.get(category_id) for category_id in category_ids]
+        keep = [i for i, row in enumerate(rows) if row is not None]
+        if not keep:
+            return
+        rows = np.array([rows[i] for i in keep])
+        np.add.at(self.sums, rows, features[keep])
+        np.add.at(self.counts, rows, 1)
+
+    def scores(self, features: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each feature row to every category centroid"""
+        norms = np.linalg.norm(self.sums, axis=1)
+        centroids = self.sums / np.where(norms > 0, norms, 1)[:, None]
+        return features @ centroids.T
+
+    def predict(self, features: np.ndarray, min_examples: int) -> List[Tuple[Optional[int], float]]:
+        """
+        Best category and its margin over the runner-up for each feature row
+        Categories with fewer than min_examples examples are not considered; when
+        fewer than two are left there is nothing to compare and no prediction
+        """
+        trained = self.counts >= min_examples
+        if trained.sum() < 2:
+            return [(None, 0.0)] * len(features)
+        scores = np.where(trained, self.scores(features), -np.inf)
+        top_two = np.argsort(scores, axis=1)[:, -2:]
+        best, runner_up = top_two[:, 1], top_two[:, 0]
+        rows = np.arange(len(features))
+        margins = scores[rows, best] - scores[rows, runner_up]
+        return [(self.category_ids[i], float(margin)) for i, margin in zip(best, margins)]
+
+class LocalClassifier:
+    """
+    Per-user in-process classifiers trained on the user's categorized emails
+    Models are built lazily from the database, learn from new labels as they
+    arrive and are rebuilt when the category set changes or they get old, which
+    also picks up corrections made elsewhere. Builds featurize off the event
+    loop; until one finishes the previous model keeps answering, as long as it
+    was made for the same category set
+    """
+
+    def __init__(self, dim: int, max_users: int, max_age: timedelta, training_emails: int):
+        self.dim = dim
+        self.max_users = max_users
+        self.max_age = max_age
+        self.training_emails = training_emails
+        self._models: "OrderedDict[int, CentroidModel]" = OrderedDict()
+        # User ID -> (category set version, build task) of models being built
+        self._training: Dict[int, Tuple[str, asyncio.Task]] = {}
+        # Labels learned while a build runs, added to the new model once it is done
+        self._pending: Dict[int, List[Tuple[np.ndarray, List[int]]]] = {}
+
+    def predict(
+        self,
+        db: Session,
+        user_id: int,
+        emails: List[Email],
+        categories: List[Category]
+    ) -> List[Tuple[Optional[int], float]]:
+        """
+        Return (category ID, margin) per email, (None, 0) when the model cannot
+        tell or is still being built. Called from the event loop, which builds
+        missing and outdated models in the background
+        """
+        if not emails or len(categories) < 2:
+            return [(None, 0.0)] * len(emails)
+        model = self._model(db, user_id, categories)
+        if model is None:
+            return [(None, 0.0)] * len(emails)
+        return model.predict(self._features(emails), settings.LOCAL_CLASSIFIER_MIN_EXAMPLES)
+
+    def classify(self, db: Session, email: Email, categories: List[Category]) -> Optional[int]:
+        """Return the email's category when the model is confident enough to skip the LLM"""
+        category_id, margin = self.predict(db, email.user_id, [email], categories)[0]
+        if category_id is not None and margin >= settings.LOCAL_CLASSIFIER_MIN_MARGIN:
+            logger.info(f"Classified email locally into category {category_id} (margin {margin:.2f})")
+            return category_id
+        return None
+
+    def learn(self, user_id: int, emails: List[Email]) -> None:
+        """Add categorized emails to the user's model and to the one being built, if any"""
+        model = self._models.get(user_id)
+        pending = self._pending.get(user_id)
+        emails = [email for email in emails if email.category_id is not None]
+        if (model is None and pending is None) or not emails:
+            return
+        features = self._features(emails)
+        category_ids = [email.category_id for email in emails]
+        if model is not None:
+            model.learn(features, category_ids)
+        if pending is not None:
+            pending.append((features, category_ids))
+
+    async def train(self, db: Session, user_id: int, categories: List[Category]) -> Optional[CentroidModel]:
+        """Build the user's model for categories, or wait for that build if it is already running"""
+        self._start_training(db, user_id, categories, category_set_version(categories))
+        return await self._training[user_id][1]
+
+    def reset(self) -> None:
+        """Drop every model, they are rebuilt on next use. Builds still running are discarded"""
+        self._models.clear()
+        self._training.clear()
+        self._pending.clear()
+
+    def _features(self, emails: List[Email]) -> np.ndarray:
+        return np.stack([email_features(email.subject, email.sender, email.content, self.dim) for email in emails])
+
+    def _model(self, db: Session, user_id: int, categories: List[Category]) -> Optional[CentroidModel]:
+        version = category_set_version(categories)
+        model = self._models.get(user_id)
+        if model is None or model.version != version or datetime.utcnow() - model.trained_at > self.max_age:
+            self._start_training(db, user_id, categories, version)
+        if model is None or model.version != version:
+            return None
+        self._models.move_to_end(user_id)
+        return model
+
+    def _start_training(self, db: Session, user_id: int, categories: List[Category], version: str) -> None:
+        training = self._training.get(user_id)
+        if training is not None and training[0] == version:
+            return
+        category_ids = [cat.id for cat in categories]
+        # The query is quick next to featurizing, and the session stays on this thread
+        rows = db.query(Email.subject, Email.sender, Email.content, Email.category_id).filter(
+            Email.user_id == user_id,
+            Email.category_id.in_(category_ids)
+        ).order_by(Email.received_at.desc()).limit(self.training_emails).all()
+        self._pending[user_id] = []
+        task = asyncio.get_running_loop().create_task(self._build(user_id, category_ids, version, rows))
+        self._training[user_id] = (version, task)
+
+    async def _build(self, user_id: int, category_ids: List[int], version: str, rows: list) -> Optional[CentroidModel]:
+        try:
+            model = await asyncio.to_thread(self._train, category_ids, version, rows)
+        except Exception as e:
+            logger.error(f"Error training local classifier for user {user_id}: {str(e)}")
+            model = None
+
+        # A newer build for another category set, or a reset, replaced this one
+        training = self._training.get(user_id)
+        if training is None or training[1] is not asyncio.current_task():
+            return model
+        del self._training[user_id]
+        pending = self._pending.pop(user_id, [])
+        if model is None:
+            return None
+
+        for features, learned_ids in pending:
+            model.learn(features, learned_ids)
+        self._models[user_id] = model
+        self._models.move_to_end(user_id)
+        while len(self._models) > self.max_users:
+            self._models.popitem(last=False)
+        logger.info(f"Trained local classifier for user {user_id} on {len(rows)} emails")
+        return model
+
+    def _train(self, category_ids: List[int], version: str, rows: list) -> CentroidModel:
+        """Featurize training rows into a new model; runs on a worker thread"""
+        model = CentroidModel(category_ids, self.dim, version)
+        if rows:
+            features = np.stack([email_features(subject, sender, content, self.dim) for subject, sender, content, _ in rows])
+            model.learn(features, [category_id for _, _, _, category_id in rows])
+        return model
+
+local_classifier = LocalClassifier(
+    dim=settings.LOCAL_CLASSIFIER_FEATURES,
+    max_users=settings.LOCAL_CLASSIFIER_MAX_USERS,
+    max_age=timedelta(seconds=settings.LOCAL_CLASSIFIER_RETRAIN_SECONDS),
+    training_emails=settings.LOCAL_CLASSIFIER_TRAINING_EMAILS
+)
@@ -0,0 +1,130 @@
+from functools import lru_cache
+from typing import Optional
+import logging
+import re
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # Token budgets fall back to a characters-per-token estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a token in characters, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+TOKENIZER_ENCODING = "cl100k_base"
+
+# Lines that start the quoted history of a reply or forward
+QUOTE_HEADER_PATTERNS = [
+    re.compile(r"^On .{0,200}wrote:$", re.IGNORECASE),
+    re.compile(r"^-{2,}\s*(Original Message|Forwarded message)\s*-{2,}$", re.IGNORECASE),
+    re.compile(r"^_{10,}$"),  # Outlook's separator line
+]
+# Outlook quotes start with a "From:" line followed by "Sent:" or "Date:"
+OUTLOOK_FROM_PATTERN = re.compile(r"^From: ")
+OUTLOOK_SENT_PATTERN = re.compile(r"^(Sent|Date): ")
+# Lines that start a signature
+SIGNATURE_PATTERNS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^Sent from my \w+", re.IGNORECASE),
+]
+URL_PATTERN = re.compile(r"https?://\S+")
+# URLs with these words are kept whatever their length, the unsubscribe finder needs them
+KEEP_URL_PATTERN = re.compile(r"unsubscribe|opt-?out|preferences|list-manage", re.IGNORECASE)
+
+def strip_quoted_history(text: str) -> str:
+    """Drop ">"-quoted lines and everything below a reply or forward header"""
+    lines = text.splitlines()
+    kept = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        # A header in the very first line is not a quote of anything
+        if kept and (
+            any(pattern.match(stripped) for pattern in QUOTE_HEADER_PATTERNS)
+            or (
+                OUTLOOK_FROM_PATTERN.match(stripped)
+                and index + 1 < len(lines)
+                and OUTLOOK_SENT_PATTERN.match(lines[index + 1].strip())
+            )
+        ):
+            break
+        if not stripped.startswith(">"):
+            kept.append(line)
+    return "\n".join(kept)
+
+def strip_signature(text: str) -> str:
+    """Cut the text at the first signature delimiter"""
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if index > 0 and any(pattern.match(line.strip()) for pattern in SIGNATURE_PATTERNS):
+            return "\n".join(lines[:index])
+    return text
+
+def strip_long_urls(text: str, max_chars: int) -> str:
+    """Replace URLs longer than max_chars, mostly tracking links, unless they look like unsubscribe links"""
+    def replace(match: re.Match) -> str:
+        url = match.group(0)
+        if len(url) <= max_chars or KEEP_URL_PATTERN.search(url):
+            return url
+        return "[link]"
+    return URL_PATTERN.sub(replace, text)
+
+def collapse_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, which HTML-derived text is full of"""
+    text = re.sub(r"[ \t\u00a0\u200b]+", " ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+@lru_cache(maxsize=None)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # The encoding is downloaded on first use, which fails offline
+        logger.warning(f"Could not load the {TOKENIZER_ENCODING} tokenizer: {str(e)}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, estimated when no tokenizer is available"""
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to max_tokens tokens"""
+    encoding = _encoding()
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] + "..."
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + "..."
+
+def normalize_email_content(content: Optional[str], max_tokens: Optional[int] = None) -> str:
+    """
+    Reduce an email body to what the LLM needs: no quoted history, signature or
+    tracking URLs, collapsed whitespace, and at most max_tokens tokens.
+    Unsubscribe URLs cut away with a footer or by truncation are appended again
+    """
+    text = (content or "").replace("\r\n", "\n")
+    keep_urls = [url for url in URL_PATTERN.findall(text) if KEEP_URL_PATTERN.search(url)]
+    text = strip_quoted_history(text)
+    text = strip_signature(text)
+    text = strip_long_urls(text, settings.EMAIL_MAX_URL_CHARS)
+    text = collapse_whitespace(text)
+    text = truncate_to_tokens(text, max_tokens or settings.EMAIL_PROMPT_MAX_TOKENS)
+
+    missing = [url for url in dict.fromkeys(keep_urls) if url not in text]
+    if missing:
+        text += "\n\n" + "\n".join(f"Unsubscribe: {url}" for url in missing)
+    return text
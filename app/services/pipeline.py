@@ -0,0 +1,629 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from weakref import WeakKeyDictionary
+import asyncio
+import base64
+import logging
+import re
+import time
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.config import settings
+from app.models import Category, Email, GmailAccount, MessageFailure
+from app.services.ai import AIService
+from app.services import sender_memo
+from app.services.gmail import GmailService, run_gmail_call
+from app.services.llm import LLMUnavailable
+from app.services.local_classifier import local_classifier
+from app.services.normalize import normalize_email_content
+from app.services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Passed down a queue once the stage feeding it has no more pages
+_DONE = None
+
+# Enrichment slots shared by every pipeline running on an event loop
+_global_enrich_semaphores: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = WeakKeyDictionary()
+
+def global_enrich_semaphore() -> asyncio.Semaphore:
+    """Semaphore bounding AI enrichment across all accounts on the running loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _global_enrich_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.SYNC_GLOBAL_ENRICH_CONCURRENCY)
+        _global_enrich_semaphores[loop] = semaphore
+    return semaphore
+
+class KnownMessageIds:
+    """Per-account LRU of Gmail IDs already stored, so repeat sweeps skip the database"""
+
+    def __init__(self, max_per_account: int):
+        self.max_per_account = max_per_account
+        self._ids: dict[int, OrderedDict] = {}
+
+    def split(self, account_id: int, message_ids: list[str]) -> tuple[list[str], list[str]]:
+        """Split IDs into (known, unknown), refreshing the known ones"""
+        cached = self._ids.get(account_id)
+        if not cached:
+            return [], list(message_ids)
+        known, unknown = [], []
+        for message_id in message_ids:
+            if message_id in cached:
+                cached.move_to_end(message_id)
+                known.append(message_id)
+            else:
+                unknown.append(message_id)
+        return known, unknown
+
+    def add(self, account_id: int, message_ids: list[str]) -> None:
+        """Remember IDs as stored, evicting the least recently seen ones"""
+        if self.max_per_account <= 0 or not message_ids:
+            return
+        cached = self._ids.setdefault(account_id, OrderedDict())
+        for message_id in message_ids:
+            cached[message_id] = True
+            cached.move_to_end(message_id)
+        while len(cached) > self.max_per_account:
+            cached.popitem(last=False)
+
+    def discard(self, account_id: int, message_ids: list[str]) -> None:
+        """Forget IDs, so the next sweep looks them up in the database again"""
+        cached = self._ids.get(account_id)
+        if cached:
+            for message_id in message_ids:
+                cached.pop(message_id, None)
+
+def find_existing_gmail_ids(db: Session, account_id: int, message_ids: list[str]) -> set[str]:
+    """Return the subset of message_ids already stored for the account, in one query"""
+    if not message_ids:
+        return set()
+    rows = db.query(Email.gmail_id).filter(
+        Email.gmail_account_id == account_id,
+        Email.gmail_id.in_(message_ids)
+    ).all()
+    return {gmail_id for (gmail_id,) in rows}
+
+def find_unarchived_gmail_ids(db: Session, account_id: int, message_ids: list[str]) -> set[str]:
+    """Return the subset of stored message_ids whose archive step failed, in one query"""
+    if not message_ids:
+        return set()
+    rows = db.query(Email.gmail_id).filter(
+        Email.gmail_account_id == account_id,
+        Email.gmail_id.in_(message_ids),
+        Email.is_archived.is_(False)
+    ).all()
+    return {gmail_id for (gmail_id,) in rows}
+
+def mark_archived(db: Session, account_id: int, message_ids: list[str], archived: bool) -> None:
+    """Record whether stored emails were removed from the Gmail inbox; does not commit"""
+    if message_ids:
+        db.execute(
+            update(Email)
+            .where(Email.gmail_account_id == account_id, Email.gmail_id.in_(message_ids))
+            .values(is_archived=archived)
+        )
+
+def insert_emails(db: Session, emails: list[Email]) -> set[str]:
+    """
+    Insert emails in one multi-row INSERT, skipping gmail_ids that are already stored
+    Returns the gmail_ids actually inserted. Does not commit
+    """
+    if not emails:
+        return set()
+
+    # Leave out columns nobody set so their defaults still apply
+    columns = [
+        column for column in Email.__table__.columns
+        if not column.primary_key and any(getattr(email, column.key) is not None for email in emails)
+    ]
+    rows = [{column.key: getattr(email, column.key) for column in columns} for email in emails]
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = (
+        dialect.insert(Email)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["gmail_id"])
+        .returning(Email.gmail_id)
+    )
+    return set(db.execute(statement).scalars())
+
+def find_parked_gmail_ids(db: Session, account_id: int, message_ids: list[str]) -> set[str]:
+    """Return the subset of message_ids parked after failing too often, in one query"""
+    if not message_ids:
+        return set()
+    rows = db.query(MessageFailure.gmail_id).filter(
+        MessageFailure.gmail_account_id == account_id,
+        MessageFailure.gmail_id.in_(message_ids),
+        MessageFailure.parked_at.isnot(None)
+    ).all()
+    return {gmail_id for (gmail_id,) in rows}
+
+def record_failures(db: Session, account_id: int, errors: Dict[str, str]) -> set[str]:
+    """
+    Count one more failed attempt for each gmail_id in errors and park the ones
+    that reached SYNC_MESSAGE_MAX_ATTEMPTS. Returns the gmail_ids parked now.
+    Does not commit
+    """
+    if not errors:
+        return set()
+    now = datetime.utcnow()
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(MessageFailure).values([
+        {"gmail_account_id": account_id, "gmail_id": gmail_id, "attempts": 1, "error": error, "updated_at": now}
+        for gmail_id, error in errors.items()
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["gmail_account_id", "gmail_id"],
+        set_={
+            "attempts": MessageFailure.attempts + 1,
+            "error": statement.excluded.error,
+            "updated_at": statement.excluded.updated_at
+        }
+    ))
+    parked = db.execute(
+        update(MessageFailure)
+        .where(
+            MessageFailure.gmail_account_id == account_id,
+            MessageFailure.gmail_id.in_(list(errors)),
+            MessageFailure.parked_at.is_(None),
+            MessageFailure.attempts >= settings.SYNC_MESSAGE_MAX_ATTEMPTS
+        )
+        .values(parked_at=now)
+        .returning(MessageFailure.gmail_id)
+    )
+    return set(parked.scalars())
+
+def clear_failures(db: Session, account_id: int, message_ids: list[str]) -> None:
+    """Forget earlier failures of messages that have now been stored; does not commit"""
+    if message_ids:
+        db.execute(delete(MessageFailure).where(
+            MessageFailure.gmail_account_id == account_id,
+            MessageFailure.gmail_id.in_(message_ids)
+        ))
+
+async def extract_unsubscribe_link(headers: list, html_content: str = None) -> str | None:
+    """Extract unsubscribe link using List-Unsubscribe header and AI analysis"""
+    # Check List-Unsubscribe header first (most reliable)
+    unsubscribe_header = next(
+        (h['value'] for h in headers if h['name'].lower() == 'list-unsubscribe'),
+        None
+    )
+    
+    if unsubscribe_header:
+        # Extract URL from <http://example.com/unsubscribe>
+        url_match = re.search(r'<(https?://[^>]+)>', unsubscribe_header)
+        if url_match:
+            return url_match.group(1)
+        
+        # Some emails use mailto: in List-Unsubscribe
+        mailto_match = re.search(r'<mailto:([^>]+)>', unsubscribe_header)
+        if mailto_match:
+            return f"mailto:{mailto_match.group(1)}"
+
+    return None
+
+def decode_body(part: dict) -> str:
+    """
+    Decode a message part's body with the charset its Content-Type declares.
+    Bytes that do not decode are replaced, so a mislabelled body still syncs
+    """
+    data = part.get('body', {}).get('data')
+    if not data:
+        return ''
+    content_type = next(
+        (h['value'] for h in part.get('headers', []) if h['name'].lower() == 'content-type'),
+        ''
+    )
+    charset_match = re.search(r'charset="?([^";\s]+)', content_type, re.IGNORECASE)
+    raw = base64.urlsafe_b64decode(data)
+    try:
+        return raw.decode(charset_match.group(1) if charset_match else 'utf-8', errors='replace')
+    except LookupError:
+        # Unknown charset name
+        return raw.decode('utf-8', errors='replace')
+
+async def process_email_content(msg: dict) -> tuple[str, str | None, str | None]:
+    """Process email content and extract text, HTML, and unsubscribe link"""
+    text_content = None
+    html_content = None
+    
+    # Extract content from payload
+    if 'parts' in msg['payload']:
+        for part in msg['payload']['parts']:
+            if part['mimeType'] == 'text/plain':
+                text_content = decode_body(part)
+            elif part['mimeType'] == 'text/html':
+                html_content = decode_body(part)
+    else:
+        # Handle single-part messages
+        if msg['payload']['mimeType'] == 'text/plain':
+            text_content = decode_body(msg['payload'])
+        elif msg['payload']['mimeType'] == 'text/html':
+            html_content = decode_body(msg['payload'])
+    
+    # Extract unsubscribe link
+    unsubscribe_link = await extract_unsubscribe_link(
+        msg['payload']['headers'],
+        html_content or text_content
+    )
+    
+    return text_content or '', html_content, unsubscribe_link
+
+
+def parse_message(msg: dict, account: GmailAccount) -> Email:
+    """Build an (unsaved) Email from a full Gmail message"""
+    # Extract headers
+    headers = msg['payload']['headers']
+    subject = next(
+        (h['value'] for h in headers if h['name'].lower() == 'subject'),
+        'No Subject'
+    )
+    sender = next(
+        (h['value'] for h in headers if h['name'].lower() == 'from'),
+        'Unknown'
+    )
+    return Email(
+        gmail_id=msg['id'],
+        subject=subject,
+        sender=sender,
+        received_at=datetime.fromtimestamp(int(msg['internalDate'])/1000),
+        user_id=account.user_id,
+        gmail_account_id=account.id,
+        is_archived=True
+    )
+
+class SyncPage:
+    """One listed page of messages travelling through the pipeline"""
+
+    def __init__(self, message_ids: List[str]):
+        self.message_ids = message_ids
+        self.pending_ids: List[str] = []  # Not stored yet, to fetch and enrich
+        self.archive_ids: List[str] = []  # Stored, to remove from the inbox
+        self.unarchived_ids: List[str] = []  # Stored while an earlier archive step failed
+        self.messages: dict = {}
+        self.emails: List[Email] = []
+        self.failed = 0
+        self.errors: Dict[str, str] = {}  # Failures that count against a message's attempts
+
+class SyncPipeline:
+    """
+    Ingestion pipeline for one account: list -> fetch -> enrich -> persist -> archive
+    Each stage runs as its own task, joined to the next by a bounded queue, so
+    Gmail and OpenAI work on different pages at the same time and a slow stage
+    holds back the ones before it instead of buffering pages in memory.
+    Pages leave every stage in the order they were listed.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        account: GmailAccount,
+        gmail_service: GmailService,
+        ai_service: AIService,
+        known_ids: KnownMessageIds,
+        progress: Optional[Dict[str, int]] = None,
+        enrich_concurrency: Optional[int] = None,
+        enrich_rate: Optional[TokenBucket] = None,
+        rearchive_stored: bool = True,
+        list_deadline: Optional[float] = None
+    ):
+        self.db = db
+        self.account = account
+        self.gmail_service = gmail_service
+        self.ai_service = ai_service
+        self.known_ids = known_ids
+        self.queue_size = settings.SYNC_PIPELINE_QUEUE_SIZE
+        self.enrich_concurrency = enrich_concurrency or settings.SYNC_ENRICH_CONCURRENCY
+        self.enrich_rate = enrich_rate  # Optional cap on AI calls per second, e.g. for backfills
+        # Inbox searches only list mail still in the inbox, so stored messages among
+        # them missed their archive step. History listings may return mail archived since
+        self.rearchive_stored = rearchive_stored
+        # time.monotonic() after which no more pages are listed, the run ends truncated
+        self.list_deadline = list_deadline
+        self.truncated = False
+        self.next_page_token: Optional[str] = None  # Resumes the listing when truncated
+        self.stats = {"listed": 0, "fetched": 0, "enriched": 0, "synced": 0, "archived": 0, "failed": 0, "parked": 0}
+        # Counters of this run are also added to progress, which callers can watch while it runs
+        self.progress = progress
+        self._categories: List[Category] = []
+        self._listing_error: Optional[Exception] = None
+        # The Gmail client's HTTP transport is not thread-safe, so Gmail calls
+        # for this account run one at a time
+        self._gmail_lock = asyncio.Lock()
+
+    async def run(self, pages: Iterator[Tuple[List[dict], Optional[str]]]) -> Tuple[int, int]:
+        """
+        Push every listed page through the stages
+        Returns (synced_count, failed_count); re-raises a listing failure once
+        the pages listed before it have been processed
+        """
+        self._categories = self.db.query(Category).filter(Category.user_id == self.account.user_id).all()
+
+        listed = asyncio.Queue(maxsize=self.queue_size)
+        fetched = asyncio.Queue(maxsize=self.queue_size)
+        enriched = asyncio.Queue(maxsize=self.queue_size)
+        persisted = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [
+            asyncio.create_task(self._list_stage(pages, listed)),
+            asyncio.create_task(self._fetch_stage(listed, fetched)),
+            asyncio.create_task(self._enrich_stage(fetched, enriched)),
+            asyncio.create_task(self._persist_stage(enriched, persisted)),
+            asyncio.create_task(self._archive_stage(persisted)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        if self._listing_error:
+            raise self._listing_error
+        return self.stats["synced"], self.stats["failed"]
+
+    def _count(self, key: str, amount: int) -> None:
+        self.stats[key] += amount
+        if self.progress is not None:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    async def _call_gmail(self, func, *args):
+        """Run a blocking Gmail call on the Gmail thread pool"""
+        async with self._gmail_lock:
+            return await run_gmail_call(func, *args)
+
+    async def _list_stage(self, pages, output: asyncio.Queue):
+        """List pages lazily and drop messages that are already stored"""
+        try:
+            while True:
+                if self.truncated and self.list_deadline is not None and time.monotonic() >= self.list_deadline:
+                    logger.info(f"Out of time for {self.account.email}, leaving further pages for the next run")
+                    break
+                page = await self._call_gmail(next, pages, None)
+                if page is None:
+                    break
+                messages, next_page_token = page
+                self.truncated = next_page_token is not None
+                self.next_page_token = next_page_token
+                self._count("listed", len(messages))
+                logger.info(f"Found {len(messages)} new messages for {self.account.email}")
+                await output.put(self._dedupe([message["id"] for message in messages]))
+        except Exception as e:
+            logger.error(f"Error listing messages for {self.account.email}: {str(e)}")
+            self._listing_error = e
+        await output.put(_DONE)
+
+    def _dedupe(self, message_ids: List[str]) -> SyncPage:
+        """
+        Split a page into messages to ingest and messages already stored. Stored
+        ones that are still in the inbox missed their archive step last time, so
+        they are archived again together with this page. So are stored ones
+        whose archive call failed, even when listed from history. Parked
+        messages are left alone
+        """
+        page = SyncPage(message_ids)
+        known_ids, unchecked_ids = self.known_ids.split(self.account.id, message_ids)
+        existing_ids = find_existing_gmail_ids(self.db, self.account.id, unchecked_ids)
+        self.known_ids.add(self.account.id, list(existing_ids))
+        stored_ids = [message_id for message_id in unchecked_ids if message_id in existing_ids]
+        unarchived_ids = find_unarchived_gmail_ids(self.db, self.account.id, stored_ids)
+        page.unarchived_ids = [message_id for message_id in stored_ids if message_id in unarchived_ids]
+        new_ids = [message_id for message_id in unchecked_ids if message_id not in existing_ids]
+        parked_ids = find_parked_gmail_ids(self.db, self.account.id, new_ids)
+        page.pending_ids = [message_id for message_id in new_ids if message_id not in parked_ids]
+        if self.rearchive_stored:
+            page.archive_ids = known_ids + stored_ids
+        else:
+            page.archive_ids = list(page.unarchived_ids)
+        return page
+
+    async def _fetch_stage(self, input: asyncio.Queue, output: asyncio.Queue):
+        """Fetch full content for new messages in batched requests"""
+        while True:
+            page = await input.get()
+            if page is _DONE:
+                break
+            if page.pending_ids:
+                page.messages = await self._call_gmail(self.gmail_service.get_messages, page.pending_ids)
+                self._count("fetched", len(page.messages))
+            await output.put(page)
+        await output.put(_DONE)
+
+    async def _enrich_stage(self, input: asyncio.Queue, output: asyncio.Queue):
+        """
+        Parse messages and run AI enrichment on several of them at once
+        Pages with many new emails are classified in batch requests first, so
+        the per-email requests only summarize them
+        """
+        semaphore = asyncio.Semaphore(self.enrich_concurrency)
+        while True:
+            page = await input.get()
+            if page is _DONE:
+                break
+            parsed = await asyncio.gather(*(self._parse_message(page, message_id) for message_id in page.pending_ids))
+            ready = [email for email in parsed if email is not None]
+            classified = False
+            if self._categories and len(ready) >= settings.AI_CLASSIFY_BATCH_MIN_EMAILS:
+                classified = await self._classify_emails(ready)
+            emails = await asyncio.gather(
+                *(self._enrich_email(page, email, semaphore, classify=not classified) for email in ready)
+            )
+            page.emails = [email for email in emails if email is not None]
+            page.failed += len(emails) - len(page.emails) + len(parsed) - len(ready)
+            await output.put(page)
+        await output.put(_DONE)
+
+    async def _parse_message(self, page: SyncPage, message_id: str) -> Optional[Email]:
+        """Parse one fetched message, returns None when it failed"""
+        msg = page.messages.get(message_id)
+        if msg is None:
+            logger.error(f"Could not fetch message {message_id} for {self.account.email}")
+            page.errors[message_id] = "Could not fetch message"
+            return None
+        try:
+            db_email = parse_message(msg, self.account)
+
+            # Process content and extract unsubscribe link
+            content, html_content, unsubscribe_link = await process_email_content(msg)
+            db_email.content = content
+            db_email.normalized_content = normalize_email_content(content)
+            db_email.unsubscribe_link = unsubscribe_link
+            return db_email
+        except Exception as e:
+            logger.error(f"Error processing message {message_id} for {self.account.email}: {str(e)}")
+            page.errors[message_id] = str(e)
+            return None
+
+    async def _classify_emails(self, emails: List[Email]) -> bool:
+        """
+        Classify a page's emails, from sender history where it is conclusive, then
+        with the local model where it is confident and in batch requests
+        otherwise. Returns False when that failed
+        """
+        if settings.SENDER_MEMO_ENABLED:
+            pending = []
+            for email in emails:
+                category_id = sender_memo.lookup_category(self.db, email.user_id, email.sender, self._categories)
+                if category_id is None:
+                    pending.append(email)
+                else:
+                    email.category_id = category_id
+            emails = pending
+        if settings.LOCAL_CLASSIFIER_ENABLED and emails:
+            predictions = local_classifier.predict(self.db, self.account.user_id, emails, self._categories)
+            pending = []
+            for email, (category_id, margin) in zip(emails, predictions):
+                if category_id is not None and margin >= settings.LOCAL_CLASSIFIER_MIN_MARGIN:
+                    email.category_id = category_id
+                else:
+                    pending.append(email)
+            emails = pending
+        if not emails:
+            return True
+        try:
+            if self.enrich_rate is not None:
+                await asyncio.sleep(self.enrich_rate.reserve(1))
+            async with global_enrich_semaphore():
+                logger.info(f"Classifying {len(emails)} emails for {self.account.email} in batches")
+                category_ids = await self.ai_service.classify_emails(emails, self._categories)
+        except Exception as e:
+            logger.error(f"Error classifying emails for {self.account.email}: {str(e)}")
+            return False
+        for email, category_id in zip(emails, category_ids):
+            email.category_id = category_id
+        if settings.LOCAL_CLASSIFIER_ENABLED:
+            local_classifier.learn(self.account.user_id, emails)
+        return True
+
+    async def _enrich_email(
+        self,
+        page: SyncPage,
+        db_email: Email,
+        semaphore: asyncio.Semaphore,
+        classify: bool
+    ) -> Optional[Email]:
+        """Enrich one parsed email, returns None when it failed"""
+        try:
+            async with semaphore:
+                if self.enrich_rate is not None:
+                    await asyncio.sleep(self.enrich_rate.reserve(1))
+                async with global_enrich_semaphore():
+                    logger.info(f"Processing email '{db_email.subject}' with AI")
+                    await self.ai_service.enrich_email(self.db, db_email, self._categories, classify=classify)
+            self._count("enriched", 1)
+            return db_email
+        except LLMUnavailable as e:
+            # Not stored or archived, so the next sync picks the message up again.
+            # An outage is not the message's fault, so it does not count as an attempt
+            logger.warning(f"Leaving message {db_email.gmail_id} for {self.account.email} for a later sync: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Error processing message {db_email.gmail_id} for {self.account.email}: {str(e)}")
+            page.errors[db_email.gmail_id] = str(e)
+            return None
+
+    async def _persist_stage(self, input: asyncio.Queue, output: asyncio.Queue):
+        """
+        Persist each page in one transaction. Rows another sync already stored
+        are skipped, so racing syncs of the same account stay idempotent.
+        Failed messages are counted against their attempts; the ones parked now
+        no longer count as failed, so they stop holding the sync cursor back
+        """
+        while True:
+            page = await input.get()
+            if page is _DONE:
+                break
+            if page.emails:
+                try:
+                    inserted_ids = insert_emails(self.db, page.emails)
+                    clear_failures(self.db, self.account.id, [email.gmail_id for email in page.emails])
+                    self.db.commit()
+                except Exception as e:
+                    logger.error(f"Error storing {len(page.emails)} emails for {self.account.email}: {str(e)}")
+                    self.db.rollback()
+                    page.failed += len(page.emails)
+                else:
+                    persisted_ids = [email.gmail_id for email in page.emails]
+                    self._count("synced", len(inserted_ids))
+                    page.archive_ids.extend(persisted_ids)
+                    self.known_ids.add(self.account.id, persisted_ids)
+            if page.errors:
+                page.failed -= self._record_failures(page.errors)
+            self._count("failed", page.failed)
+            await output.put(page)
+        await output.put(_DONE)
+
+    def _record_failures(self, errors: Dict[str, str]) -> int:
+        """Count failed attempts of a page's messages, returns how many were parked"""
+        try:
+            parked_ids = record_failures(self.db, self.account.id, errors)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error recording failed messages for {self.account.email}: {str(e)}")
+            self.db.rollback()
+            return 0
+        if parked_ids:
+            logger.warning(
+                f"Parked {len(parked_ids)} messages for {self.account.email} after "
+                f"{settings.SYNC_MESSAGE_MAX_ATTEMPTS} failed attempts: {', '.join(sorted(parked_ids))}"
+            )
+            self._count("parked", len(parked_ids))
+        return len(parked_ids)
+
+    async def _archive_stage(self, input: asyncio.Queue):
+        """
+        Archive every persisted email of a page in one batchModify call. When
+        that fails the emails are flagged as not archived and counted as failed,
+        which holds the sync cursor so a later sync lists and archives them again
+        """
+        while True:
+            page = await input.get()
+            if page is _DONE:
+                break
+            if not page.archive_ids:
+                continue
+            try:
+                await self._call_gmail(self.gmail_service.archive_emails, page.archive_ids)
+            except Exception as e:
+                logger.error(f"Error archiving {len(page.archive_ids)} emails for {self.account.email}: {str(e)}")
+                self._count("failed", len(page.archive_ids))
+                self.known_ids.discard(self.account.id, page.archive_ids)
+                self._mark_archived(page.archive_ids, False)
+                continue
+            self._count("archived", len(page.archive_ids))
+            logger.info(f"Archived {len(page.archive_ids)} emails for {self.account.email}")
+            if page.unarchived_ids:
+                self._mark_archived(page.unarchived_ids, True)
+
+    def _mark_archived(self, message_ids: List[str], archived: bool) -> None:
+        try:
+            mark_archived(self.db, self.account.id, message_ids, archived)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error flagging archived emails for {self.account.email}: {str(e)}")
+            self.db.rollback()
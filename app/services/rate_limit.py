@@ -0,0 +1,109 @@
+from typing import Callable, Dict, Hashable, Protocol
+import logging
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Quota units charged by Gmail per call
+# https://developers.google.com/gmail/api/reference/quota
+GMAIL_QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.batchModify": 50,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+def per_process(rate: float) -> float:
+    """
+    This process's share of a project-wide rate. Buckets live in process
+    memory, so every process that calls the API takes an equal slice
+    """
+    return rate / max(1, settings.QUOTA_SHARING_PROCESSES)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at a fixed rate up to capacity
+    Callers reserve tokens up front and may take the bucket negative, which
+    makes later callers wait longer. This keeps waiters in arrival order and
+    lets requests larger than the capacity through at the average rate
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens, returns how many seconds the caller has to wait before using them"""
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+class QuotaLimiter(Protocol):
+    """Anything Gmail calls can wait on for quota"""
+
+    def acquire(self, account_id: Hashable, method: str, count: int = 1) -> float:
+        """Block until count calls of method fit in the quota, returns the time waited"""
+        ...
+
+class GmailQuotaLimiter:
+    """
+    Keeps Gmail calls within the per-user and per-project quotas
+    Every account has its own bucket and all of them share a global one;
+    a call waits until both have room for its cost in quota units
+    """
+
+    def __init__(
+        self,
+        user_rate: float,
+        project_rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.user_rate = user_rate
+        self.global_bucket = TokenBucket(project_rate, clock=clock)
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, account_id: Hashable, method: str, count: int = 1) -> float:
+        """Block until count calls of method fit in the quota, returns the time waited"""
+        units = GMAIL_QUOTA_UNITS[method] * count
+        wait = max(self._bucket(account_id).reserve(units), self.global_bucket.reserve(units))
+        if wait > 0:
+            logger.debug(f"Waiting {wait:.2f}s for {units} Gmail quota units (account {account_id})")
+            self._sleep(wait)
+        return wait
+
+    def _bucket(self, account_id: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(account_id)
+            if bucket is None:
+                bucket = self._buckets[account_id] = TokenBucket(self.user_rate, clock=self._clock)
+            return bucket
+
+class CombinedQuotaLimiter:
+    """Waits on several limiters in turn, e.g. a stricter backfill budget before the shared quota"""
+
+    def __init__(self, *limiters: QuotaLimiter):
+        self.limiters = limiters
+
+    def acquire(self, account_id: Hashable, method: str, count: int = 1) -> float:
+        return sum(limiter.acquire(account_id, method, count) for limiter in self.limiters)
+
+gmail_quota = GmailQuotaLimiter(
+    user_rate=settings.GMAIL_USER_QUOTA_UNITS_PER_SECOND,
+    project_rate=per_process(settings.GMAIL_PROJECT_QUOTA_UNITS_PER_SECOND)
+)
@@ -0,0 +1,154 @@
+from collections import Counter
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Error kinds returned by the classifiers
+AUTH = "auth"
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+NETWORK = "network"
+
+# Reasons Google uses for quota errors sent with a 403 instead of a 429
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+class RetryPolicy:
+    """
+    Retries a call on transient errors with capped exponential backoff and full jitter
+    classify maps an exception to an error kind, or None when it should not be
+    retried. Auth errors are retried once, right after on_auth_error (e.g. a token
+    refresh). A Retry-After hint from the server is waited out in full.
+    Outcomes are counted in metrics as (kind, "retried" | "gave_up")
+    """
+
+    def __init__(
+        self,
+        classify: Callable[[Exception], Optional[str]],
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        get_retry_after: Callable[[Exception], Optional[float]] = lambda e: None,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: random.Random | None = None
+    ):
+        self.classify = classify
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.get_retry_after = get_retry_after
+        self.metrics: Counter = Counter()
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt (starting at 1)"""
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        operation: str = "call",
+        on_auth_error: Optional[Callable[[], None]] = None
+    ) -> T:
+        """Run fn, retrying it according to the policy; the last error is re-raised"""
+        attempt = 0
+        refreshed = False
+        while True:
+            attempt += 1
+            try:
+                return fn()
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    raise
+
+                if kind == AUTH:
+                    if refreshed or on_auth_error is None:
+                        self._record(kind, "gave_up")
+                        raise
+                    refreshed = True
+                    self._record(kind, "retried")
+                    logger.info(f"{operation} failed with an auth error, refreshing credentials and retrying")
+                    on_auth_error()
+                    continue
+
+                self._sleep(self._retry_delay(e, kind, attempt, operation))
+
+    async def call_async(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        operation: str = "call",
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    ) -> T:
+        """Like call, for coroutine functions; there is no credential refresh, so auth errors are final"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn()
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    raise
+                if kind == AUTH:
+                    self._record(kind, "gave_up")
+                    raise
+                await sleep(self._retry_delay(e, kind, attempt, operation))
+
+    def _retry_delay(self, e: Exception, kind: str, attempt: int, operation: str) -> float:
+        """Seconds to wait before retrying after a transient error; re-raises it once attempts run out"""
+        if attempt >= self.max_attempts:
+            self._record(kind, "gave_up")
+            logger.warning(f"{operation} failed after {attempt} attempts ({kind}): {str(e)}")
+            raise e
+
+        delay = self.backoff(attempt, self.get_retry_after(e))
+        self._record(kind, "retried")
+        logger.info(f"{operation} failed ({kind}), retry {attempt} in {delay:.1f}s: {str(e)}")
+        return delay
+
+    def _record(self, kind: str, outcome: str) -> None:
+        with self._lock:
+            self.metrics[(kind, outcome)] += 1
+
+def classify_google_error(e: Exception) -> Optional[str]:
+    """Error kind of a Google API client exception, None for permanent failures"""
+    if isinstance(e, RefreshError) or "invalid_grant" in str(e):
+        return AUTH
+    if isinstance(e, HttpError):
+        status = e.resp.status
+        if status == 401:
+            return AUTH
+        if status == 429 or (status == 403 and any(reason in e.content for reason in RATE_LIMIT_REASONS)):
+            return RATE_LIMIT
+        if status >= 500:
+            return SERVER
+        return None
+    if isinstance(e, (TransportError, httplib2.HttpLib2Error, ConnectionError, TimeoutError)):
+        return NETWORK
+    return None
+
+def google_retry_after(e: Exception) -> Optional[float]:
+    """Seconds from a Retry-After response header, if the server sent one"""
+    if not isinstance(e, HttpError):
+        return None
+    value = e.resp.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None  # HTTP-date form, fall back to our own backoff
@@ -0,0 +1,47 @@
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SyncScheduler:
+    """
+    Adaptive per-account poll intervals
+    Accounts that receive mail are polled more often, idle ones slowly back off
+    towards max_interval and failing ones back off exponentially. The resulting
+    state is stored on the account (next_sync_at, sync_interval_seconds,
+    sync_failures) so every worker replica schedules it the same way
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        initial_interval: float,
+        max_error_backoff: float
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.max_error_backoff = max_error_backoff
+
+    def next_interval(self, interval: float, new_messages: int) -> float:
+        """Halve the interval when mail arrived, grow it by half when the account was idle"""
+        if new_messages > 0:
+            interval = interval / 2
+        else:
+            interval = interval * 1.5
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def after_success(self, interval: Optional[float], new_messages: int) -> Tuple[float, float]:
+        """Returns (new interval, seconds until the next sync) after a successful sync"""
+        interval = self.next_interval(interval or self.initial_interval, new_messages)
+        return interval, interval
+
+    def after_failure(self, interval: Optional[float], failures: int) -> Tuple[float, float]:
+        """
+        Returns (interval, seconds until the next sync) after failures consecutive
+        failed syncs; the interval itself is kept for when the account recovers
+        """
+        interval = interval or self.initial_interval
+        backoff = min(self.max_error_backoff, interval * (2 ** failures))
+        return interval, backoff
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional
+from collections import defaultdict
+from datetime import datetime
+from email.utils import parseaddr
+import logging
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.config import settings
+from app.models import Category, SenderCategory
+
+logger = logging.getLogger(__name__)
+
+# Domains shared by unrelated people; only their individual addresses are remembered
+PUBLIC_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "outlook.com", "hotmail.com",
+    "live.com", "icloud.com", "me.com", "aol.com", "proton.me", "protonmail.com"
+}
+
+def sender_keys(sender: Optional[str]) -> List[str]:
+    """Memo keys for a From header, most specific first: the address, then "@domain" """
+    address = parseaddr(sender or "")[1].strip().lower()
+    if "@" not in address:
+        return []
+    domain = address.rsplit("@", 1)[1]
+    if not domain or domain in PUBLIC_DOMAINS:
+        return [address]
+    return [address, f"@{domain}"]
+
+def lookup_category(db: Session, user_id: int, sender: Optional[str], categories: List[Category]) -> Optional[int]:
+    """
+    Return the category the user's mail from sender consistently landed in, or
+    None when it has not been seen often enough or went to different categories.
+    The address decides when it has any history, otherwise its domain does
+    """
+    keys = sender_keys(sender)
+    if not keys:
+        return None
+
+    counts: Dict[str, Dict[int, int]] = defaultdict(dict)
+    rows = db.query(SenderCategory).filter(
+        SenderCategory.user_id == user_id,
+        SenderCategory.sender_key.in_(keys)
+    ).all()
+    for row in rows:
+        counts[row.sender_key][row.category_id] = row.count
+
+    category_ids = {cat.id for cat in categories}
+    for key in keys:
+        if not counts[key]:
+            continue
+        category_id, count = max(counts[key].items(), key=lambda item: item[1])
+        total = sum(counts[key].values())
+        if (
+            category_id in category_ids
+            and count >= settings.SENDER_MEMO_MIN_COUNT
+            and count / total >= settings.SENDER_MEMO_MIN_SHARE
+        ):
+            logger.info(f"Classified mail from {key} into category {category_id} from sender history")
+            return category_id
+        return None
+    return None
+
+def record_category(db: Session, user_id: int, sender: Optional[str], category_id: int, weight: int = 1) -> None:
+    """Count mail from sender as landing in category_id; does not commit"""
+    keys = sender_keys(sender)
+    if not keys:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(SenderCategory).values([
+        {"user_id": user_id, "sender_key": key, "category_id": category_id, "count": weight, "updated_at": datetime.utcnow()}
+        for key in keys
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["user_id", "sender_key", "category_id"],
+        set_={"count": SenderCategory.count + statement.excluded.count, "updated_at": statement.excluded.updated_at}
+    ))
+
+def invalidate(db: Session, user_id: int, category_id: Optional[int] = None) -> None:
+    """Forget a user's sender history, for one category or all of them; does not commit"""
+    statement = delete(SenderCategory).where(SenderCategory.user_id == user_id)
+    if category_id is not None:
+        statement = statement.where(SenderCategory.category_id == category_id)
+    db.execute(statement)
@@ -0,0 +1,84 @@
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+import asyncio
+import logging
+
+from app.services.leases import AccountLeases
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SyncInProgress(Exception):
+    """Raised when another process holds the account's lease"""
+    pass
+
+class SingleFlight:
+    """
+    At most one sync per account at a time
+    Within a process, callers asking for an account that is already syncing
+    join the running sync of the same kind and get its result. Across processes the account
+    lease is the lock: it is held (and renewed) for the whole sync, and a
+    caller that cannot take it gets SyncInProgress
+    """
+
+    def __init__(self, leases: AccountLeases, renew_interval: float):
+        self.leases = leases
+        self.renew_interval = renew_interval
+        self._flights: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    def in_flight(self, account_id: int, kind: str = "sync") -> bool:
+        """Whether this process is currently syncing the account"""
+        return (kind, account_id) in self._flights
+
+    async def run(self, account_id: int, fn: Callable[[], Awaitable[T]], leased: bool = False, kind: str = "sync") -> T:
+        """
+        Run fn under the account's lease, or join the sync of that kind already running here
+        Pass leased=True when the caller has already claimed the lease
+        """
+        key = (kind, account_id)
+        flight = self._flights.get(key)
+        if flight is None:
+            # Registered before the first await so concurrent callers always find it
+            flight = asyncio.ensure_future(self._fly(account_id, fn, leased))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            logger.info(f"Account {account_id} is already syncing, joining the running sync")
+        # A caller that goes away (e.g. a closed request) must not cancel the sync for the others
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Tuple[str, int], flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            flight.exception()  # Mark as retrieved when nobody is left waiting for it
+
+    async def _fly(self, account_id: int, fn: Callable[[], Awaitable[T]], leased: bool) -> T:
+        if not leased and not await asyncio.to_thread(self.leases.claim, account_id):
+            raise SyncInProgress(f"Account {account_id} is already being synced by another process")
+
+        work = asyncio.ensure_future(fn())
+        heartbeat = asyncio.ensure_future(self._heartbeat(account_id, work))
+        try:
+            return await work
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled():
+                raise SyncInProgress(f"Lease on account {account_id} was taken over by another process") from None
+            raise
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(self.leases.release, account_id)
+
+    async def _heartbeat(self, account_id: int, work: asyncio.Future) -> None:
+        """Renew the lease while the sync runs, cancel it if the lease was lost"""
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                renewed = await asyncio.to_thread(self.leases.renew, [account_id])
+            except Exception as e:
+                logger.error(f"Error renewing the lease on account {account_id}: {str(e)}")
+                continue
+            if account_id not in renewed:
+                logger.warning(f"Lost the lease on account {account_id}, cancelling its sync")
+                work.cancel()
+                return
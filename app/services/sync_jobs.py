@@ -0,0 +1,234 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.models import GmailAccount, SyncJob
+from app.services.single_flight import SyncInProgress
+
+logger = logging.getLogger(__name__)
+
+# Job kinds
+SYNC = "sync"
+BACKFILL = "backfill"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+class JobDeferred(Exception):
+    """
+    Raised by a job that cannot make progress right now, e.g. during an OpenAI
+    outage. The job is queued again after a backoff instead of failing
+    """
+    pass
+
+# Pipeline counters mirrored on the job row
+PROGRESS_FIELDS = ("listed", "fetched", "enriched", "synced", "archived", "failed")
+
+class SharedProgress(dict):
+    """
+    Counters of one running sync that are also added to the progress of every
+    job attached to it, so a job joining a sync already in flight reports what
+    that sync does instead of zeros
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.targets: List[Dict[str, int]] = []
+
+    def attach(self, target: Dict[str, int]) -> None:
+        """Add the counters so far to target and keep it updated"""
+        for key, value in self.items():
+            target[key] = target.get(key, 0) + value
+        self.targets.append(target)
+
+    def __setitem__(self, key: str, value: int) -> None:
+        delta = value - self.get(key, 0)
+        super().__setitem__(key, value)
+        for target in self.targets:
+            target[key] = target.get(key, 0) + delta
+
+def enqueue_sync_job(db: Session, account: GmailAccount, kind: str = SYNC, **values) -> SyncJob:
+    """
+    Queue a job for the account, or return the one of the same kind that is
+    already queued or running. values are extra columns of a new job
+    """
+    job = db.query(SyncJob).filter(
+        SyncJob.gmail_account_id == account.id,
+        SyncJob.kind == kind,
+        SyncJob.status.in_(ACTIVE_STATUSES)
+    ).order_by(SyncJob.id).first()
+    if job:
+        return job
+
+    job = SyncJob(kind=kind, status=QUEUED, user_id=account.user_id, gmail_account_id=account.id, **values)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+class SyncJobRunner:
+    """
+    Runs queued sync jobs in the worker
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED like account leases.
+    While a job runs its progress is written back every progress_interval,
+    which also serves as its heartbeat: running jobs not updated for
+    stale_after seconds belonged to a crashed worker and are queued again.
+    Deferred jobs wait retry_base_delay, doubled per retry up to retry_max_delay,
+    and fail after max_retries deferrals in a row. Jobs whose account is busy
+    with another sync wait busy_delay before they are claimed again
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        owner: str,
+        stale_after: float,
+        progress_interval: float,
+        retry_base_delay: float = 60,
+        retry_max_delay: float = 3600,
+        max_retries: int = 10,
+        busy_delay: float = 5
+    ):
+        self.session_factory = session_factory
+        self.owner = owner
+        self.stale_after = timedelta(seconds=stale_after)
+        self.progress_interval = progress_interval
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_retries = max_retries
+        self.busy_delay = busy_delay
+
+    def claim(self, limit: int, kind: str = SYNC, now: Optional[datetime] = None) -> List[Tuple[int, int]]:
+        """Start up to limit queued jobs of a kind, oldest first; returns (job ID, account ID) pairs"""
+        if limit <= 0:
+            return []
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        try:
+            # Jobs of crashed workers go back to the queue first
+            db.execute(
+                update(SyncJob)
+                .where(SyncJob.status == RUNNING, SyncJob.updated_at < now - self.stale_after)
+                .values(status=QUEUED, worker=None, started_at=None, updated_at=now)
+            )
+            jobs = (
+                db.query(SyncJob.id, SyncJob.gmail_account_id)
+                .filter(
+                    SyncJob.status == QUEUED,
+                    SyncJob.kind == kind,
+                    or_(SyncJob.run_after.is_(None), SyncJob.run_after <= now)
+                )
+                .order_by(SyncJob.created_at, SyncJob.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if jobs:
+                db.execute(
+                    update(SyncJob)
+                    .where(SyncJob.id.in_([job_id for job_id, _ in jobs]))
+                    .values(status=RUNNING, worker=self.owner, started_at=now, updated_at=now)
+                )
+            db.commit()
+            return [(job_id, account_id) for job_id, account_id in jobs]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def load_progress(self, job_id: int) -> Dict[str, int]:
+        """Counters saved by earlier runs of the job"""
+        db = self.session_factory()
+        try:
+            job = db.get(SyncJob, job_id)
+            return {field: getattr(job, field) or 0 for field in PROGRESS_FIELDS}
+        finally:
+            db.close()
+
+    def save(self, job_id: int, progress: Dict[str, int], **values) -> None:
+        """Write progress counters and any other columns to the job"""
+        counters = {field: progress[field] for field in PROGRESS_FIELDS if field in progress}
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(SyncJob)
+                .where(SyncJob.id == job_id)
+                .values(**counters, **values, updated_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def defer(self, job_id: int, progress: Dict[str, int], error: str) -> None:
+        """Queue a job again after its backoff, or fail it once it ran out of retries"""
+        db = self.session_factory()
+        try:
+            retries = (db.get(SyncJob, job_id).retries or 0) + 1
+        finally:
+            db.close()
+        if retries > self.max_retries:
+            logger.error(f"Sync job {job_id} made no progress in {self.max_retries} retries: {error}")
+            self.save(job_id, progress, status=FAILED, error=error, retries=retries, finished_at=datetime.utcnow())
+            return
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (retries - 1))
+        logger.warning(f"Retrying sync job {job_id} in {delay:.0f}s: {error}")
+        self.save(
+            job_id, progress,
+            status=QUEUED, worker=None, started_at=None, error=error,
+            retries=retries, run_after=datetime.utcnow() + timedelta(seconds=delay)
+        )
+
+    async def run(self, job_id: int, account_id: int, sync: Callable[[int, Dict[str, int]], Awaitable]) -> None:
+        """
+        Run a claimed job with sync(account_id, progress) and record how it ended
+        progress starts from the job's saved counters. A sync returning False has
+        more work left (e.g. a backfill that yields) and the job is queued again;
+        one raising JobDeferred is queued again after a backoff
+        """
+        progress = await asyncio.to_thread(self.load_progress, job_id)
+        reporter = asyncio.ensure_future(self._report(job_id, progress))
+        try:
+            try:
+                result = await sync(account_id, progress)
+            finally:
+                reporter.cancel()
+        except SyncInProgress as e:
+            # Another worker holds the account, try again once it is done
+            logger.info(f"Requeueing sync job {job_id}: {str(e)}")
+            await asyncio.to_thread(
+                self.save, job_id, progress,
+                status=QUEUED, worker=None, started_at=None,
+                run_after=datetime.utcnow() + timedelta(seconds=self.busy_delay)
+            )
+        except JobDeferred as e:
+            await asyncio.to_thread(self.defer, job_id, progress, str(e))
+        except Exception as e:
+            logger.error(f"Sync job {job_id} failed: {str(e)}")
+            await asyncio.to_thread(self.save, job_id, progress, status=FAILED, error=str(e), finished_at=datetime.utcnow())
+        else:
+            if result is False:
+                await asyncio.to_thread(
+                    self.save, job_id, progress, status=QUEUED, worker=None, error=None, retries=0, run_after=None
+                )
+            else:
+                await asyncio.to_thread(self.save, job_id, progress, status=SUCCEEDED, finished_at=datetime.utcnow())
+
+    async def _report(self, job_id: int, progress: Dict[str, int]) -> None:
+        """Periodically copy the pipeline's counters to the job"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await asyncio.to_thread(self.save, job_id, dict(progress))
+            except Exception as e:
+                logger.error(f"Error saving progress of sync job {job_id}: {str(e)}")
@@ -1,7 +1,6 @@
 from typing import Optional, List
 import asyncio
 import json
-from openai import AsyncOpenAI
 from browser_use import Agent
 from browser_use.llm import ChatOpenAI
 import logging
@@ -10,6 +9,7 @@ from collections import deque
 
 from app.core.config import settings
 from app.models import Email
+from app.services.llm import get_llm_gateway
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
@@ -33,8 +33,8 @@ def get_latest_agent_logs() -> List[str]:
 
 class UnsubscribeService:
     def __init__(self):
-        """Initialize OpenAI client"""
-        self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        """Use the process-wide LLM gateway for OpenAI calls"""
+        self.llm = get_llm_gateway()
 
     async def unsubscribe_from_url(self, db: Session, email_id: int, url: str) -> bool:
         """
@@ -99,7 +99,8 @@ class UnsubscribeService:
             - reason: string explaining why you made this determination
             """
 
-            validation_response = await self.openai_client.chat.completions.create(
+            validation_response = await self.llm.create(
+                "validate_unsubscribe",
                 model="gpt-4o",
                 messages=[{"role": "user", "content": validation_prompt}],
                 response_format={"type": "json_object"}
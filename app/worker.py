@@ -1,17 +1,24 @@
 import asyncio
 import sys
+import time
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import logging
-import re
-import base64
 
 from app.core.config import settings
-from app.models import GmailAccount, Email
-from app.services.gmail import GmailService
+from app.models import GmailAccount, SyncJob
+from app.services.gmail import GmailService, HistoryExpiredError, run_gmail_call
 from app.services.ai import AIService
+from app.services.ai_cache import ai_result_cache
+from app.services.credentials import credential_manager
+from app.services.leases import AccountLeases, worker_id
+from app.services.pipeline import KnownMessageIds, SyncPipeline
+from app.services.scheduler import SyncScheduler
+from app.services.single_flight import SingleFlight
+from app.services.rate_limit import CombinedQuotaLimiter, GmailQuotaLimiter, TokenBucket, gmail_quota
+from app.services.sync_jobs import BACKFILL, JobDeferred, SharedProgress, SyncJobRunner
 
 # Configure logging
 logging.basicConfig(
@@ -28,182 +35,309 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Initialize AI service
 ai_service = AIService()
 
-async def extract_unsubscribe_link(headers: list, html_content: str = None) -> str | None:
-    """Extract unsubscribe link using List-Unsubscribe header and AI analysis"""
-    # Check List-Unsubscribe header first (most reliable)
-    unsubscribe_header = next(
-        (h['value'] for h in headers if h['name'].lower() == 'list-unsubscribe'),
-        None
-    )
-    
-    if unsubscribe_header:
-        # Extract URL from <http://example.com/unsubscribe>
-        url_match = re.search(r'<(https?://[^>]+)>', unsubscribe_header)
-        if url_match:
-            return url_match.group(1)
-        
-        # Some emails use mailto: in List-Unsubscribe
-        mailto_match = re.search(r'<mailto:([^>]+)>', unsubscribe_header)
-        if mailto_match:
-            return f"mailto:{mailto_match.group(1)}"
+# Gmail IDs already stored, shared by every sync in this process
+known_message_ids = KnownMessageIds(settings.SYNC_KNOWN_ID_CACHE_SIZE)
 
-    return None
+# Adaptive per-account poll intervals
+scheduler = SyncScheduler(
+    min_interval=settings.SYNC_MIN_INTERVAL_SECONDS,
+    max_interval=settings.SYNC_MAX_INTERVAL_SECONDS,
+    initial_interval=settings.SYNC_INITIAL_INTERVAL_SECONDS,
+    max_error_backoff=settings.SYNC_ERROR_BACKOFF_MAX_SECONDS
+)
 
-async def process_email_content(msg: dict) -> tuple[str, str | None, str | None]:
-    """Process email content and extract text, HTML, and unsubscribe link"""
-    text_content = None
-    html_content = None
-    
-    # Extract content from payload
-    if 'parts' in msg['payload']:
-        for part in msg['payload']['parts']:
-            if part['mimeType'] == 'text/plain':
-                text_content = base64.urlsafe_b64decode(part['body']['data']).decode()
-            elif part['mimeType'] == 'text/html':
-                html_content = base64.urlsafe_b64decode(part['body']['data']).decode()
-    else:
-        # Handle single-part messages
-        if msg['payload']['mimeType'] == 'text/plain':
-            text_content = base64.urlsafe_b64decode(msg['payload']['body']['data']).decode()
-        elif msg['payload']['mimeType'] == 'text/html':
-            html_content = base64.urlsafe_b64decode(msg['payload']['body']['data']).decode()
-    
-    # Extract unsubscribe link
-    unsubscribe_link = await extract_unsubscribe_link(
-        msg['payload']['headers'],
-        html_content or text_content
-    )
-    
-    return text_content or '', html_content, unsubscribe_link
+# Account leases of this process; every sync, from the worker loop or the API, runs under one
+leases = AccountLeases(lambda: SessionLocal(), worker_id(), settings.SYNC_LEASE_SECONDS)
+account_syncs = SingleFlight(leases, settings.SYNC_LEASE_RENEW_SECONDS)
+# Counters of the syncs running in this process, shared by the jobs waiting on them
+sync_progress: dict[int, SharedProgress] = {}
+
+# Backfills get their own Gmail and AI budgets on top of the shared ones
+backfill_gmail_quota = CombinedQuotaLimiter(
+    GmailQuotaLimiter(
+        user_rate=settings.BACKFILL_GMAIL_USER_QUOTA_UNITS_PER_SECOND,
+        project_rate=settings.BACKFILL_GMAIL_PROJECT_QUOTA_UNITS_PER_SECOND
+    ),
+    gmail_quota
+)
+backfill_ai_rate = TokenBucket(settings.BACKFILL_AI_EMAILS_PER_MINUTE / 60, capacity=1)
+
+# Sync jobs queued through the API
+job_runner = SyncJobRunner(
+    lambda: SessionLocal(),
+    leases.owner,
+    stale_after=settings.SYNC_LEASE_SECONDS,
+    progress_interval=settings.SYNC_JOB_PROGRESS_SECONDS,
+    retry_base_delay=settings.SYNC_JOB_RETRY_BASE_SECONDS,
+    retry_max_delay=settings.SYNC_JOB_RETRY_MAX_SECONDS,
+    max_retries=settings.SYNC_JOB_MAX_RETRIES,
+    busy_delay=settings.SYNC_POLL_SECONDS
+)
 
-async def sync_account(db: Session, account: GmailAccount):
-    """Sync a single Gmail account"""
+async def sync_account(db: Session, account: GmailAccount, progress: dict | None = None) -> int:
+    """
+    Sync a single Gmail account, returns the number of new emails stored
+    Raises when the account could not be listed so callers can back off.
+    progress, if given, is updated with the pipeline's counters as it runs
+    """
     try:
         logger.info(f"Starting sync for {account.email}")
-        gmail_service = GmailService(account, db)
-        synced_count = 0
+        # Gmail client calls block, so run them on the Gmail thread pool to let accounts overlap
+        gmail_service = await run_gmail_call(GmailService, account, db)
         
         # Always update last sync time at the start
         current_time = datetime.utcnow()
         
         # Fetch emails since last sync time or last 24 hours if no sync
         since_time = account.last_sync_time or (current_time - timedelta(days=1))
+        pages = None
+        next_history_id = None
+        from_history = False
         try:
-            new_messages = gmail_service.list_unarchived_emails(since=since_time)
-            logger.info(f"Found {len(new_messages)} new messages for {account.email}")
+            if settings.GMAIL_HISTORY_SYNC and account.history_id:
+                # Incremental sync: only messages added since the stored cursor
+                try:
+                    new_messages, next_history_id = await run_gmail_call(
+                        gmail_service.list_history_messages, account.history_id
+                    )
+                    pages = iter([(new_messages, None)])
+                    from_history = True
+                except HistoryExpiredError:
+                    logger.warning(f"History cursor expired for {account.email}, falling back to a full search")
+
+            if pages is None:
+                # Read the cursor before searching so nothing that arrives in between is lost
+                if settings.GMAIL_HISTORY_SYNC:
+                    next_history_id = await run_gmail_call(gmail_service.get_history_id)
+                pages = gmail_service.iter_unarchived_email_pages(
+                    since=since_time,
+                    max_messages=settings.GMAIL_SYNC_MAX_MESSAGES
+                )
         except Exception as e:
             logger.error(f"Error listing messages for {account.email}: {str(e)}")
-            new_messages = []
-        
-        for message in new_messages:
-            try:
-                # Check if email already exists
-                existing_email = db.query(Email).filter(
-                    Email.gmail_id == message["id"],
-                    Email.gmail_account_id == account.id
-                ).first()
-
-                if not existing_email:
-                    # Get full message content
-                    msg = gmail_service.get_message(message["id"])
-                    
-                    # Extract headers
-                    headers = msg['payload']['headers']
-                    subject = next(
-                        (h['value'] for h in headers if h['name'].lower() == 'subject'),
-                        'No Subject'
-                    )
-                    sender = next(
-                        (h['value'] for h in headers if h['name'].lower() == 'from'),
-                        'Unknown'
-                    )
-                    
-                    # Process content and extract unsubscribe link
-                    content, html_content, unsubscribe_link = await process_email_content(msg)
-                    
-                    # Create new email record
-                    db_email = Email(
-                        gmail_id=message["id"],
-                        subject=subject,
-                        sender=sender,
-                        content=content,
-                        received_at=datetime.fromtimestamp(int(msg['internalDate'])/1000),
-                        user_id=account.user_id,
-                        gmail_account_id=account.id,
-                        is_archived=True,
-                        unsubscribe_link=unsubscribe_link
-                    )
-                    
-                    # Process with AI before committing
-                    logger.info(f"Processing email '{subject}' with AI")
-                    await ai_service.process_new_email(db, db_email)
-                    
-                    # Now commit the email with all its data
-                    db.add(db_email)
-                    db.commit()
-                    db.refresh(db_email)
-                    
-                    # Archive email in Gmail
-                    gmail_service.archive_email(message["id"])
-                    synced_count += 1
-                    
-                    # Log the category assignment
-                    if db_email.category_id:
-                        category = db.query(Category).filter(Category.id == db_email.category_id).first()
-                        logger.info(f"Email '{subject}' assigned to category: {category.name if category else 'Unknown'}")
-                    else:
-                        logger.warning(f"Email '{subject}' was not assigned to any category")
-                    
-            except Exception as e:
-                logger.error(f"Error processing message {message['id']} for {account.email}: {str(e)}")
-                db.rollback()
-                continue
+            raise
+
+        # Pages are listed lazily and flow through the staged pipeline, so the
+        # first one is being processed while later ones are still being listed
+        pipeline = SyncPipeline(
+            db, account, gmail_service, ai_service, known_message_ids,
+            progress=progress,
+            rearchive_stored=not from_history
+        )
+        synced_count, failed_count = await pipeline.run(pages)
+        truncated = pipeline.truncated
+
+        if truncated:
+            # The per-sync cap was hit. Processed mail has left the inbox, so
+            # the next run picks up the rest with the same search
+            logger.info(f"Reached the {settings.GMAIL_SYNC_MAX_MESSAGES} message cap for {account.email}, resuming next run")
         
-        # Update last sync time regardless of whether we found/processed any emails
-        account.last_sync_time = current_time
-        db.add(account)
-        db.commit()
+        # Only move the sync cursors forward when every message made it, otherwise
+        # the failed ones are picked up again on the next run. Messages that keep
+        # failing get parked and no longer count, so they cannot hold it forever
+        if failed_count:
+            logger.warning(f"{failed_count} messages failed for {account.email}, keeping sync cursor")
+        elif not truncated:
+            account.last_sync_time = current_time
+            if next_history_id:
+                account.history_id = next_history_id
+            db.add(account)
+            db.commit()
         
         logger.info(f"Successfully synced and processed {synced_count} new emails for {account.email}")
+        return synced_count
     
     except Exception as e:
         logger.error(f"Error syncing {account.email}: {str(e)}")
         db.rollback()
+        raise
+
+def save_schedule(db: Session, account: GmailAccount, interval: float, delay: float, failures: int):
+    """Store when the account is due next and the state its interval adapts from"""
+    account.next_sync_at = datetime.utcnow() + timedelta(seconds=delay)
+    account.sync_interval_seconds = interval
+    account.sync_failures = failures
+    db.add(account)
+    db.commit()
 
-async def sync_all_accounts():
-    """Sync all Gmail accounts"""
-    db = None
+async def sync_and_reschedule(account_id: int, progress: dict | None = None) -> int:
+    """
+    Sync one account with its own DB session and reschedule it based on the outcome
+    Returns the number of new emails stored, failures are re-raised
+    """
+    db = SessionLocal()
     try:
-        db = SessionLocal()
-        accounts = db.query(GmailAccount).all()
-        logger.info(f"Found {len(accounts)} accounts to sync")
-        
-        for account in accounts:
+        account = db.query(GmailAccount).filter(GmailAccount.id == account_id).first()
+        if not account:
+            logger.warning(f"Gmail account {account_id} no longer exists, skipping sync")
+            return 0
+        interval = account.sync_interval_seconds
+        failures = account.sync_failures or 0
+        try:
+            synced_count = await sync_account(db, account, progress=progress)
+        except Exception:
+            failures += 1
+            interval, delay = scheduler.after_failure(interval, failures)
+            logger.info(f"Account {account_id} failed {failures} time(s) in a row, retrying in {delay:.0f}s")
+            save_schedule(db, account, interval, delay, failures)
+            raise
+        interval, delay = scheduler.after_success(interval, synced_count)
+        save_schedule(db, account, interval, delay, 0)
+        return synced_count
+    finally:
+        db.close()
+
+async def sync_account_once(account_id: int, leased: bool = False, progress: dict | None = None) -> int:
+    """
+    Sync an account unless a sync of it is already running
+    Callers in this process join the running sync and share its result and its
+    progress; SyncInProgress is raised when another process holds the account's lease
+    """
+    shared = sync_progress.get(account_id) if account_syncs.in_flight(account_id) else None
+    if shared is None:
+        shared = sync_progress[account_id] = SharedProgress()
+    if progress is not None:
+        shared.attach(progress)
+    try:
+        return await account_syncs.run(account_id, lambda: sync_and_reschedule(account_id, shared), leased=leased)
+    finally:
+        if sync_progress.get(account_id) is shared and not account_syncs.in_flight(account_id):
+            del sync_progress[account_id]
+
+async def backfill_account(job_id: int, account_id: int, progress: dict) -> bool:
+    """
+    Import older mail for a backfill job, walking back one date window at a time
+    Stops after BACKFILL_MESSAGES_PER_RUN messages or BACKFILL_MAX_RUN_SECONDS,
+    whichever comes first, so live syncs of the account get their turn; the
+    next run resumes the window from the search's page token. The job's cursor
+    only moves past a window once all of its messages made it; messages that
+    keep failing get parked by the pipeline. Returns True once the whole range
+    has been imported and raises JobDeferred when a run could not import
+    anything, so the job retries after a backoff
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(SyncJob).filter(SyncJob.id == job_id).first()
+        account = db.query(GmailAccount).filter(GmailAccount.id == account_id).first()
+        if not job or not account:
+            logger.warning(f"Backfill job {job_id} or its account no longer exists")
+            return True
+
+        gmail_service = await run_gmail_call(GmailService, account, db, backfill_gmail_quota)
+        window = timedelta(days=settings.BACKFILL_WINDOW_DAYS)
+        budget = settings.BACKFILL_MESSAGES_PER_RUN
+        deadline = time.monotonic() + settings.BACKFILL_MAX_RUN_SECONDS
+        while job.cursor > job.backfill_until and budget > 0:
+            window_start = max(job.backfill_until, job.cursor - window)
+            pages = gmail_service.iter_unarchived_email_pages(
+                since=window_start,
+                before=job.cursor,
+                page_size=settings.BACKFILL_LIST_PAGE_SIZE,
+                max_messages=budget,
+                page_token=job.page_token
+            )
+            pipeline = SyncPipeline(
+                db, account, gmail_service, ai_service, known_message_ids,
+                progress=progress,
+                enrich_concurrency=settings.BACKFILL_ENRICH_CONCURRENCY,
+                enrich_rate=backfill_ai_rate,
+                list_deadline=deadline
+            )
             try:
-                await sync_account(db, account)
+                synced_count, failed_count = await pipeline.run(pages)
             except Exception as e:
-                logger.error(f"Failed to sync account {account.email}: {str(e)}")
-                # Continue with next account even if this one fails
-                continue
-            
-    except Exception as e:
-        logger.error(f"Error in sync_all_accounts: {str(e)}")
+                raise JobDeferred(f"Listing mail before {job.cursor} failed: {str(e)}") from e
+            budget -= pipeline.stats["listed"]
+
+            if failed_count:
+                # Search the window from its start again, failed messages are still in it
+                job.page_token = None
+                db.commit()
+                if not synced_count:
+                    raise JobDeferred(f"{failed_count} messages before {job.cursor} failed")
+                logger.warning(f"{failed_count} messages failed in a backfill window for {account.email}, retrying it next run")
+                return False
+            if pipeline.truncated:
+                job.page_token = pipeline.next_page_token
+                db.commit()
+                return False
+
+            job.cursor = window_start
+            job.page_token = None
+            db.commit()
+            logger.info(f"Backfilled {account.email} back to {window_start:%Y-%m-%d}")
+            if time.monotonic() >= deadline:
+                break
+
+        return job.cursor <= job.backfill_until
     finally:
-        if db:
-            db.close()
+        db.close()
+
+async def run_sync_job(job_id: int, account_id: int):
+    """Run a queued sync job, reporting its progress on the job row"""
+    await job_runner.run(job_id, account_id, lambda account_id, progress: sync_account_once(account_id, progress=progress))
+
+async def run_backfill_job(job_id: int, account_id: int):
+    """Run the next part of a backfill job; it holds the account's lease, so live syncs wait for it"""
+    await job_runner.run(job_id, account_id, lambda account_id, progress: account_syncs.run(
+        account_id, lambda: backfill_account(job_id, account_id, progress), kind=BACKFILL
+    ))
+
+async def run_leased_sync(account_id: int):
+    """Sync an account this worker has claimed, failures only affect its schedule"""
+    try:
+        await sync_account_once(account_id, leased=True)
+    except Exception as e:
+        logger.error(f"Failed to sync account {account_id}: {str(e)}")
 
 async def main():
     """Main worker loop"""
-    logger.info("Starting email sync worker (1-minute intervals)")
+    logger.info(f"Starting email sync worker {leases.owner} (leased per-account schedule)")
+    running = set()
+    backfills = set()
+
+    def start(coro, *groups):
+        task = asyncio.create_task(coro)
+        for tasks in (running, *groups):
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    # Keep access tokens fresh in the background so syncs never wait on a refresh
+    credential_refresher = asyncio.create_task(
+        credential_manager.run(SessionLocal, settings.GMAIL_TOKEN_REFRESH_INTERVAL_SECONDS)
+    )
+    # Drop expired cached AI results
+    ai_cache_evictor = asyncio.create_task(
+        ai_result_cache.run(SessionLocal, settings.AI_CACHE_EVICT_INTERVAL_SECONDS)
+    )
     
     while True:
         try:
-            await sync_all_accounts()
+            # Jobs requested through the API go first, scheduled accounts fill the
+            # remaining slots; other replicas skip rows we hold
+            free_slots = settings.SYNC_MAX_CONCURRENT_ACCOUNTS - len(running)
+            for job_id, account_id in await asyncio.to_thread(job_runner.claim, free_slots):
+                start(run_sync_job(job_id, account_id))
+
+            free_slots = settings.SYNC_MAX_CONCURRENT_ACCOUNTS - len(running)
+            for account_id in await asyncio.to_thread(leases.claim_due, free_slots):
+                start(run_leased_sync(account_id))
+
+            # Backfills only use slots live syncs left free, and only a few of them
+            free_slots = min(
+                settings.SYNC_MAX_CONCURRENT_ACCOUNTS - len(running),
+                settings.BACKFILL_MAX_CONCURRENT_JOBS - len(backfills)
+            )
+            for job_id, account_id in await asyncio.to_thread(job_runner.claim, free_slots, BACKFILL):
+                start(run_backfill_job(job_id, account_id), backfills)
         except Exception as e:
             logger.error(f"Error in main loop: {str(e)}")
         
-        # Wait for 1 minute before next sync
-        await asyncio.sleep(60)  # 60 seconds = 1 minute
+        # Poll for due accounts again after a while, or as soon as a sync finishes
+        if running:
+            await asyncio.wait(running, timeout=settings.SYNC_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(settings.SYNC_POLL_SECONDS)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
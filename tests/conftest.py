@@ -15,6 +15,7 @@ os.environ["FRONTEND_URL"] = "http://localhost:4200"
 
 from app.core.database import Base
 from app.models import User, Category, Email, GmailAccount
+from app.services.local_classifier import local_classifier
 
 # Use in-memory SQLite for tests
 SQLALCHEMY_DATABASE_URL = "sqlite://"
@@ -28,6 +29,8 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 
 @pytest.fixture(scope="function")
 def db():
+    # Models trained on another test's database must not leak into this one
+    local_classifier.reset()
     Base.metadata.create_all(bind=engine)
     db = TestingSessionLocal()
     try:
@@ -54,4 +57,21 @@ def test_category(db, test_user):
     db.add(category)
     db.commit()
     db.refresh(category)
-    return category
\ No newline at end of file
+    return category
+
+def create_gmail_accounts(db, count):
+    """Create Gmail accounts, one user each since a user can only hold one primary account"""
+    users = [User(email=f"user{i}@example.com") for i in range(count)]
+    db.add_all(users)
+    db.commit()
+    accounts = [
+        GmailAccount(
+            email=f"account{i}@gmail.com",
+            google_id=f"google{i}",
+            user_id=user.id,
+            is_primary=True
+        ) for i, user in enumerate(users)
+    ]
+    db.add_all(accounts)
+    db.commit()
+    return accounts
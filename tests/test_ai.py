@@ -0,0 +1,153 @@
+import asyncio
+import json
+import pytest
+from datetime import timedelta
+from types import SimpleNamespace
+from app.models import Category, Email
+from app.core.config import settings
+from app.services.ai import AIService
+from app.services.ai_cache import AIResultCache
+from app.services.llm import LLMUnavailable
+from tests.test_llm import make_gateway, rate_limit_error
+
+class FakeCompletions:
+    """Stands in for client.chat.completions, answering every request with the next reply"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        message = SimpleNamespace(content=reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def make_service(*replies):
+    service = AIService.__new__(AIService)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(*replies)))
+    service.llm = make_gateway(client)
+    service.cache = None
+    service.local_classifier = None
+    return service
+
+def make_email(subject="Sale"):
+    return Email(subject=subject, sender="shop@example.com", content="50% off. Unsubscribe: https://shop.example/u", user_id=1)
+
+CATEGORIES = [
+    Category(id=3, name="Promotions", description="Deals and offers", user_id=1),
+    Category(id=4, name="Receipts", description="Orders and invoices", user_id=1)
+]
+
+def test_enrich_email_uses_one_structured_request(db):
+    """Test that summary, category and unsubscribe link come from a single JSON-mode request"""
+    service = make_service(json.dumps({
+        "summary": "A sale.",
+        "category_id": 3,
+        "confidence": 0.9,
+        "unsubscribe_link": "https://shop.example/u"
+    }))
+    email = make_email()
+
+    asyncio.run(service.enrich_email(db, email, CATEGORIES))
+
+    requests = service.llm.client.chat.completions.requests
+    assert len(requests) == 1
+    assert requests[0]["response_format"] == {"type": "json_object"}
+    assert (email.summary, email.category_id, email.unsubscribe_link) == ("A sale.", 3, "https://shop.example/u")
+
+def test_analyze_email_drops_unknown_categories():
+    """Test that a category ID outside the user's categories is discarded"""
+    service = make_service(json.dumps({"summary": "A sale.", "category_id": 99, "confidence": 0.4}))
+
+    analysis = asyncio.run(service.analyze_email("content", "Sale", CATEGORIES))
+
+    assert analysis.category_id is None
+    assert analysis.unsubscribe_link is None
+
+def test_invalid_analysis_falls_back_to_separate_requests(db):
+    """Test that an unparseable response falls back to the summary, classify and unsubscribe requests"""
+    service = make_service('{"summary": "cut off', "Fallback summary.", "3", "None")
+    email = make_email()
+
+    asyncio.run(service.enrich_email(db, email, CATEGORIES))
+
+    assert len(service.llm.client.chat.completions.requests) == 4
+    assert (email.summary, email.category_id, email.unsubscribe_link) == ("Fallback summary.", 3, None)
+
+def test_classify_emails_maps_results_by_index():
+    """Test that batch answers are mapped back by index and bad ones are retried one by one"""
+    service = make_service(json.dumps({"results": [
+        {"index": 1, "category_id": None},
+        {"index": 0, "category_id": 4},
+        {"index": 2, "category_id": 99},
+        {"index": 7, "category_id": 3}
+    ]}), "3")
+    emails = [make_email("Order"), make_email("Hello"), make_email("Sale")]
+
+    category_ids = asyncio.run(service.classify_emails(emails, CATEGORIES))
+
+    assert category_ids == [4, None, 3]
+    requests = service.llm.client.chat.completions.requests
+    assert len(requests) == 2
+    assert requests[0]["messages"][1]["content"].count("Category 3:") == 1
+    assert "Email 2:" in requests[0]["messages"][1]["content"]
+
+def test_classify_emails_splits_batches(monkeypatch):
+    """Test that emails are packed into requests of at most AI_CLASSIFY_BATCH_SIZE"""
+    monkeypatch.setattr(settings, "AI_CLASSIFY_BATCH_SIZE", 2)
+    service = make_service(
+        json.dumps({"results": [{"index": 0, "category_id": 3}, {"index": 1, "category_id": 3}]}),
+        json.dumps({"results": [{"index": 0, "category_id": 4}]})
+    )
+
+    category_ids = asyncio.run(service.classify_emails([make_email(), make_email(), make_email()], CATEGORIES))
+
+    assert category_ids == [3, 3, 4]
+
+def test_enrich_email_reuses_cached_results(db):
+    """Test that identical content is enriched once, and only reclassified for another category set"""
+    service = make_service(
+        json.dumps({"summary": "A sale.", "category_id": 3, "confidence": 0.9, "unsubscribe_link": "https://shop.example/u"}),
+        "4"
+    )
+    service.cache = AIResultCache(max_entries=10, ttl=timedelta(days=1))
+    first, second, third = make_email(), make_email(), make_email()
+
+    asyncio.run(service.enrich_email(db, first, CATEGORIES))
+    asyncio.run(service.enrich_email(db, second, CATEGORIES))
+    other_categories = [Category(id=4, name="Receipts", description="Orders and invoices", user_id=2)]
+    asyncio.run(service.enrich_email(db, third, other_categories))
+
+    assert len(service.llm.client.chat.completions.requests) == 2
+    assert (second.summary, second.category_id, second.unsubscribe_link) == ("A sale.", 3, "https://shop.example/u")
+    assert (third.summary, third.category_id) == ("A sale.", 4)
+
+def test_enrich_email_trusts_consistent_senders(db):
+    """Test that confident answers are remembered until the sender skips classification"""
+    replies = [
+        json.dumps({"summary": f"Sale {i}.", "category_id": 3, "confidence": 0.95})
+        for i in range(3)
+    ]
+    service = make_service(*replies, json.dumps({"summary": "Sale 3.", "confidence": 0}))
+    emails = [make_email(f"Sale {i}") for i in range(4)]
+
+    for email in emails:
+        asyncio.run(service.enrich_email(db, email, CATEGORIES))
+
+    requests = service.llm.client.chat.completions.requests
+    assert "category_id" not in requests[3]["messages"][1]["content"]
+    assert [email.category_id for email in emails] == [3, 3, 3, 3]
+
+def test_enrich_email_raises_when_openai_is_unavailable(db):
+    """Test that rate limits outlasting the retries leave the email untouched for a later retry"""
+    service = make_service()
+    service.llm.client.chat.completions.replies = [rate_limit_error(), rate_limit_error()]
+    email = make_email()
+
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(service.enrich_email(db, email, CATEGORIES))
+
+    assert email.summary is None and email.category_id is None
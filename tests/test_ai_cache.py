@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from app.models import AIResult, Category
+from app.services.ai_cache import UNCLASSIFIED, AIResultCache, category_set_version, content_hash
+
+def test_content_hash_ignores_whitespace():
+    """Test that reformatted copies of the same email share a hash"""
+    assert content_hash("Sale", "50% off\n\nthis  week") == content_hash(" Sale", "50% off this week ")
+    assert content_hash("Sale", "50% off") != content_hash("Sale", "60% off")
+
+def test_category_set_version_tracks_edits():
+    """Test that the version ignores order but changes when a category changes"""
+    a = Category(id=1, name="A", description="first", user_id=1)
+    b = Category(id=2, name="B", description="second", user_id=1)
+    renamed = Category(id=2, name="B2", description="second", user_id=1)
+
+    assert category_set_version([a, b]) == category_set_version([b, a])
+    assert category_set_version([a, b]) != category_set_version([a, renamed])
+    assert category_set_version([a, b]) != category_set_version([a])
+
+def test_cache_falls_back_to_database(db):
+    """Test that results stored by another process are found in the database tier"""
+    AIResultCache(max_entries=10, ttl=timedelta(days=1)).put(db, "hash", "Summary", "https://u", 7, "v1")
+    db.commit()
+    cache = AIResultCache(max_entries=10, ttl=timedelta(days=1))
+
+    hit = cache.get(db, "hash", "v1")
+    assert (hit.summary, hit.unsubscribe_link, hit.category_id) == ("Summary", "https://u", 7)
+    # Another category set still reuses the summary, but not the category
+    assert cache.get(db, "hash", "v2").category_version == "v1"
+    assert cache.get(db, "missing", None) is None
+
+def test_cache_overwrites_and_evicts(db):
+    """Test that writes to an existing key update it and expired rows are deleted"""
+    cache = AIResultCache(max_entries=1, ttl=timedelta(days=1))
+    cache.put(db, "hash", "Old", None)
+    cache.put(db, "hash", "New", None)
+    cache.put(db, "other", "Other", None)
+    db.add(AIResult(content_hash="stale", category_version=UNCLASSIFIED, summary="Stale",
+                    expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+
+    assert db.query(AIResult).filter(AIResult.content_hash == "hash").one().summary == "New"
+    assert list(cache._memory) == ["other"]
+    assert cache.get(db, "stale", None) is None
+    assert cache.evict_expired(db) == 1
+    assert db.query(AIResult).count() == 2
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from app.models import GmailAccount
+from app.services.credentials import AccountTokens, CredentialManager
+from tests.conftest import create_gmail_accounts
+
+class FakeRefreshManager(CredentialManager):
+    """Credential manager whose refreshes hand out numbered tokens instead of calling Google"""
+
+    def __init__(self):
+        super().__init__(refresh_margin=timedelta(minutes=10))
+        self.refreshes = 0
+
+    def _refresh(self, account_id, creds):
+        self.refreshes += 1
+        creds.token = f"fresh-{self.refreshes}"
+        creds.expiry = datetime.utcnow() + timedelta(hours=1)
+        with self._lock:
+            self._pending[account_id] = (creds.token, creds.refresh_token, creds.expiry)
+
+def set_tokens(db, account, expiry):
+    account.access_token = "stale"
+    account.refresh_token = "refresh"
+    account.token_expiry = expiry
+    db.commit()
+
+def test_valid_credentials_are_cached(db):
+    """Test that valid tokens are reused without refreshing"""
+    account = create_gmail_accounts(db, 1)[0]
+    set_tokens(db, account, datetime.utcnow() + timedelta(hours=1))
+    manager = FakeRefreshManager()
+
+    first = manager.get_credentials(AccountTokens.from_account(account))
+    second = manager.get_credentials(AccountTokens.from_account(account))
+
+    assert first is second
+    assert first.token == "stale"
+    assert manager.refreshes == 0
+
+def test_expired_credentials_refresh_inline_and_flush(db):
+    """Test that expired tokens are refreshed once and written back with their real expiry"""
+    account = create_gmail_accounts(db, 1)[0]
+    set_tokens(db, account, datetime.utcnow() - timedelta(minutes=1))
+    manager = FakeRefreshManager()
+
+    creds = manager.get_credentials(AccountTokens.from_account(account))
+    assert creds.token == "fresh-1"
+    assert manager.flush(db) == 1
+    assert manager.flush(db) == 0
+
+    db.expire_all()
+    stored = db.query(GmailAccount).get(account.id)
+    assert stored.access_token == "fresh-1"
+    assert stored.token_expiry == creds.expiry
+    assert stored.token_expiry > datetime.utcnow() + timedelta(minutes=50)
+
+def test_refresh_expiring_runs_ahead_of_expiry(db):
+    """Test that credentials close to expiry are refreshed in the background"""
+    accounts = create_gmail_accounts(db, 2)
+    set_tokens(db, accounts[0], datetime.utcnow() + timedelta(minutes=5))
+    set_tokens(db, accounts[1], datetime.utcnow() + timedelta(hours=1))
+    manager = FakeRefreshManager()
+    soon = manager.get_credentials(AccountTokens.from_account(accounts[0]))
+    later = manager.get_credentials(AccountTokens.from_account(accounts[1]))
+
+    assert manager.refresh_expiring() == 1
+    assert soon.token == "fresh-1"
+    assert later.token == "stale"
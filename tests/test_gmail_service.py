@@ -0,0 +1,300 @@
+import asyncio
+import httplib2
+import threading
+from datetime import datetime
+import pytest
+from googleapiclient.errors import HttpError
+from app.models import GmailAccount
+from tests.conftest import create_gmail_accounts
+from app.services.gmail import GmailService, HistoryExpiredError, get_gmail_resource, run_gmail_call
+from app.services.retry import RetryPolicy, classify_google_error
+
+class FakeRequest:
+    def __init__(self, service, method, **kwargs):
+        self.service = service
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self, http=None):
+        self.service.calls.append((self.method, self.kwargs))
+        if self.service.errors:
+            raise self.service.errors.pop(0)
+        return self.service.respond(self.method, self.kwargs)
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        self.service.batches.append([request_id for request_id, _ in self.requests])
+        for index, (request_id, request) in enumerate(self.requests):
+            if index == self.service.batch_broken_after:
+                raise Exception("Connection reset")
+            if request_id in self.service.batch_failures:
+                self.callback(request_id, None, Exception("backendError"))
+            else:
+                self.callback(request_id, self.service.respond(request.method, request.kwargs), None)
+
+class FakeGmailResource:
+    """Minimal stand-in for the googleapiclient Gmail resource"""
+
+    def __init__(self, batch_failures=(), history_pages=None, list_pages=None, errors=(), batch_broken_after=None):
+        self.calls = []
+        self.errors = list(errors)  # Raised by the next direct calls, in order
+        self.batches = []
+        self.batch_failures = set(batch_failures)
+        self.batch_broken_after = batch_broken_after  # Batches raise after this many sub-requests
+        self.history_pages = history_pages or {}
+        self.list_pages = list_pages or {}
+        self.collection = None
+
+    def users(self):
+        return self
+
+    def messages(self):
+        self.collection = "messages"
+        return self
+
+    def history(self):
+        self.collection = "history"
+        return self
+
+    def list(self, **kwargs):
+        return FakeRequest(self, f"{self.collection}.list", **kwargs)
+
+    def get(self, **kwargs):
+        return FakeRequest(self, "messages.get", **kwargs)
+
+    def modify(self, **kwargs):
+        return FakeRequest(self, "messages.modify", **kwargs)
+
+    def batchModify(self, **kwargs):
+        return FakeRequest(self, "messages.batchModify", **kwargs)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def respond(self, method, kwargs):
+        if method == "messages.get":
+            return {"id": kwargs["id"]}
+        if method == "messages.list":
+            return self.list_pages.get(kwargs.get("pageToken"), {})
+        if method == "history.list":
+            page = self.history_pages.get(kwargs.get("pageToken"))
+            if isinstance(page, Exception):
+                raise page
+            return page
+        return {}
+
+class RecordingQuota:
+    """Quota limiter that never waits and records what it was charged"""
+
+    def __init__(self):
+        self.charges = []
+
+    def acquire(self, account_id, method, count=1):
+        self.charges.append((method, count))
+        return 0.0
+
+def make_service(resource):
+    service = GmailService.__new__(GmailService)
+    service.account_id = 1
+    service.service = resource
+    service.quota = RecordingQuota()
+    service.retry = RetryPolicy(classify_google_error, max_attempts=3, base_delay=0, max_delay=0, sleep=lambda _: None)
+    service.http = None
+    return service
+
+def test_gmail_resource_is_shared_across_accounts():
+    """Test that services share one prebuilt resource and only differ in credentials and transport"""
+    first = GmailService(GmailAccount(id=101, email="a@gmail.com", access_token="token-a"), db=None)
+    second = GmailService(GmailAccount(id=102, email="b@gmail.com", access_token="token-b"), db=None)
+
+    assert first.service is second.service is get_gmail_resource()
+    assert first.http is not second.http
+    assert first.http.credentials.token == "token-a"
+    assert second.http.credentials.token == "token-b"
+
+def test_gmail_service_does_not_touch_the_account_after_init(db):
+    """Test that calls on worker threads work from a snapshot, not the account's Session"""
+    account = create_gmail_accounts(db, 1)[0]
+    account.access_token = "token"
+    db.commit()
+    account_id = account.id
+    service = GmailService(account, db=None)
+
+    db.expire_all()
+    db.close()  # Reading the expired, detached account would raise now
+    service._authorize(force_refresh=False)
+
+    assert service.account_id == account_id
+    assert service.http.credentials.token == "token"
+
+def test_get_messages_batches_requests():
+    """Test that messages are fetched in batches of at most 100"""
+    resource = FakeGmailResource()
+    ids = [f"msg{i}" for i in range(150)]
+
+    messages = make_service(resource).get_messages(ids)
+
+    assert [len(batch) for batch in resource.batches] == [100, 50]
+    assert set(messages) == set(ids)
+    assert resource.calls == []
+
+def test_calls_are_charged_against_the_quota():
+    """Test that every call and batched sub-request is charged before it is sent"""
+    resource = FakeGmailResource(history_pages={None: {"historyId": "100"}})
+    service = make_service(resource)
+
+    service.get_messages([f"msg{i}" for i in range(150)])
+    service.archive_emails(["msg0"])
+    service.list_history_messages("100")
+
+    assert service.quota.charges == [
+        ("messages.get", 100),
+        ("messages.get", 50),
+        ("messages.batchModify", 1),
+        ("history.list", 1)
+    ]
+
+def test_get_messages_retries_failed_sub_requests():
+    """Test that sub-requests failing inside a batch are retried individually"""
+    resource = FakeGmailResource(batch_failures={"msg1"})
+
+    messages = make_service(resource).get_messages(["msg0", "msg1", "msg2"])
+
+    assert set(messages) == {"msg0", "msg1", "msg2"}
+    assert [kwargs["id"] for _, kwargs in resource.calls] == ["msg1"]
+
+def test_get_messages_fetches_each_message_once_after_a_broken_batch():
+    """Test that a batch failing midway falls back to single fetches without repeating any"""
+    resource = FakeGmailResource(batch_failures={"msg1"}, batch_broken_after=2)
+
+    messages = make_service(resource).get_messages(["msg0", "msg1", "msg2", "msg3"])
+
+    assert set(messages) == {"msg0", "msg1", "msg2", "msg3"}
+    assert [kwargs["id"] for _, kwargs in resource.calls] == ["msg1", "msg2", "msg3"]
+
+def test_archive_email_recovers_from_expired_token():
+    """Test that an auth failure refreshes credentials once and the retried call succeeds"""
+    resource = FakeGmailResource(errors=[Exception("invalid_grant: Token has been expired or revoked.")])
+    service = make_service(resource)
+    refreshes = []
+    service._authorize = lambda force_refresh=False: refreshes.append(force_refresh)
+
+    service.archive_email("msg0")
+
+    assert refreshes == [True]
+    assert [method for method, _ in resource.calls] == ["messages.modify"] * 2
+
+def test_transient_errors_are_retried_and_charged_again():
+    """Test that 5xx responses are retried, with every attempt drawing quota"""
+    unavailable = HttpError(httplib2.Response({"status": 503}), b"Backend Error")
+    resource = FakeGmailResource(errors=[unavailable, unavailable])
+    service = make_service(resource)
+
+    assert service.get_message("msg0") == {"id": "msg0"}
+    assert service.quota.charges == [("messages.get", 1)] * 3
+
+def test_archive_emails_uses_batch_modify():
+    """Test that archiving is chunked into batchModify calls of at most 1000 IDs"""
+    resource = FakeGmailResource()
+    ids = [f"msg{i}" for i in range(1500)]
+
+    make_service(resource).archive_emails(ids)
+
+    assert [method for method, _ in resource.calls] == ["messages.batchModify"] * 2
+    assert [len(kwargs["body"]["ids"]) for _, kwargs in resource.calls] == [1000, 500]
+    assert all(kwargs["body"]["removeLabelIds"] == ["INBOX"] for _, kwargs in resource.calls)
+
+def test_list_history_messages_follows_pages():
+    """Test that history deltas are collected across pages, keeping inbox additions only"""
+    resource = FakeGmailResource(history_pages={
+        None: {
+            "history": [{"messagesAdded": [{"message": {"id": "a", "labelIds": ["INBOX"]}}]}],
+            "nextPageToken": "page2",
+            "historyId": "110"
+        },
+        "page2": {
+            "history": [{"messagesAdded": [
+                {"message": {"id": "b", "labelIds": ["INBOX", "UNREAD"]}},
+                {"message": {"id": "c", "labelIds": ["SENT"]}}
+            ]}],
+            "historyId": "120"
+        }
+    })
+
+    messages, history_id = make_service(resource).list_history_messages("100")
+
+    assert messages == [{"id": "a"}, {"id": "b"}]
+    assert history_id == "120"
+
+def test_list_history_messages_idle_mailbox():
+    """Test that an idle mailbox costs one call and keeps its cursor"""
+    resource = FakeGmailResource(history_pages={None: {"historyId": "100"}})
+
+    messages, history_id = make_service(resource).list_history_messages("100")
+
+    assert messages == []
+    assert history_id == "100"
+    assert len(resource.calls) == 1
+
+def test_list_history_messages_expired_cursor():
+    """Test that an expired history ID is reported so callers can fall back to a search"""
+    expired = HttpError(httplib2.Response({"status": 404}), b"Requested entity was not found.")
+    resource = FakeGmailResource(history_pages={None: expired})
+
+    with pytest.raises(HistoryExpiredError):
+        make_service(resource).list_history_messages("1")
+
+def test_iter_unarchived_email_pages_follows_tokens():
+    """Test that pages are requested lazily and follow nextPageToken"""
+    resource = FakeGmailResource(list_pages={
+        None: {"messages": [{"id": "a"}, {"id": "b"}], "nextPageToken": "p2"},
+        "p2": {"messages": [{"id": "c"}]}
+    })
+
+    pages = make_service(resource).iter_unarchived_email_pages(page_size=2)
+
+    assert resource.calls == []
+    assert next(pages) == ([{"id": "a"}, {"id": "b"}], "p2")
+    assert len(resource.calls) == 1
+    assert next(pages) == ([{"id": "c"}], None)
+    assert next(pages, None) is None
+
+def test_iter_unarchived_email_pages_stops_at_cap():
+    """Test that listing stops at the cap and hands back a token to resume from"""
+    resource = FakeGmailResource(list_pages={
+        None: {"messages": [{"id": "a"}, {"id": "b"}], "nextPageToken": "p2"},
+        "p2": {"messages": [{"id": "c"}, {"id": "d"}], "nextPageToken": "p3"},
+        "p3": {"messages": [{"id": "e"}]}
+    })
+    service = make_service(resource)
+
+    pages = list(service.iter_unarchived_email_pages(page_size=2, max_messages=3))
+
+    assert pages == [([{"id": "a"}, {"id": "b"}], "p2"), ([{"id": "c"}, {"id": "d"}], "p3")]
+    assert resource.calls[1][1]["maxResults"] == 1
+
+    resumed = list(service.iter_unarchived_email_pages(page_size=2, page_token="p3"))
+    assert resumed == [([{"id": "e"}], None)]
+
+def test_iter_unarchived_email_pages_searches_a_date_window():
+    """Test that since and before bound the inbox search"""
+    resource = FakeGmailResource(list_pages={None: {"messages": [{"id": "a"}]}})
+    since, before = datetime(2026, 1, 1), datetime(2026, 1, 8)
+
+    list(make_service(resource).iter_unarchived_email_pages(since=since, before=before))
+
+    assert resource.calls[0][1]["q"] == f"in:inbox after:{int(since.timestamp())} before:{int(before.timestamp())}"
+
+def test_gmail_calls_run_on_their_own_thread_pool():
+    """Test that blocking Gmail calls are offloaded to the dedicated Gmail threads"""
+    thread_name = asyncio.run(run_gmail_call(lambda: threading.current_thread().name))
+
+    assert thread_name.startswith("gmail-io")
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from app.models import GmailAccount
+from app.services.leases import AccountLeases
+from tests.conftest import TestingSessionLocal, create_gmail_accounts
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+def make_leases(owner):
+    return AccountLeases(TestingSessionLocal, owner, lease_seconds=300)
+
+def test_workers_split_due_accounts(db):
+    """Test that accounts leased by one worker are skipped by the others"""
+    accounts = create_gmail_accounts(db, 4)
+    accounts[3].next_sync_at = NOW + timedelta(minutes=5)  # Not due yet
+    db.commit()
+    first, second = make_leases("host-a:1"), make_leases("host-b:1")
+
+    assert first.claim_due(2, now=NOW) == [accounts[0].id, accounts[1].id]
+    assert second.claim_due(5, now=NOW) == [accounts[2].id]
+    assert second.claim_due(5, now=NOW) == []
+
+    db.expire_all()
+    assert db.get(GmailAccount, accounts[0].id).lease_owner == "host-a:1"
+    assert db.get(GmailAccount, accounts[0].id).lease_expires_at == NOW + timedelta(seconds=300)
+
+def test_expired_leases_are_taken_over(db):
+    """Test that a crashed worker's accounts are claimed again once its lease runs out"""
+    account = create_gmail_accounts(db, 1)[0]
+    crashed, survivor = make_leases("host-a:1"), make_leases("host-b:1")
+    crashed.claim_due(1, now=NOW)
+
+    assert survivor.claim_due(1, now=NOW + timedelta(seconds=299)) == []
+    assert survivor.claim_due(1, now=NOW + timedelta(seconds=300)) == [account.id]
+
+    # The old owner can no longer renew or release it
+    assert crashed.renew([account.id], now=NOW + timedelta(seconds=301)) == set()
+    assert not crashed.release(account.id)
+    assert survivor.renew([account.id], now=NOW + timedelta(seconds=301)) == {account.id}
+
+def test_claim_and_release_a_single_account(db):
+    """Test that a specific account can be leased even when not due, and released again"""
+    account = create_gmail_accounts(db, 1)[0]
+    account.next_sync_at = NOW + timedelta(hours=1)
+    db.commit()
+    api, worker = make_leases("api:1"), make_leases("worker:1")
+
+    assert api.claim(account.id, now=NOW)
+    assert not worker.claim(account.id, now=NOW)
+    assert api.release(account.id)
+
+    db.expire_all()
+    stored = db.get(GmailAccount, account.id)
+    assert (stored.lease_owner, stored.lease_expires_at) == (None, None)
+    assert stored.next_sync_at == NOW + timedelta(hours=1)
+    assert worker.claim(account.id, now=NOW)
@@ -0,0 +1,156 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from types import SimpleNamespace
+from app.services.llm import (
+    AdaptiveConcurrency, LLMGateway, LLMUnavailable, classify_openai_error, openai_retry_after
+)
+from app.services.retry import NETWORK, RATE_LIMIT, SERVER, RetryPolicy
+
+def status_error(cls, status, headers=None, body=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls("error", response=response, body=body)
+
+def rate_limit_error(retry_after_ms=None):
+    headers = {"retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else None
+    return status_error(openai.RateLimitError, 429, headers)
+
+def make_gateway(client, max_attempts=2, concurrency=None, tokens_per_minute=1_000_000):
+    return LLMGateway(
+        client=client,
+        requests_per_minute=1_000_000,
+        tokens_per_minute=tokens_per_minute,
+        concurrency=concurrency or AdaptiveConcurrency(initial=4, minimum=1, maximum=8),
+        retry=RetryPolicy(classify_openai_error, max_attempts=max_attempts, base_delay=0, max_delay=0,
+                          get_retry_after=openai_retry_after)
+    )
+
+class ScriptedClient:
+    """OpenAI client double raising or answering from a script, tracking concurrency"""
+
+    def __init__(self, *script, delay=0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            outcome = self.script.pop(0) if self.script else "ok"
+            if isinstance(outcome, Exception):
+                raise outcome
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=outcome))],
+                usage=SimpleNamespace(total_tokens=10)
+            )
+        finally:
+            self.in_flight -= 1
+
+def test_classify_openai_error():
+    """Test that rate limits and outages are retried but bad requests and spent quotas are not"""
+    assert classify_openai_error(rate_limit_error()) == RATE_LIMIT
+    assert classify_openai_error(status_error(openai.RateLimitError, 429, body={"code": "insufficient_quota"})) is None
+    assert classify_openai_error(status_error(openai.InternalServerError, 503)) == SERVER
+    assert classify_openai_error(openai.APITimeoutError(httpx.Request("POST", "https://api.openai.com"))) == NETWORK
+    assert classify_openai_error(status_error(openai.BadRequestError, 400)) is None
+
+def test_openai_retry_after():
+    """Test that both retry-after headers are understood"""
+    assert openai_retry_after(rate_limit_error(1500)) == 1.5
+    assert openai_retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "3"})) == 3
+    assert openai_retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+    assert openai_retry_after(ValueError()) is None
+
+def test_adaptive_concurrency_aimd():
+    """Test that the limit grows additively on success and halves on rate limits"""
+    limit = AdaptiveConcurrency(initial=4, minimum=1, maximum=5)
+    for _ in range(4):
+        limit.on_success()
+    assert limit.limit == pytest.approx(4.92, abs=0.01)
+    limit.on_rate_limited()
+    assert limit.limit == pytest.approx(2.46, abs=0.01)
+    for _ in range(3):
+        limit.on_rate_limited()
+    assert limit.limit == 1
+    for _ in range(100):
+        limit.on_success()
+    assert limit.limit == 5
+
+def test_adaptive_concurrency_decreases_once_per_overload():
+    """Test that rate limits of requests started before the last decrease do not lower the limit again"""
+    limit = AdaptiveConcurrency(initial=8, minimum=1, maximum=8)
+
+    async def start_requests():
+        return [await limit.acquire() for _ in range(8)]
+
+    epochs = asyncio.run(start_requests())
+    for epoch in epochs:
+        limit.release()
+        limit.on_rate_limited(epoch)
+    assert limit.limit == 4
+
+    epoch = asyncio.run(limit.acquire())
+    limit.release()
+    limit.on_rate_limited(epoch)
+    assert limit.limit == 2
+
+def test_gateway_bounds_concurrency():
+    """Test that no more requests run at once than the concurrency limit allows"""
+    client = ScriptedClient(delay=0.01)
+    gateway = make_gateway(client, concurrency=AdaptiveConcurrency(initial=2, minimum=1, maximum=2))
+
+    async def run():
+        return await asyncio.gather(*(gateway.create("test", messages=[]) for _ in range(6)))
+
+    responses = asyncio.run(run())
+
+    assert len(responses) == 6
+    assert client.max_in_flight == 2
+
+def test_gateway_retries_rate_limits():
+    """Test that a rate limit lowers the concurrency limit, pauses requests and is retried"""
+    client = ScriptedClient(rate_limit_error(retry_after_ms=20), "answer")
+    gateway = make_gateway(client)
+
+    response = asyncio.run(gateway.create("test", messages=[{"role": "user", "content": "hi"}], max_tokens=5))
+
+    assert response.choices[0].message.content == "answer"
+    assert client.calls == 2
+    assert gateway.concurrency.limit < 4
+    assert gateway.retry.metrics[(RATE_LIMIT, "retried")] == 1
+
+def test_gateway_gives_up_with_llm_unavailable():
+    """Test that retryable failures end in LLMUnavailable and permanent ones pass through"""
+    gateway = make_gateway(ScriptedClient(rate_limit_error(), rate_limit_error()))
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(gateway.create("test", messages=[]))
+
+    gateway = make_gateway(ScriptedClient(status_error(openai.BadRequestError, 400)))
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(gateway.create("test", messages=[]))
+
+def test_gateway_refunds_unused_tokens():
+    """Test that the token budget is charged the estimate and settled with the actual usage"""
+    gateway = make_gateway(ScriptedClient(), tokens_per_minute=6000)
+
+    asyncio.run(gateway.create("test", messages=[{"role": "user", "content": "x" * 400}], max_tokens=100))
+
+    # 10 tokens were used, whatever the estimate was
+    assert gateway.tokens.tokens == pytest.approx(5990, abs=1)
+
+def test_gateway_refunds_tokens_of_failed_attempts():
+    """Test that attempts which fail give their token reservation back"""
+    gateway = make_gateway(ScriptedClient(rate_limit_error(), rate_limit_error()), tokens_per_minute=6000)
+
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(gateway.create("test", messages=[{"role": "user", "content": "x" * 400}], max_tokens=100))
+
+    assert gateway.tokens.tokens == pytest.approx(6000, abs=1)
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta
+import numpy as np
+from app.models import Category, Email
+from app.services.local_classifier import LocalClassifier, email_features
+
+def make_classifier():
+    return LocalClassifier(dim=1024, max_users=10, max_age=timedelta(hours=1), training_emails=100)
+
+def make_email(user_id, subject, content, category_id=None):
+    return Email(subject=subject, sender="someone@example.com", content=content, user_id=user_id,
+                 category_id=category_id, received_at=datetime.utcnow())
+
+def add_categories(db, user_id):
+    categories = [
+        Category(name="Receipts", description="Orders and invoices", user_id=user_id),
+        Category(name="Travel", description="Flights and hotels", user_id=user_id)
+    ]
+    db.add_all(categories)
+    db.commit()
+    return categories
+
+def test_email_features():
+    """Test that features are deterministic unit vectors with subject words kept apart"""
+    a = email_features("Invoice", "shop@example.com", "Your order total", 256)
+    assert np.allclose(a, email_features("Invoice", "shop@example.com", "Your order total", 256))
+    assert np.isclose(np.linalg.norm(a), 1)
+    assert not np.allclose(email_features("order", None, None, 256), email_features(None, None, "order", 256))
+    assert not email_features(None, None, None, 256).any()
+
+def test_classifier_trains_from_categorized_emails(db, test_user):
+    """Test that a model built from stored emails only answers with a clear margin"""
+    receipts, travel = add_categories(db, test_user.id)
+    db.add_all(
+        [make_email(test_user.id, f"Invoice {i}", "Your order total and receipt", receipts.id) for i in range(5)]
+        + [make_email(test_user.id, f"Flight {i}", "Your boarding pass and hotel booking", travel.id) for i in range(5)]
+    )
+    db.commit()
+    classifier = make_classifier()
+    invoice = make_email(test_user.id, "Invoice", "Receipt for your order")
+    vague = make_email(test_user.id, "Hello", "Your")
+
+    async def run():
+        await classifier.train(db, test_user.id, [receipts, travel])
+        return classifier.predict(db, test_user.id, [invoice, vague], [receipts, travel])
+
+    (category_id, margin), (_, vague_margin) = asyncio.run(run())
+
+    assert category_id == receipts.id and margin > 0.1
+    assert vague_margin < margin
+    assert classifier.classify(db, invoice, [receipts, travel]) == receipts.id
+
+def test_classifier_builds_models_in_the_background(db, test_user):
+    """Test that predictions wait for no build, and labels learned during one reach the new model"""
+    receipts, travel = add_categories(db, test_user.id)
+    classifier = make_classifier()
+    flight = make_email(test_user.id, "Flight", "Boarding pass for your flight")
+
+    async def run():
+        # Nothing is built yet, the first call starts a build and answers nothing
+        assert classifier.classify(db, flight, [receipts, travel]) is None
+        classifier.learn(test_user.id,
+            [make_email(test_user.id, "Invoice", "Order receipt", receipts.id) for _ in range(5)]
+            + [make_email(test_user.id, "Flight", "Boarding pass", travel.id) for _ in range(5)]
+        )
+        await classifier.train(db, test_user.id, [receipts, travel])
+        assert classifier.classify(db, flight, [receipts, travel]) == travel.id
+
+        # An old model keeps answering while its replacement is built
+        classifier._models[test_user.id].trained_at -= timedelta(hours=2)
+        assert classifier.classify(db, flight, [receipts, travel]) == travel.id
+        assert test_user.id in classifier._training
+        await classifier.train(db, test_user.id, [receipts, travel])
+
+        # Nothing is stored, so the model for a new category set knows no examples
+        other = Category(name="Other", description="d", user_id=test_user.id)
+        db.add(other)
+        db.commit()
+        assert classifier.classify(db, flight, [receipts, travel, other]) is None
+        await classifier.train(db, test_user.id, [receipts, travel, other])
+        assert classifier.classify(db, flight, [receipts, travel, other]) is None
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+from app.services import normalize
+from app.services.normalize import normalize_email_content, truncate_to_tokens
+
+def test_quoted_history_and_signature_are_stripped():
+    """Test that replies keep only the new text"""
+    content = (
+        "Sounds good, see you then.\r\n"
+        "> Are we still on for Friday?\r\n"
+        "--\r\n"
+        "Jane Doe | Example Inc\r\n"
+        "\r\n"
+        "On Mon, Jan 1, 2024 at 9:00 AM John <john@example.com> wrote:\r\n"
+        "> Are we still on for Friday?\r\n"
+    )
+    assert normalize_email_content(content) == "Sounds good, see you then."
+
+    outlook = "Approved.\nFrom: John\nSent: Monday\nSubject: Budget\n\nPlease approve the budget."
+    assert normalize_email_content(outlook) == "Approved."
+
+def test_long_urls_are_removed_but_unsubscribe_links_kept():
+    """Test that tracking URLs are dropped while unsubscribe URLs survive stripping and truncation"""
+    tracking = "https://click.example.com/" + "a" * 100
+    unsubscribe = "https://shop.example.com/unsubscribe?u=" + "b" * 100
+    content = f"Big   sale\n\n\n\nShop now: {tracking} https://shop.example\n-- \nFooter {unsubscribe}"
+
+    assert normalize_email_content(content) == (
+        f"Big sale\n\nShop now: [link] https://shop.example\n\nUnsubscribe: {unsubscribe}"
+    )
+
+def test_truncate_to_tokens_without_tokenizer(monkeypatch):
+    """Test that the character estimate is used when no tokenizer is available"""
+    monkeypatch.setattr(normalize, "_encoding", lambda: None)
+
+    assert truncate_to_tokens("short", 10) == "short"
+    assert truncate_to_tokens("x" * 100, 10) == "x" * 40 + "..."
+
+def test_truncate_to_tokens_with_tokenizer(monkeypatch):
+    """Test that the tokenizer decides where text is cut"""
+    class WordEncoding:
+        def encode(self, text, disallowed_special=()):
+            return text.split(" ")
+
+        def decode(self, tokens):
+            return " ".join(tokens)
+
+    monkeypatch.setattr(normalize, "_encoding", lambda: WordEncoding())
+
+    assert truncate_to_tokens("one two three", 3) == "one two three"
+    assert truncate_to_tokens("one two three", 2) == "one two..."
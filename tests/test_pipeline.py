@@ -0,0 +1,259 @@
+import asyncio
+import base64
+import pytest
+import time
+from datetime import datetime
+from app.core.config import settings
+from app.models import Category, Email, MessageFailure
+from app.services.llm import LLMUnavailable
+from app.services.pipeline import (
+    KnownMessageIds, SyncPipeline, find_existing_gmail_ids, insert_emails, process_email_content
+)
+from tests.conftest import create_gmail_accounts
+
+def make_message(message_id):
+    return {
+        "id": message_id,
+        "internalDate": "1700000000000",
+        "payload": {
+            "mimeType": "text/plain",
+            "headers": [
+                {"name": "Subject", "value": f"Subject {message_id}"},
+                {"name": "From", "value": "sender@example.com"}
+            ],
+            "body": {"data": base64.urlsafe_b64encode(b"Hello").decode()}
+        }
+    }
+
+class FakeGmailService:
+    def __init__(self, missing=(), archive_error=None):
+        self.missing = set(missing)
+        self.archive_error = archive_error
+        self.archived = []
+
+    def get_messages(self, message_ids):
+        return {message_id: make_message(message_id) for message_id in message_ids if message_id not in self.missing}
+
+    def archive_emails(self, message_ids):
+        if self.archive_error:
+            raise self.archive_error
+        self.archived.append(list(message_ids))
+
+class FakeAIService:
+    def __init__(self):
+        self.batches = []
+
+    async def classify_emails(self, emails, categories):
+        self.batches.append([email.gmail_id for email in emails])
+        return [categories[0].id for _ in emails]
+
+    async def enrich_email(self, db, email, categories=None, classify=True):
+        email.summary = f"Summary of {email.subject}"
+        if classify and categories:
+            email.category_id = categories[-1].id
+
+def test_find_existing_gmail_ids(db):
+    """Test that stored Gmail IDs are found with one set-based lookup per account"""
+    account = create_gmail_accounts(db, 2)
+    db.add_all([
+        Email(gmail_id="a", subject="A", sender="s", content="c", received_at=datetime.utcnow(),
+              user_id=account[0].user_id, gmail_account_id=account[0].id),
+        Email(gmail_id="b", subject="B", sender="s", content="c", received_at=datetime.utcnow(),
+              user_id=account[1].user_id, gmail_account_id=account[1].id)
+    ])
+    db.commit()
+
+    assert find_existing_gmail_ids(db, account[0].id, ["a", "b", "c"]) == {"a"}
+    assert find_existing_gmail_ids(db, account[0].id, []) == set()
+
+def test_known_message_ids_lru():
+    """Test that the per-account known-ID cache evicts the least recently seen IDs"""
+    cache = KnownMessageIds(max_per_account=2)
+    cache.add(1, ["a", "b"])
+
+    assert cache.split(1, ["a", "c"]) == (["a"], ["c"])
+    assert cache.split(2, ["a"]) == ([], ["a"])
+
+    cache.add(1, ["c"])  # "b" was used least recently
+    assert cache.split(1, ["a", "b", "c"]) == (["a", "c"], ["b"])
+
+def test_insert_emails_skips_conflicts(db):
+    """Test that bulk inserts skip gmail_ids that are already stored"""
+    account = create_gmail_accounts(db, 1)[0]
+
+    def make_email(gmail_id):
+        return Email(gmail_id=gmail_id, subject=gmail_id, sender="s", content="c",
+                     received_at=datetime.utcnow(), user_id=account.user_id,
+                     gmail_account_id=account.id, is_archived=True)
+
+    assert insert_emails(db, [make_email("a"), make_email("b")]) == {"a", "b"}
+    db.commit()
+
+    # A racing sync stores "b" again together with a new email
+    assert insert_emails(db, [make_email("b"), make_email("c")]) == {"c"}
+    db.commit()
+
+    stored = db.query(Email).order_by(Email.gmail_id).all()
+    assert [email.gmail_id for email in stored] == ["a", "b", "c"]
+    assert all(email.created_at is not None and email.is_archived for email in stored)
+    assert insert_emails(db, []) == set()
+
+def test_pipeline_processes_pages_in_order(db):
+    """Test that pages flow through every stage, in order, with failures counted"""
+    account = create_gmail_accounts(db, 1)[0]
+    db.add(Email(gmail_id="old", subject="Old", sender="s", content="c", received_at=datetime.utcnow(),
+                 user_id=account.user_id, gmail_account_id=account.id, is_archived=True))
+    db.commit()
+    gmail_service = FakeGmailService(missing={"lost"})
+    pages = iter([
+        ([{"id": "a"}, {"id": "old"}, {"id": "lost"}], "p2"),
+        ([{"id": "b"}, {"id": "c"}], None)
+    ])
+    pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), KnownMessageIds(100))
+
+    synced_count, failed_count = asyncio.run(pipeline.run(pages))
+
+    assert (synced_count, failed_count) == (3, 1)
+    assert gmail_service.archived == [["old", "a"], ["b", "c"]]
+    assert pipeline.stats["listed"] == 5
+    assert pipeline.truncated is False
+    stored = {email.gmail_id: email for email in db.query(Email).all()}
+    assert set(stored) == {"old", "a", "b", "c"}
+    assert stored["a"].content == "Hello"
+    assert stored["a"].normalized_content == "Hello"
+    assert stored["a"].summary == "Summary of Subject a"
+
+def test_pipeline_drains_pages_before_raising_listing_errors(db):
+    """Test that a listing failure surfaces only after earlier pages are stored"""
+    account = create_gmail_accounts(db, 1)[0]
+    gmail_service = FakeGmailService()
+
+    def pages():
+        yield [{"id": "a"}], "p2"
+        raise RuntimeError("listing failed")
+
+    pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), KnownMessageIds(100))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pipeline.run(pages()))
+
+    assert gmail_service.archived == [["a"]]
+    assert db.query(Email).count() == 1
+
+def test_pipeline_batch_classifies_large_pages(db, monkeypatch):
+    """Test that pages with many new emails are classified in one batch and not again per email"""
+    monkeypatch.setattr(settings, "AI_CLASSIFY_BATCH_MIN_EMAILS", 3)
+    account = create_gmail_accounts(db, 1)[0]
+    db.add_all([
+        Category(name="Batch", description="d", user_id=account.user_id),
+        Category(name="Single", description="d", user_id=account.user_id)
+    ])
+    db.commit()
+    ai_service = FakeAIService()
+    pages = iter([
+        ([{"id": "a"}, {"id": "b"}, {"id": "c"}], "p2"),
+        ([{"id": "d"}], None)
+    ])
+    pipeline = SyncPipeline(db, account, FakeGmailService(), ai_service, KnownMessageIds(100))
+
+    asyncio.run(pipeline.run(pages))
+
+    assert ai_service.batches == [["a", "b", "c"]]
+    categories = {email.gmail_id: email.category.name for email in db.query(Email).all()}
+    assert categories == {"a": "Batch", "b": "Batch", "c": "Batch", "d": "Single"}
+
+def test_pipeline_leaves_emails_openai_could_not_handle(db):
+    """Test that emails failing with LLMUnavailable are neither stored nor archived"""
+    account = create_gmail_accounts(db, 1)[0]
+    gmail_service = FakeGmailService()
+
+    class FlakyAIService(FakeAIService):
+        async def enrich_email(self, db, email, categories=None, classify=True):
+            if email.gmail_id == "b":
+                raise LLMUnavailable("rate limited")
+            await super().enrich_email(db, email, categories, classify)
+
+    pipeline = SyncPipeline(db, account, gmail_service, FlakyAIService(), KnownMessageIds(100))
+
+    assert asyncio.run(pipeline.run(iter([([{"id": "a"}, {"id": "b"}], None)]))) == (1, 1)
+    assert gmail_service.archived == [["a"]]
+    assert [email.gmail_id for email in db.query(Email).all()] == ["a"]
+
+def test_pipeline_parks_messages_that_keep_failing(db, monkeypatch):
+    """Test that a message failing on every sync is parked, then skipped, and stops counting as failed"""
+    monkeypatch.setattr(settings, "SYNC_MESSAGE_MAX_ATTEMPTS", 2)
+    account = create_gmail_accounts(db, 1)[0]
+    gmail_service = FakeGmailService(missing={"lost"})
+
+    def sync():
+        pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), KnownMessageIds(100))
+        result = asyncio.run(pipeline.run(iter([([{"id": "a"}, {"id": "lost"}], None)])))
+        return result, pipeline.stats
+
+    assert sync()[0] == (1, 1)
+    (synced_count, failed_count), stats = sync()
+    assert (synced_count, failed_count, stats["parked"]) == (0, 0, 1)
+    (synced_count, failed_count), stats = sync()
+    assert (failed_count, stats["fetched"]) == (0, 0)
+
+    failure = db.query(MessageFailure).one()
+    assert (failure.gmail_id, failure.attempts) == ("lost", 2)
+    assert failure.parked_at is not None
+
+def test_pipeline_does_not_rearchive_history_listings(db):
+    """Test that stored messages from a history listing are not archived again"""
+    account = create_gmail_accounts(db, 1)[0]
+    db.add(Email(gmail_id="old", subject="Old", sender="s", content="c", received_at=datetime.utcnow(),
+                 user_id=account.user_id, gmail_account_id=account.id, is_archived=True))
+    db.commit()
+    gmail_service = FakeGmailService()
+    pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), KnownMessageIds(100), rearchive_stored=False)
+
+    asyncio.run(pipeline.run(iter([([{"id": "old"}, {"id": "a"}], None)])))
+
+    assert gmail_service.archived == [["a"]]
+
+def test_pipeline_archives_again_after_a_failed_archive(db):
+    """Test that a failed archive call counts as failed and is retried when history lists the emails again"""
+    account = create_gmail_accounts(db, 1)[0]
+    known_ids = KnownMessageIds(100)
+    gmail_service = FakeGmailService(archive_error=RuntimeError("backendError"))
+    pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), known_ids, rearchive_stored=False)
+
+    assert asyncio.run(pipeline.run(iter([([{"id": "a"}, {"id": "b"}], None)]))) == (2, 2)
+    assert [email.is_archived for email in db.query(Email).order_by(Email.gmail_id)] == [False, False]
+
+    gmail_service.archive_error = None
+    pipeline = SyncPipeline(db, account, gmail_service, FakeAIService(), known_ids, rearchive_stored=False)
+
+    assert asyncio.run(pipeline.run(iter([([{"id": "a"}, {"id": "b"}, {"id": "c"}], None)]))) == (1, 0)
+    assert gmail_service.archived == [["a", "b", "c"]]
+    db.expire_all()
+    assert all(email.is_archived for email in db.query(Email))
+
+def test_process_email_content_decodes_declared_charsets():
+    """Test that parts are decoded with their charset and undecodable bytes do not fail the message"""
+    def part(mime_type, body, content_type=None):
+        headers = [{"name": "Content-Type", "value": content_type}] if content_type else []
+        return {"mimeType": mime_type, "headers": headers,
+                "body": {"data": base64.urlsafe_b64encode(body).decode()}}
+
+    msg = {"payload": {"headers": [], "parts": [
+        part("text/plain", "Café crème".encode("latin-1"), 'text/plain; charset="ISO-8859-1"'),
+        part("text/html", b"<p>caf\xe9</p>")
+    ]}}
+
+    text, html, _ = asyncio.run(process_email_content(msg))
+
+    assert text == "Café crème"
+    assert html == "<p>caf\ufffd</p>"
+
+def test_pipeline_stops_listing_at_its_deadline(db):
+    """Test that no page is listed after the deadline and the listing can resume from its page token"""
+    account = create_gmail_accounts(db, 1)[0]
+    pages = iter([([{"id": "a"}], "p2"), ([{"id": "b"}], "p3"), ([{"id": "c"}], None)])
+    pipeline = SyncPipeline(db, account, FakeGmailService(), FakeAIService(), KnownMessageIds(100),
+                            list_deadline=time.monotonic() - 1)
+
+    assert asyncio.run(pipeline.run(pages)) == (1, 0)
+    assert (pipeline.truncated, pipeline.next_page_token) == (True, "p2")
@@ -0,0 +1,55 @@
+from app.core.config import settings
+from app.services.rate_limit import GmailQuotaLimiter, TokenBucket, per_process
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_token_bucket_refills_at_its_rate():
+    """Test that reservations beyond the available tokens wait for the refill"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock)
+
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(5) == 0.5
+    clock.now = 1.0
+    assert bucket.reserve(5) == 0
+
+def test_token_bucket_lets_large_requests_through_at_the_average_rate():
+    """Test that a request bigger than the capacity is admitted and delays the next one"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, clock=clock)
+
+    assert bucket.reserve(30) == 2.0
+    assert bucket.reserve(10) == 3.0
+
+def test_quota_limiter_charges_method_costs_per_account():
+    """Test that accounts are throttled separately and share the global bucket"""
+    clock = FakeClock()
+    limiter = GmailQuotaLimiter(user_rate=250, project_rate=300, clock=clock, sleep=clock.sleep)
+
+    assert limiter.acquire(1, "messages.get", 50) == 0  # 250 units, the whole per-user burst
+    assert limiter.acquire(2, "messages.batchModify") == 0  # Another account is not held up
+    assert limiter.acquire(1, "getProfile") == 1 / 250  # Account 1 is out of quota
+    clock.now = 1.0  # The project bucket refills to 299 units
+
+    # Fresh accounts have room, the shared project bucket is what holds the second one back
+    assert limiter.acquire(3, "messages.batchModify", 5) == 0
+    assert limiter.acquire(4, "messages.batchModify", 5) == 201 / 300
+    assert clock.sleeps == [1 / 250, 201 / 300]
+
+def test_per_process_splits_project_rates(monkeypatch):
+    """Test that project-wide rates are divided among the processes sharing them"""
+    monkeypatch.setattr(settings, "QUOTA_SHARING_PROCESSES", 4)
+    assert per_process(18000) == 4500
+
+    monkeypatch.setattr(settings, "QUOTA_SHARING_PROCESSES", 0)
+    assert per_process(18000) == 18000
@@ -0,0 +1,96 @@
+import random
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from app.services.retry import (
+    AUTH, NETWORK, RATE_LIMIT, SERVER, RetryPolicy, classify_google_error, google_retry_after
+)
+
+def http_error(status, content=b"", headers=None):
+    return HttpError(httplib2.Response({"status": status, **(headers or {})}), content)
+
+class Flaky:
+    """Callable failing with the given errors before returning ok"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def make_policy(sleeps, max_attempts=4):
+    return RetryPolicy(
+        classify=classify_google_error,
+        get_retry_after=google_retry_after,
+        max_attempts=max_attempts,
+        base_delay=1,
+        max_delay=10,
+        sleep=sleeps.append,
+        rng=random.Random(0)
+    )
+
+def test_classify_google_error():
+    """Test that Google API errors are sorted into retryable kinds"""
+    assert classify_google_error(Exception("invalid_grant: Bad Request")) == AUTH
+    assert classify_google_error(http_error(401)) == AUTH
+    assert classify_google_error(http_error(429)) == RATE_LIMIT
+    assert classify_google_error(http_error(403, b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}')) == RATE_LIMIT
+    assert classify_google_error(http_error(503)) == SERVER
+    assert classify_google_error(ConnectionResetError()) == NETWORK
+    assert classify_google_error(http_error(403, b"insufficientPermissions")) is None
+    assert classify_google_error(http_error(404)) is None
+    assert classify_google_error(ValueError("bad")) is None
+
+def test_backoff_grows_with_full_jitter():
+    """Test that retries back off exponentially with jittered, capped delays"""
+    sleeps = []
+    fn = Flaky(http_error(503), http_error(500), http_error(502))
+
+    assert make_policy(sleeps).call(fn) == "ok"
+    assert fn.calls == 4
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps, start=1):
+        assert 0 <= delay <= min(10, 2 ** (attempt - 1))
+
+def test_retry_after_is_respected():
+    """Test that a Retry-After header sets the minimum wait"""
+    sleeps = []
+    fn = Flaky(http_error(429, headers={"retry-after": "30"}))
+
+    assert make_policy(sleeps).call(fn) == "ok"
+    assert sleeps == [30.0]
+
+def test_gives_up_after_max_attempts_and_counts_outcomes():
+    """Test that the last error is raised once attempts run out and outcomes are counted"""
+    sleeps = []
+    policy = make_policy(sleeps, max_attempts=2)
+
+    with pytest.raises(HttpError):
+        policy.call(Flaky(http_error(500), http_error(500), http_error(500)))
+
+    assert len(sleeps) == 1
+    assert policy.metrics == {(SERVER, "retried"): 1, (SERVER, "gave_up"): 1}
+
+def test_permanent_errors_are_not_retried():
+    """Test that errors without a retryable kind are raised immediately"""
+    fn = Flaky(http_error(400))
+
+    with pytest.raises(HttpError):
+        make_policy([]).call(fn)
+    assert fn.calls == 1
+
+def test_auth_errors_refresh_once():
+    """Test that auth errors trigger one refresh and a second one is raised"""
+    refreshes = []
+    policy = make_policy([])
+
+    assert policy.call(Flaky(http_error(401)), on_auth_error=lambda: refreshes.append(1)) == "ok"
+    assert refreshes == [1]
+
+    with pytest.raises(HttpError):
+        policy.call(Flaky(http_error(401), http_error(401)), on_auth_error=lambda: refreshes.append(1))
+    assert refreshes == [1, 1]
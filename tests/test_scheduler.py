@@ -0,0 +1,33 @@
+from app.services.scheduler import SyncScheduler
+
+def make_scheduler():
+    return SyncScheduler(min_interval=30, max_interval=900, initial_interval=60, max_error_backoff=3600)
+
+def test_new_accounts_start_at_the_initial_interval():
+    """Test that accounts without a stored interval start from the initial one"""
+    scheduler = make_scheduler()
+
+    assert scheduler.after_success(None, new_messages=0) == (90, 90)
+    assert scheduler.after_failure(None, failures=1) == (60, 120)
+
+def test_interval_adapts_to_mail_volume():
+    """Test that busy accounts are polled more often and idle ones back off"""
+    scheduler = make_scheduler()
+
+    assert scheduler.after_success(60, new_messages=10) == (30, 30)  # Halved
+    assert scheduler.after_success(30, new_messages=10) == (30, 30)  # Clamped to the minimum
+    assert scheduler.after_success(60, new_messages=0) == (90, 90)  # Grown by half
+
+    interval = 60
+    for _ in range(20):
+        interval, _ = scheduler.after_success(interval, new_messages=0)
+    assert interval == 900
+
+def test_failures_back_off_exponentially():
+    """Test that failing accounts back off, capped, and keep their interval for recovery"""
+    scheduler = make_scheduler()
+
+    assert scheduler.after_failure(60, failures=1) == (60, 120)
+    assert scheduler.after_failure(60, failures=2) == (60, 240)
+    assert scheduler.after_failure(60, failures=10) == (60, 3600)
+    assert scheduler.after_success(60, new_messages=1) == (30, 30)
@@ -0,0 +1,42 @@
+from app.core.config import settings
+from app.models import Category, SenderCategory
+from app.services import sender_memo
+
+def test_sender_keys():
+    """Test that senders map to their address and, for private domains, their domain"""
+    assert sender_memo.sender_keys("Shop <News@Shop.example>") == ["news@shop.example", "@shop.example"]
+    assert sender_memo.sender_keys("friend@gmail.com") == ["friend@gmail.com"]
+    assert sender_memo.sender_keys("undisclosed-recipients:;") == []
+
+def test_lookup_needs_consistent_history(db, test_user, test_category):
+    """Test that a sender is trusted only after enough observations of one category"""
+    other = Category(name="Other", description="d", user_id=test_user.id)
+    db.add(other)
+    db.commit()
+    categories = [test_category, other]
+    sender = "news@shop.example"
+
+    for _ in range(settings.SENDER_MEMO_MIN_COUNT - 1):
+        sender_memo.record_category(db, test_user.id, sender, test_category.id)
+    assert sender_memo.lookup_category(db, test_user.id, sender, categories) is None
+
+    sender_memo.record_category(db, test_user.id, sender, test_category.id)
+    assert sender_memo.lookup_category(db, test_user.id, sender, categories) == test_category.id
+    # Another address of the same domain is covered by the domain's history
+    assert sender_memo.lookup_category(db, test_user.id, "Deals <deals@shop.example>", categories) == test_category.id
+
+    # A manual correction outweighs a short consistent history
+    sender_memo.record_category(db, test_user.id, sender, other.id, weight=settings.SENDER_MEMO_CORRECTION_WEIGHT)
+    assert sender_memo.lookup_category(db, test_user.id, sender, categories) is None
+    assert sender_memo.lookup_category(db, test_user.id, sender, [other]) is None
+
+def test_invalidate(db, test_user, test_category):
+    """Test that history is forgotten for one category or for the whole user"""
+    sender_memo.record_category(db, test_user.id, "a@shop.example", test_category.id)
+    sender_memo.record_category(db, test_user.id, "b@mail.example", test_category.id + 1)
+
+    sender_memo.invalidate(db, test_user.id, test_category.id)
+    assert {row.sender_key for row in db.query(SenderCategory).all()} == {"b@mail.example", "@mail.example"}
+
+    sender_memo.invalidate(db, test_user.id)
+    assert db.query(SenderCategory).count() == 0
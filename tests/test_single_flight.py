@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from app.services.leases import AccountLeases
+from app.services.single_flight import SingleFlight, SyncInProgress
+from app.models import GmailAccount
+from tests.conftest import TestingSessionLocal, create_gmail_accounts
+
+def make_single_flight(owner="api:1", renew_interval=60):
+    return SingleFlight(AccountLeases(TestingSessionLocal, owner, lease_seconds=300), renew_interval)
+
+def test_concurrent_callers_join_one_sync(db):
+    """Test that callers asking for a running account share its sync and result"""
+    account = create_gmail_accounts(db, 1)[0]
+    single_flight = make_single_flight()
+    runs = []
+
+    async def sync():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return 7
+
+    async def run():
+        return await asyncio.gather(*(single_flight.run(account.id, sync) for _ in range(3)))
+
+    assert asyncio.run(run()) == [7, 7, 7]
+    assert runs == [1]
+    assert not single_flight.in_flight(account.id)
+
+    db.expire_all()
+    assert db.get(GmailAccount, account.id).lease_owner is None
+
+def test_other_process_holding_the_lease_blocks_the_sync(db):
+    """Test that a sync leased elsewhere is reported instead of started again"""
+    account = create_gmail_accounts(db, 1)[0]
+    AccountLeases(TestingSessionLocal, "worker:1", lease_seconds=300).claim(account.id)
+    runs = []
+
+    async def sync():
+        runs.append(1)
+
+    with pytest.raises(SyncInProgress):
+        asyncio.run(make_single_flight().run(account.id, sync))
+    assert runs == []
+
+def test_lost_lease_cancels_the_sync(db):
+    """Test that a sync stops once another process has taken over its lease"""
+    account = create_gmail_accounts(db, 1)[0]
+    single_flight = make_single_flight(renew_interval=0.01)
+
+    async def sync():
+        # Simulate the lease expiring and being claimed by another worker
+        with TestingSessionLocal() as session:
+            session.get(GmailAccount, account.id).lease_owner = "worker:2"
+            session.commit()
+        await asyncio.sleep(10)
+
+    with pytest.raises(SyncInProgress):
+        asyncio.run(single_flight.run(account.id, sync))
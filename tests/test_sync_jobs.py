@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+from app.models import SyncJob
+from app.services.single_flight import SyncInProgress
+from app.services.sync_jobs import JobDeferred, SyncJobRunner, enqueue_sync_job
+from tests.conftest import TestingSessionLocal, create_gmail_accounts
+
+def make_runner(owner="worker:1", progress_interval=60, max_retries=10):
+    return SyncJobRunner(TestingSessionLocal, owner, stale_after=300, progress_interval=progress_interval,
+                         retry_base_delay=60, retry_max_delay=3600, max_retries=max_retries, busy_delay=5)
+
+def test_enqueue_returns_the_active_job(db):
+    """Test that an account has at most one queued or running job"""
+    account = create_gmail_accounts(db, 1)[0]
+
+    first = enqueue_sync_job(db, account)
+    assert enqueue_sync_job(db, account).id == first.id
+
+    first.status = "succeeded"
+    db.commit()
+    assert enqueue_sync_job(db, account).id != first.id
+
+def test_runner_reports_progress_and_result(db):
+    """Test that a claimed job reports pipeline counters while running and when done"""
+    account = create_gmail_accounts(db, 1)[0]
+    job = enqueue_sync_job(db, account)
+    runner = make_runner(progress_interval=0.01)
+    snapshots = []
+
+    async def sync(account_id, progress):
+        progress.update(listed=3, fetched=3)
+        await asyncio.sleep(0.05)
+        with TestingSessionLocal() as session:
+            snapshots.append(session.get(SyncJob, job.id).fetched)
+        progress.update(enriched=3, synced=3, archived=3)
+        return 3
+
+    claimed = runner.claim(5)
+    assert claimed == [(job.id, account.id)]
+    assert runner.claim(5) == []
+    asyncio.run(runner.run(job.id, account.id, sync))
+
+    db.expire_all()
+    job = db.get(SyncJob, job.id)
+    assert snapshots == [3]
+    assert (job.status, job.worker) == ("succeeded", "worker:1")
+    assert (job.listed, job.enriched, job.synced, job.archived, job.failed) == (3, 3, 3, 3, 0)
+    assert job.run_seconds >= 0.05
+    assert job.queued_seconds >= 0
+
+def test_runner_records_failures_and_requeues_busy_accounts(db):
+    """Test that errors fail the job while an account busy elsewhere is retried later"""
+    accounts = create_gmail_accounts(db, 2)
+    failing, busy = (enqueue_sync_job(db, account) for account in accounts)
+    runner = make_runner()
+
+    async def sync(account_id, progress):
+        if account_id == accounts[0].id:
+            raise RuntimeError("boom")
+        raise SyncInProgress("held by worker:2")
+
+    async def run():
+        for job_id, account_id in runner.claim(5):
+            await runner.run(job_id, account_id, sync)
+
+    asyncio.run(run())
+
+    db.expire_all()
+    assert (db.get(SyncJob, failing.id).status, db.get(SyncJob, failing.id).error) == ("failed", "boom")
+    assert db.get(SyncJob, busy.id).status == "queued"
+    assert runner.claim(5) == []
+    assert runner.claim(5, now=datetime.utcnow() + timedelta(seconds=6)) == [(busy.id, accounts[1].id)]
+
+def test_jobs_of_crashed_workers_are_requeued(db):
+    """Test that running jobs without a recent heartbeat are claimed again"""
+    account = create_gmail_accounts(db, 1)[0]
+    job = enqueue_sync_job(db, account)
+    now = datetime.utcnow()
+    make_runner("worker:1").claim(1, now=now)
+
+    survivor = make_runner("worker:2")
+    assert survivor.claim(1, now=now + timedelta(seconds=60)) == []
+    assert survivor.claim(1, now=now + timedelta(seconds=301)) == [(job.id, account.id)]
+
+def test_unfinished_jobs_are_requeued_with_their_progress(db):
+    """Test that a job returning False goes back to the queue and resumes its counters"""
+    account = create_gmail_accounts(db, 1)[0]
+    job = enqueue_sync_job(db, account, kind="backfill")
+    runner = make_runner()
+
+    async def backfill(account_id, progress):
+        progress["synced"] += 2
+        return progress["synced"] >= 4
+
+    assert runner.claim(5) == []  # Live sync jobs only
+    for _ in range(2):
+        claimed = runner.claim(5, kind="backfill")
+        assert claimed == [(job.id, account.id)]
+        asyncio.run(runner.run(job.id, account.id, backfill))
+        db.expire_all()
+
+    job = db.get(SyncJob, job.id)
+    assert (job.status, job.synced) == ("succeeded", 4)
+
+def test_deferred_jobs_back_off_and_eventually_fail(db):
+    """Test that a job without progress is retried after a growing delay and fails once retries run out"""
+    account = create_gmail_accounts(db, 1)[0]
+    job = enqueue_sync_job(db, account, kind="backfill")
+    runner = make_runner(max_retries=2)
+
+    async def backfill(account_id, progress):
+        raise JobDeferred("OpenAI is unavailable")
+
+    delays = []
+    for _ in range(3):
+        now = datetime.utcnow() + timedelta(days=1)
+        assert runner.claim(5, kind="backfill", now=now) == [(job.id, account.id)]
+        asyncio.run(runner.run(job.id, account.id, backfill))
+        db.expire_all()
+        job = db.get(SyncJob, job.id)
+        if job.status == "queued":
+            delays.append(job.run_after - datetime.utcnow())
+            assert runner.claim(5, kind="backfill") == []
+
+    assert [round(delay.total_seconds() / 60) for delay in delays] == [1, 2]
+    assert (job.status, job.retries, job.error) == ("failed", 3, "OpenAI is unavailable")
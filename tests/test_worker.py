@@ -0,0 +1,251 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from app import worker
+from app.models import Email, GmailAccount, SyncJob
+from app.services.pipeline import KnownMessageIds
+from app.services.rate_limit import TokenBucket
+from app.services.sync_jobs import JobDeferred, enqueue_sync_job
+from app.services.single_flight import SingleFlight
+from tests.conftest import TestingSessionLocal, create_gmail_accounts
+from tests.test_pipeline import FakeAIService, FakeGmailService
+
+class GrantingLeases:
+    """Leases that are always free; the in-memory test database is one connection shared by all threads"""
+    owner = "test:1"
+
+    def claim(self, account_id):
+        return True
+
+    def renew(self, account_ids):
+        return set(account_ids)
+
+    def release(self, account_id):
+        return True
+
+class DueLeases(GrantingLeases):
+    owner = "worker:1"
+
+    def __init__(self, account_ids):
+        self.due = list(account_ids)
+
+    def claim_due(self, limit):
+        claimed, self.due = self.due[:max(limit, 0)], self.due[max(limit, 0):]
+        return claimed
+
+class NoJobs:
+    def claim(self, limit, kind="sync"):
+        return []
+
+def test_main_bounds_concurrent_syncs_and_isolates_failures(db, monkeypatch):
+    """Test that the worker loop syncs due accounts up to the limit and failures stay isolated"""
+    accounts = create_gmail_accounts(db, 5)
+    running = 0
+    peak = 0
+    finished = []
+
+    async def fake_sync_account(session, account, progress=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        finished.append(account.email)
+        if account.email == "account1@gmail.com":
+            raise RuntimeError("boom")
+        return 1
+
+    async def idle(*args):
+        await asyncio.Event().wait()
+
+    leases = DueLeases(account.id for account in accounts)
+    monkeypatch.setattr(worker, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(worker, "sync_account", fake_sync_account)
+    monkeypatch.setattr(worker, "leases", leases)
+    monkeypatch.setattr(worker, "account_syncs", SingleFlight(leases, renew_interval=60))
+    monkeypatch.setattr(worker, "job_runner", NoJobs())
+    monkeypatch.setattr(worker.credential_manager, "run", idle)
+    monkeypatch.setattr(worker.ai_result_cache, "run", idle)
+    monkeypatch.setattr(worker.settings, "SYNC_MAX_CONCURRENT_ACCOUNTS", 2)
+    monkeypatch.setattr(worker.settings, "SYNC_POLL_SECONDS", 0.01)
+
+    async def run():
+        loop = asyncio.create_task(worker.main())
+        while len(finished) < len(accounts):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+
+    asyncio.run(run())
+
+    assert peak == 2
+    db.expire_all()
+    assert [db.get(GmailAccount, account.id).sync_failures for account in accounts] == [0, 1, 0, 0, 0]
+
+def test_leased_sync_reschedules_and_releases(db, monkeypatch):
+    """Test that a claimed sync stores its adaptive schedule and gives up the lease"""
+    accounts = create_gmail_accounts(db, 2)
+
+    async def fake_sync_account(session, account, progress=None):
+        if account.email == "account1@gmail.com":
+            raise RuntimeError("boom")
+        return 3
+
+    monkeypatch.setattr(worker, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(worker, "sync_account", fake_sync_account)
+
+    async def run():
+        for account_id in worker.leases.claim_due(2):
+            await worker.run_leased_sync(account_id)
+
+    asyncio.run(run())
+
+    db.expire_all()
+    ok, failed = (db.get(GmailAccount, account.id) for account in accounts)
+    assert ok.lease_owner is None and failed.lease_owner is None
+    assert (ok.sync_interval_seconds, ok.sync_failures) == (30, 0)
+    assert (failed.sync_interval_seconds, failed.sync_failures) == (60, 1)
+    assert failed.next_sync_at - ok.next_sync_at > timedelta(seconds=80)
+
+def test_sync_job_joining_a_running_sync_reports_its_progress(db, monkeypatch):
+    """Test that a queued job for an account already syncing here gets that sync's counters"""
+    account = create_gmail_accounts(db, 1)[0]
+    job = enqueue_sync_job(db, account)
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def fake_sync_account(session, account, progress=None):
+        progress["synced"] = progress.get("synced", 0) + 2
+        started.set()
+        await release.wait()
+        progress["synced"] += 1
+        return 3
+
+    monkeypatch.setattr(worker, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(worker, "sync_account", fake_sync_account)
+    monkeypatch.setattr(worker, "account_syncs", SingleFlight(GrantingLeases(), renew_interval=60))
+
+    async def run():
+        leased = asyncio.create_task(worker.run_leased_sync(account.id))
+        await started.wait()
+        [(job_id, account_id)] = worker.job_runner.claim(1)
+        joined = asyncio.create_task(worker.run_sync_job(job_id, account_id))
+        while not worker.sync_progress[account.id].targets:
+            await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(leased, joined)
+
+    asyncio.run(run())
+
+    db.expire_all()
+    assert (db.get(SyncJob, job.id).status, db.get(SyncJob, job.id).synced) == ("succeeded", 3)
+    assert worker.sync_progress == {}
+
+class FakeBackfillGmailService(FakeGmailService):
+    """Serves a couple of new messages for every date window searched, paging like messages.list"""
+
+    def __init__(self, per_window):
+        super().__init__()
+        self.per_window = per_window
+        self.windows = []
+        self.page_tokens = []
+        self._window_numbers = {}
+
+    def iter_unarchived_email_pages(self, since=None, before=None, page_size=None, max_messages=None, page_token=None, **kwargs):
+        self.windows.append((since, before))
+        self.page_tokens.append(page_token)
+        number = self._window_numbers.setdefault((since, before), len(self._window_numbers) + 1)
+        message_ids = [f"w{number}m{i}" for i in range(self.per_window)]
+        position = int(page_token or 0)
+        remaining = max_messages
+        while True:
+            size = page_size or self.per_window
+            if remaining is not None:
+                size = min(size, remaining)
+            messages = [{"id": message_id} for message_id in message_ids[position:position + size]]
+            position += len(messages)
+            page_token = str(position) if position < len(message_ids) else None
+            if remaining is not None:
+                remaining -= len(messages)
+            yield messages, page_token
+            if not page_token or (remaining is not None and remaining <= 0):
+                return
+
+def run_backfill(db, monkeypatch, gmail_service, days, per_run):
+    account = create_gmail_accounts(db, 1)[0]
+    now = datetime(2026, 6, 1)
+    job = enqueue_sync_job(db, account, kind="backfill", cursor=now, backfill_until=now - timedelta(days=days))
+    monkeypatch.setattr(worker, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(worker, "GmailService", lambda account, db, quota: gmail_service)
+    monkeypatch.setattr(worker, "ai_service", FakeAIService())
+    monkeypatch.setattr(worker, "known_message_ids", KnownMessageIds(100))
+    monkeypatch.setattr(worker, "backfill_ai_rate", TokenBucket(1000))
+    monkeypatch.setattr(worker.settings, "BACKFILL_WINDOW_DAYS", 7)
+    monkeypatch.setattr(worker.settings, "BACKFILL_MESSAGES_PER_RUN", per_run)
+    progress = {}
+
+    finished = asyncio.run(worker.backfill_account(job.id, account.id, progress))
+
+    db.expire_all()
+    return finished, db.get(SyncJob, job.id), progress
+
+def test_backfill_walks_back_window_by_window(db, monkeypatch):
+    """Test that a backfill imports every window, newest first, down to its start date"""
+    gmail_service = FakeBackfillGmailService(per_window=2)
+
+    finished, job, progress = run_backfill(db, monkeypatch, gmail_service, days=20, per_run=100)
+
+    assert finished
+    assert [(before - since).days for since, before in gmail_service.windows] == [7, 7, 6]
+    assert gmail_service.windows[0][1] == datetime(2026, 6, 1)
+    assert gmail_service.windows[1][1] == gmail_service.windows[0][0]
+    assert job.cursor == job.backfill_until
+    assert progress["synced"] == 6
+    assert db.query(Email).count() == 6
+
+def test_backfill_yields_after_its_message_budget(db, monkeypatch):
+    """Test that a backfill run stops at its budget and resumes the cut-off window from its page token"""
+    gmail_service = FakeBackfillGmailService(per_window=2)
+
+    finished, job, progress = run_backfill(db, monkeypatch, gmail_service, days=30, per_run=3)
+
+    assert not finished
+    assert len(gmail_service.windows) == 2
+    # The second window was only partly imported
+    assert job.cursor == datetime(2026, 6, 1) - timedelta(days=7)
+    assert job.page_token == "1"
+    assert progress["listed"] == 3
+
+    finished = asyncio.run(worker.backfill_account(job.id, job.gmail_account_id, progress))
+
+    db.expire_all()
+    job = db.get(SyncJob, job.id)
+    assert not finished
+    assert gmail_service.windows[2] == gmail_service.windows[1]
+    assert gmail_service.page_tokens[2] == "1"
+    assert job.cursor == datetime(2026, 6, 1) - timedelta(days=21)
+    assert {email.gmail_id for email in db.query(Email).all()} == {"w1m0", "w1m1", "w2m0", "w2m1", "w3m0", "w3m1"}
+
+def test_backfill_yields_when_out_of_time(db, monkeypatch):
+    """Test that a run past its time limit stops after the current page and keeps the window's page token"""
+    monkeypatch.setattr(worker.settings, "BACKFILL_MAX_RUN_SECONDS", 0)
+    monkeypatch.setattr(worker.settings, "BACKFILL_LIST_PAGE_SIZE", 1)
+    gmail_service = FakeBackfillGmailService(per_window=2)
+
+    finished, job, progress = run_backfill(db, monkeypatch, gmail_service, days=30, per_run=100)
+
+    assert not finished
+    assert (job.cursor, job.page_token) == (datetime(2026, 6, 1), "1")
+    assert progress["synced"] == 1
+
+def test_backfill_defers_windows_that_keep_failing(db, monkeypatch):
+    """Test that a run importing nothing defers the job and keeps its cursor"""
+    gmail_service = FakeBackfillGmailService(per_window=2)
+    gmail_service.missing = {"w1m0", "w1m1"}
+
+    with pytest.raises(JobDeferred):
+        run_backfill(db, monkeypatch, gmail_service, days=30, per_run=10)
+
+    db.expire_all()
+    job = db.query(SyncJob).one()
+    assert job.cursor == datetime(2026, 6, 1)